@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+非阻塞执行器层 - 启动定时继电器脉冲后立即返回句柄，可以单独等待或全部等待
+"""
+
+import threading
+import logging
+
+from clock import RealClock
+from tracer import EV_ACTUATOR_ON, EV_ACTUATOR_OFF, EV_ACTUATOR_CANCEL
+
+logger = logging.getLogger(__name__)
+
+
+class StopRequested(RuntimeError):
+    """已请求停止: 继电器已全部断开，之后不再启动新的动作"""
+
+
+class PulseHandle:
+    """一次定时继电器脉冲的句柄"""
+
+    def __init__(self, name, cylinder, on_pin, duration, clock):
+        self.clock = clock
+        self.name = name  # 动作名称，如 upper_radial_extend
+        self.cylinder = cylinder  # 所属伸缩杆，同一伸缩杆同一时间只能有一个脉冲
+        self.on_pin = on_pin
+        self.duration = duration  # 请求的通电时间（秒）
+        self.start_time = None  # 继电器实际通电时刻 (clock.monotonic)
+        self.end_time = None  # 继电器实际断电时刻
+        self.cancelled = False
+        self._timer = None
+        self._done = threading.Event()
+
+    def join(self, timeout=None):
+        """
+        等待脉冲结束
+        :param timeout: 最长等待时间（秒），None 表示一直等待
+        :return: 脉冲是否已结束
+        """
+        return self.clock.wait(self._done, timeout)
+
+    def done(self):
+        """脉冲是否已结束"""
+        return self._done.is_set()
+
+    def elapsed(self):
+        """实际通电时间（秒），脉冲未结束时返回 None"""
+        if self.end_time is None:
+            return None
+        return self.end_time - self.start_time
+
+
+class ActuatorEngine:
+    def __init__(self, gpio, clock=None, tracer=None, on_finish=None):
+        """
+        初始化执行器引擎
+        :param gpio: 提供 output/HIGH/LOW 的 GPIO 接口
+        :param clock: 定时使用的时钟，默认系统时钟
+        :param tracer: EventTracer，记录继电器通断事件，None 表示不记录
+        :param on_finish: 脉冲断电后、唤醒等待者之前调用 on_finish(handle)（如更新行程推算），在定时器线程中调用
+        """
+        self.gpio = gpio
+        self.clock = clock or RealClock()
+        self.tracer = tracer
+        self.on_finish = on_finish
+        self._lock = threading.Lock()
+        self._active = {}  # 伸缩杆 -> 正在执行的 PulseHandle
+        self.halted = False  # 已请求停止，拒绝启动新的脉冲
+
+    def start(self, name, cylinder, on_pin, off_pin, duration):
+        """
+        启动一个定时继电器脉冲，立即返回
+        :param name: 动作名称
+        :param cylinder: 伸缩杆名称
+        :param on_pin: 需要通电的继电器引脚
+        :param off_pin: 通电前需要确保断开的对向继电器引脚，没有则为 None
+        :param duration: 通电时间（秒），不大于 0 时不通电，直接返回已结束的句柄
+        :return: PulseHandle
+        """
+        return self.start_group([(name, cylinder, on_pin, off_pin, duration)])[0]
+
+    def start_group(self, commands):
+        """
+        同时启动多个定时继电器脉冲，立即返回
+        所有继电器在一次批量写入中通电；通电时间相同的脉冲共用一个定时器，到时也在一次写入中断电
+        :param commands: [(动作名称, 伸缩杆, 通电引脚, 对向引脚, 通电时间)]，含义同 start
+        :return: PulseHandle 列表，与 commands 顺序一致
+        """
+        handles = [PulseHandle(name, cylinder, on_pin, duration, self.clock)
+                   for name, cylinder, on_pin, _, duration in commands]
+        started = [handle for handle in handles if handle.duration > 0]
+
+        with self._lock:
+            if self.halted:
+                raise StopRequested(f"已请求停止，不能启动 {', '.join(name for name, *_ in commands)}")
+            cylinders = set()
+            for handle in started:
+                active = self._active.get(handle.cylinder)
+                if active is None and handle.cylinder in cylinders:
+                    active = next(h for h in started if h.cylinder == handle.cylinder)
+                if active is not None:
+                    raise RuntimeError(f"{handle.cylinder} 正在执行 {active.name}，不能同时执行 {handle.name}")
+                cylinders.add(handle.cylinder)
+
+            # 确保对向继电器断开，再激活本方向继电器；列表按顺序写入
+            pins = []
+            levels = []
+            for handle, (_, _, on_pin, off_pin, _) in zip(handles, commands):
+                if handle.duration <= 0:
+                    continue
+                if off_pin is not None:
+                    pins.append(off_pin)
+                    levels.append(self.gpio.LOW)
+                pins.append(on_pin)
+                levels.append(self.gpio.HIGH)
+            if pins:
+                self.gpio.output(pins, levels)
+
+            now = self.clock.monotonic()
+            groups = {}  # 通电时间 -> 同时到时的句柄
+            for handle in started:
+                self._active[handle.cylinder] = handle
+                handle.start_time = now
+                groups.setdefault(handle.duration, []).append(handle)
+                if self.tracer is not None:
+                    self.tracer.record(EV_ACTUATOR_ON, handle.on_pin, handle.duration)
+            for duration, group in groups.items():
+                timer = self.clock.call_later(duration, self._finish_group, group)
+                if len(group) == 1:
+                    # 共用的定时器不随单个脉冲取消，其余脉冲仍要按时断电
+                    group[0]._timer = timer
+
+        # 不需要通电（如伸缩杆已在行程端点）的直接返回已结束的句柄
+        for handle in handles:
+            if handle.duration <= 0:
+                handle.start_time = handle.end_time = self.clock.monotonic()
+                handle._done.set()
+        return handles
+
+    def _finish_group(self, group):
+        """同时到时的一组脉冲一次写入全部断电"""
+        with self._lock:
+            pending = [handle for handle in group if not handle.done()]
+            if len(pending) > 1:
+                self.gpio.output([handle.on_pin for handle in pending], self.gpio.LOW)
+        for handle in pending:
+            self._finish(handle)
+
+    def _finish(self, handle):
+        """定时结束或被取消时断电"""
+        with self._lock:
+            if handle.done():
+                return
+            self.gpio.output(handle.on_pin, self.gpio.LOW)
+            handle.end_time = self.clock.monotonic()
+            if self._active.get(handle.cylinder) is handle:
+                del self._active[handle.cylinder]
+            # 在唤醒等待者之前更新，join() 返回后即可看到本次通电的结果
+            if self.on_finish is not None:
+                self.on_finish(handle)
+            handle._done.set()
+            if self.tracer is not None:
+                event = EV_ACTUATOR_CANCEL if handle.cancelled else EV_ACTUATOR_OFF
+                self.tracer.record(event, handle.on_pin, handle.end_time - handle.start_time)
+
+    def cancel(self, handle):
+        """提前结束一个脉冲并立即断电"""
+        if handle._timer is not None:
+            handle._timer.cancel()
+        handle.cancelled = not handle.done()
+        self._finish(handle)
+
+    def cancel_all(self):
+        """取消所有正在执行的脉冲"""
+        with self._lock:
+            handles = list(self._active.values())
+            if handles:
+                # 先一次写入断开全部继电器，再逐个结束句柄
+                self.gpio.output([handle.on_pin for handle in handles], self.gpio.LOW)
+        for handle in handles:
+            self.cancel(handle)
+        return handles
+
+    def halt(self):
+        """停止: 取消所有脉冲，之后启动新脉冲会抛出 StopRequested，直到调用 resume()"""
+        with self._lock:
+            self.halted = True
+        return self.cancel_all()
+
+    def resume(self):
+        """解除停止状态"""
+        with self._lock:
+            self.halted = False
+
+    def busy(self, cylinder):
+        """指定伸缩杆是否正在执行脉冲"""
+        return cylinder in self._active
+
+
+def wait_all(handles, timeout=None, clock=None):
+    """
+    等待一组脉冲全部结束
+    :param handles: PulseHandle 列表
+    :param timeout: 总的最长等待时间（秒），None 表示一直等待
+    :param clock: 计算超时使用的时钟，默认系统时钟
+    :return: 是否全部结束
+    """
+    clock = clock or RealClock()
+    deadline = None if timeout is None else clock.monotonic() + timeout
+    for handle in handles:
+        remaining = None if deadline is None else max(deadline - clock.monotonic(), 0)
+        if not handle.join(remaining):
+            return False
+    return True
+
+
+class ScheduledAction:
+    """依赖图中的一个执行器动作"""
+
+    def __init__(self, name, action, duration, after=()):
+        """
+        :param name: 节点名称（在同一个依赖图中唯一）
+        :param action: 执行器动作名称，如 upper_radial_extend
+        :param duration: 通电时间（秒）
+        :param after: 依赖列表 [(节点名称, 偏移)]，偏移为 None 表示等依赖节点结束，
+                      为数值表示依赖节点开始后经过该秒数即可启动
+        """
+        self.name = name
+        self.action = action
+        self.duration = duration
+        self.after = list(after)
+
+
+def _ready_time(step, handles):
+    """根据已启动的依赖计算节点最早可启动时刻，依赖尚未启动时返回 None"""
+    ready = 0.0
+    for dep, offset in step.after:
+        handle = handles.get(dep)
+        if handle is None:
+            return None
+        if offset is None:
+            ready = max(ready, handle.end_time if handle.done() else handle.start_time + handle.duration)
+        else:
+            ready = max(ready, handle.start_time + offset)
+    return ready
+
+
+def run_schedule(start_fn, steps, clock=None, stop_event=None):
+    """
+    按依赖图执行一组执行器动作，没有依赖关系的动作同时执行
+    :param start_fn: 启动函数 start_fn(action, duration) -> PulseHandle
+    :param steps: ScheduledAction 列表
+    :param clock: 等待使用的时钟，默认系统时钟
+    :param stop_event: 停止事件（threading.Event），等待下一个动作时被它打断并抛出 StopRequested
+    :return: 实际执行时间表 [(节点名称, 开始秒数, 结束秒数)]，以第一个动作开始为零点
+    """
+    clock = clock or RealClock()
+    names = {step.name for step in steps}
+    for step in steps:
+        for dep, _ in step.after:
+            if dep not in names:
+                raise ValueError(f"{step.name} 依赖的节点 {dep} 不存在")
+
+    handles = {}
+    pending = list(steps)
+    t0 = clock.monotonic()
+
+    while pending:
+        if stop_event is not None and stop_event.is_set():
+            raise StopRequested(f"已请求停止，未启动: {[step.name for step in pending]}")
+        now = clock.monotonic()
+        next_ready = None
+        blocking = None
+
+        for step in list(pending):
+            ready = _ready_time(step, handles)
+            if ready is None:
+                continue
+            waiting_for = [handles[dep] for dep, offset in step.after if offset is None and not handles[dep].done()]
+            if ready <= now and not waiting_for:
+                handles[step.name] = start_fn(step.action, step.duration)
+                pending.remove(step)
+                continue
+            if ready <= now:
+                blocking = waiting_for[0]
+            elif next_ready is None or ready < next_ready:
+                next_ready = ready
+
+        if not pending:
+            break
+        if blocking is not None:
+            # 依赖的脉冲已到计划结束时间，等待其定时器实际断电
+            blocking.join()
+        elif next_ready is not None:
+            if stop_event is None:
+                clock.sleep(next_ready - now)
+            else:
+                clock.wait(stop_event, max(next_ready - now, 0))
+        elif not any(not handle.done() for handle in handles.values()):
+            raise ValueError(f"依赖图存在环，无法启动: {[step.name for step in pending]}")
+        else:
+            # 剩余节点依赖的节点尚未启动，等待任一执行中的脉冲结束
+            next(handle for handle in handles.values() if not handle.done()).join()
+
+    wait_all(list(handles.values()), clock=clock)
+    if stop_event is not None and stop_event.is_set():
+        raise StopRequested("已请求停止，动作被提前断电")
+
+    schedule = [(step.name, handles[step.name].start_time - t0, handles[step.name].end_time - t0) for step in steps]
+    return schedule
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+攀爬机器人asyncio前端 - 执行器、舵机和测距都可以 await 和取消，沿用 ClimbingRobot 的引脚和时间参数
+"""
+
+import time
+import asyncio
+import logging
+import threading
+
+from robot import ClimbingRobot, NoEcho
+from gait import build_step_plan
+
+logger = logging.getLogger(__name__)
+
+
+def _resolve(future, result):
+    """在事件循环中完成 Future；等待的任务已被取消时忽略"""
+    if not future.done():
+        future.set_result(result)
+
+
+class AsyncClimbingRobot:
+    def __init__(self, robot=None):
+        """
+        初始化asyncio前端
+        :param robot: 已有的 ClimbingRobot 实例，默认新建一个
+        """
+        self.robot = robot or ClimbingRobot()
+        if self.robot.clock.virtual:
+            # 脉冲和等待由事件循环计时，虚拟时钟不会随之推进
+            raise ValueError("asyncio前端使用事件循环时间，不支持虚拟时钟")
+        self.gpio = self.robot.gpio
+        self._ranging_lock = asyncio.Lock()
+
+        # 脉冲结束时由引擎的 on_finish 在定时器线程中唤醒等待的 Future，不为每个脉冲占用线程
+        engine = self.robot.actuator_engine
+        self._on_finish = engine.on_finish
+        engine.on_finish = self._pulse_finished
+        self._waiters = {}  # PulseHandle -> 等待它结束的 Future
+        self._waiters_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # 引脚定义和时间参数直接使用 ClimbingRobot 上的值
+        return getattr(self.robot, name)
+
+    async def actuate(self, name, duration):
+        """
+        执行一个定时继电器脉冲
+        与同步接口一样由 ClimbingRobot 的执行器引擎通断继电器，事件记录、行程推算和停止请求都相同；
+        任务被取消时也会在 finally 中立即断电
+        :param name: 执行器动作名称，见 ClimbingRobot.actuators
+        :param duration: 通电时间（秒），按行程推算裁剪，伸缩杆已在端点时不通电
+        :return: 实际通电时间（秒）
+        """
+        handle = self.robot.start_actuator(name, duration)
+        self.robot.heartbeat(duration)
+        finished = asyncio.get_running_loop().create_future()
+        with self._waiters_lock:
+            # 引擎先写 end_time 再调用 on_finish；已写入说明脉冲已经结束（或根本没有通电）
+            if handle.end_time is None:
+                self._waiters[handle] = finished
+        try:
+            if handle in self._waiters:
+                await finished
+        finally:
+            if not handle.done():
+                self.robot.actuator_engine.cancel(handle)
+            with self._waiters_lock:
+                self._waiters.pop(handle, None)
+        self.robot.check_stop()
+        return handle.elapsed()
+
+    def _pulse_finished(self, handle):
+        """执行器引擎在脉冲断电后调用（定时器线程，持有引擎锁）: 先更新行程推算和指标，再唤醒等待者"""
+        if self._on_finish is not None:
+            self._on_finish(handle)
+        with self._waiters_lock:
+            finished = self._waiters.pop(handle, None)
+        if finished is not None:
+            finished.get_loop().call_soon_threadsafe(_resolve, finished, handle)
+
+    async def actuate_parallel(self, commands):
+        """
+        同时执行多个互不相关的执行器
+        :param commands: [(动作名称, 通电时间), ...]
+        """
+        return await asyncio.gather(*(self.actuate(name, duration) for name, duration in commands))
+
+    async def rotate_servo(self, side, degrees):
+        """
+        转动舵机并等待转到位
+        :param side: 'upper' 或 'lower'
+        :param degrees: 角度，正数为顺时针（杆向前），负数为逆时针（杆向后）
+        """
+        self.robot.set_servo_angle(side, degrees)
+        self.robot.heartbeat(self.robot.servo_rotation_time)
+        await asyncio.sleep(self.robot.servo_rotation_time)
+
+    async def reset_servos(self):
+        """重置舵机到中性位置"""
+        logger.info("重置舵机到中性位置")
+        self.robot.set_servo_angle('upper', 0)
+        self.robot.set_servo_angle('lower', 0)
+        self.robot.heartbeat(self.robot.servo_rotation_time)
+        await asyncio.sleep(self.robot.servo_rotation_time)
+
+    async def _measure_echo(self):
+        """
+        边沿中断方式测量一次回声脉宽，回调线程通过 call_soon_threadsafe 唤醒事件循环
+        返回: (脉宽秒数, None) 或 (None, 失败原因)
+        """
+        loop = asyncio.get_running_loop()
+        echo = loop.create_future()
+
+        def on_echo():
+            loop.call_soon_threadsafe(lambda: echo.done() or echo.set_result(None))
+
+        self.robot.echo_listener = on_echo
+        try:
+            self.robot._start_echo()
+            await asyncio.wait_for(echo, self.robot.ultrasonic_timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.robot.echo_listener = None
+        return self.robot._echo_result()
+
+    async def get_current_height(self):
+        """
+        超声波测距，等待回声时不阻塞事件循环
+        返回: 当前检测距离 (cm)，测距失败时返回 NoEcho
+        """
+        if self.robot.ultrasonic_mode != 'edge':
+            # 没有边沿中断时只能在线程池中轮询
+            return await asyncio.get_running_loop().run_in_executor(None, self.robot.get_current_height)
+
+        async with self._ranging_lock:
+            started = self.robot.clock.monotonic_ns()
+            reason = None
+            for attempt in range(1, self.robot.ultrasonic_retries + 1):
+                # 同步接口（如后台采样线程）正在使用传感器时等待下一次
+                if self.robot._ranging_lock.acquire(blocking=False):
+                    try:
+                        pulse_duration, reason = await self._measure_echo()
+                    finally:
+                        self.robot._ranging_lock.release()
+                    if pulse_duration is not None:
+                        distance, reason = self.robot._pulse_to_distance(pulse_duration)
+                        if distance is not None:
+                            return self.robot._record_height(distance, started)
+                else:
+                    reason = "传感器被占用"
+
+                if attempt < self.robot.ultrasonic_retries:
+                    await asyncio.sleep(self.robot.ultrasonic_retry_interval)
+
+            logger.warning(f"超声波测距失败 ({self.robot.ultrasonic_retries}次尝试): {reason}")
+            return self.robot._record_height(NoEcho(reason, self.robot.ultrasonic_retries), started)
+
+    async def run_step(self, side, direction, movement_time, offsets=None):
+        """
+        按 gait 的阶段偏移表执行一步攀爬，各阶段作为独立任务按计划时间启动
+        :return: 实际阶段时间 [(阶段名, 开始秒数, 结束秒数)]
+        """
+        plan = build_step_plan(self.robot, side, direction, movement_time, offsets)
+        t0 = time.monotonic()
+        previous = {}  # 伸缩杆 -> 前一个同杆任务
+
+        async def run_phase(name, kind, arg, start, length, after):
+            await asyncio.sleep(max(t0 + start - time.monotonic(), 0))
+            if after is not None:
+                await after
+            begin = time.monotonic() - t0
+            if kind == 'actuator':
+                await self.actuate(arg, length)
+            else:
+                await self.rotate_servo(side, arg)
+            return name, begin, time.monotonic() - t0
+
+        tasks = []
+        for name, kind, arg, start, length in plan.phases:
+            cylinder = self.robot.actuators[arg][0] if kind == 'actuator' else None
+            task = asyncio.ensure_future(run_phase(name, kind, arg, start, length, previous.get(cylinder)))
+            if cylinder is not None:
+                previous[cylinder] = task
+            tasks.append(task)
+
+        try:
+            return list(await asyncio.gather(*tasks))
+        except BaseException:
+            # 取消或出错时结束所有阶段，各阶段在 finally 中断电
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def final_extend(self, profile=None):
+        """
+        最终松开操作 - 按 ClimbingRobot.final_release_plan 的依赖图并发执行
+        :return: 实际执行时间表 [(节点名称, 开始秒数, 结束秒数)]
+        """
+        profile = profile or self.robot.final_release_profile
+        logger.info(f"=== 开始最终松开操作 ({profile}) ===")
+        steps = self.robot.final_release_plan(profile)
+        # 时间表不会长于各动作依次执行
+        self.robot.heartbeat(sum(step.duration for step in steps))
+        t0 = time.monotonic()
+        started = {step.name: asyncio.Event() for step in steps}
+        start_times = {}
+        tasks = {}
+
+        async def run_node(step):
+            for dep, offset in step.after:
+                if offset is None:
+                    await tasks[dep]
+                else:
+                    await started[dep].wait()
+                    await asyncio.sleep(max(t0 + start_times[dep] + offset - time.monotonic(), 0))
+            start_times[step.name] = time.monotonic() - t0
+            started[step.name].set()
+            await self.actuate(step.action, step.duration)
+            return step.name, start_times[step.name], time.monotonic() - t0
+
+        for step in steps:
+            tasks[step.name] = asyncio.ensure_future(run_node(step))
+        try:
+            schedule = list(await asyncio.gather(*tasks.values()))
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+            raise
+
+        for name, start, end in schedule:
+            logger.info(f"  {name}: {start:.2f}s -> {end:.2f}s")
+        logger.info(f"最终松开操作完成，总用时 {max(end for _, _, end in schedule):.2f}秒")
+        return schedule
+
+    def stop_all(self, reason="操作者停止"):
+        """
+        立即断开所有执行器继电器（同步调用，可在信号处理中使用），一次写入
+        同时停止执行器引擎: 正在等待的脉冲立即结束，之后 actuate 抛出 StopRequested
+        :param reason: 停止原因
+        """
+        self.robot.request_stop(reason)
+
+    async def power_off(self):
+        """关闭电源并清理资源（取消脉冲、舵机复位和GPIO清理由 ClimbingRobot.power_off 完成）"""
+        self.robot.power_off()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+上升攀爬控制 (asyncio版本) - 控制、测距监测和操作员停止共用一个事件循环
+"""
+
+from async_robot import AsyncClimbingRobot
+from robot import NoEcho
+from height_sampler import HeightSampler
+from rate_estimator import StrokeRateEstimator
+from step_planner import plan_step_times
+from simple_pid import PID
+import time
+import signal
+import asyncio
+import logging
+import argparse
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+class AsyncUpClimbController:
+    def __init__(self, target_height=100, robot=None, planner='model', watchdog_ms=2000):
+        """
+        初始化上升攀爬控制器
+        :param target_height: 目标高度 (cm)
+        :param robot: AsyncClimbingRobot 实例，默认新建一个
+        :param planner: 每步移动时间的计算方式，'model' 按速度模型规划，'pid' 使用PID控制器
+        :param watchdog_ms: 看门狗心跳超时（毫秒），任务期间由测距监测任务发送心跳，0 表示不启用
+        """
+        if planner not in ('model', 'pid'):
+            raise ValueError(f"未知的规划方式: {planner}")
+        self.robot = robot or AsyncClimbingRobot()
+        self.target_height = target_height
+        self.planner = planner
+        self.watchdog_ms = watchdog_ms
+
+        # PID控制器参数
+        self.height_pid = PID(Kp=0.02, Ki=0.001, Kd=0.01, setpoint=target_height)
+        self.movement_time_limits = (0.5, 3.0)  # 限制时间范围 0.5-3.0秒
+        self.height_pid.output_limits = self.movement_time_limits
+
+        # 攀爬参数
+        self.max_steps = 50  # 最大攀爬步数
+        self.step_count = 0
+        self.initial_height = 0
+        self.height_threshold = 2.0  # 高度变化阈值 (cm)
+
+        # 测距监测任务写入的滤波缓冲区（不启动其后台线程）
+        self.sampler = HeightSampler(self.robot.robot)
+        self.monitor_period = self.sampler.period
+        self.max_sample_age = 0.5  # 允许使用的最大样本年龄 (秒)
+
+        # 速度模型规划，与同步版本的逐步模式相同
+        self.vertical_speed = self.robot.vertical_speed  # 竖直杆速度估计 (cm/s)，每步按实测在线修正
+        self.dead_time = self.robot.vertical_dead_time  # 竖直杆通电后开始移动前的延迟（秒）
+        self.replan_tolerance = 3.0  # 实测高度偏离计划超过该值时重新规划 (cm)
+        self.plan = []  # 剩余的计划移动时间
+        self.expected_height = None  # 按计划预期的当前高度 (cm)
+        self.nominal_speed = self.vertical_speed
+        self.nominal_dead_time = self.dead_time
+        self.rate_estimator = StrokeRateEstimator(self.vertical_speed, self.dead_time)
+        self.max_movement_time = 6.0  # 速度下降后每步允许的最长通电时间（秒）
+
+        logger.info(f"上升攀爬控制器初始化完成，目标高度: {target_height}cm")
+
+    async def monitor_height(self):
+        """测距监测任务 - 在事件循环中按固定周期测距并写入滤波缓冲区"""
+        while True:
+            # 事件循环被阻塞时心跳中断，看门狗断开全部继电器
+            self.robot.heartbeat(self.monitor_period)
+            height = await self.robot.get_current_height()
+            if isinstance(height, NoEcho):
+                self.sampler.miss_count += 1
+            else:
+                self.sampler.push(time.monotonic(), height)
+            await asyncio.sleep(self.monitor_period)
+
+    async def get_current_position(self):
+        """获取当前位置 - 优先使用监测任务的滤波高度，过期时直接测距"""
+        age = self.sampler.age()
+        if age is not None and age <= self.max_sample_age:
+            return self.sampler.median_height()
+
+        height = await self.robot.get_current_height()
+        if isinstance(height, NoEcho):
+            raise RuntimeError(f"超声波无回声，无法获取高度: {height.reason}")
+        return height
+
+    def calculate_movement_time(self, current_height):
+        """
+        计算下一步的移动时间
+        :param current_height: 当前高度
+        :return: 计算出的移动时间
+        """
+        if self.planner == 'pid':
+            return self.pid_movement_time(current_height)
+
+        # 计划走完或实测高度偏离计划时，从当前高度重新规划
+        if not self.plan or abs(current_height - self.expected_height) > self.replan_tolerance:
+            if self.plan:
+                logger.warning(f"实测高度 {current_height:.2f}cm 偏离计划 {self.expected_height:.2f}cm")
+            self.plan = self.plan_steps(current_height) or [self.movement_time_limits[0]]
+            self.expected_height = current_height
+            logger.info(f"规划 {len(self.plan)} 步，每步移动时间 {self.plan[0]:.2f}秒")
+
+        movement_time = self.plan.pop(0)
+        self.expected_height += self.rate_estimator.displacement(movement_time)
+        return movement_time
+
+    def pid_movement_time(self, current_height):
+        """
+        使用PID控制器计算移动时间
+        :param current_height: 当前高度
+        :return: 计算出的移动时间
+        """
+        height_error = self.target_height - current_height
+        control_output = self.height_pid(current_height)
+        logger.info(f"高度误差: {height_error:.2f}cm, PID输出时间: {control_output:.2f}秒")
+
+        # PID输出按标定速度对应一段行程，按在线估计的速度折算为通电时间
+        distance = max(control_output - self.nominal_dead_time, 0.0) * self.nominal_speed
+        min_time = self.movement_time_limits[0]
+        return min(max(self.rate_estimator.time_for(distance), min_time), self.max_movement_time)
+
+    def plan_steps(self, current_height):
+        """
+        按竖直杆速度估计规划到达目标所需的剩余步骤
+        :param current_height: 当前高度
+        :return: 每步的移动时间列表
+        """
+        min_time, max_time = self.movement_time_limits
+        max_stroke = (max_time - self.nominal_dead_time) * self.nominal_speed
+        return plan_step_times(self.target_height - current_height, self.step_count, self.vertical_speed,
+                               self.dead_time, max_stroke, min_time, self.max_movement_time)
+
+    def update_rate_estimate(self, movement_time, displacement):
+        """
+        用一步的实测高度变化更新竖直杆速度估计
+        :param movement_time: 本步竖直杆通电时间（秒）
+        :param displacement: 本步实测移动距离 (cm)，沿攀爬方向为正
+        """
+        if self.rate_estimator.update(movement_time, displacement):
+            self.vertical_speed = self.rate_estimator.rate
+            self.dead_time = self.rate_estimator.dead_time
+            logger.info(f"竖直杆速度估计: {self.vertical_speed:.2f}cm/s")
+
+    async def climb_one_step(self, movement_time):
+        """
+        执行一步攀爬动作
+        :param movement_time: 计算出的移动时间
+        :return: 竖直杆实际通电时间（秒）
+        """
+        logger.info(f"=== 开始第 {self.step_count + 1} 步攀爬 ===")
+
+        # 偶数步使用上方杆，奇数步使用下方杆
+        side = 'upper' if self.step_count % 2 == 0 else 'lower'
+        timings = await self.robot.run_step(side, 'up', movement_time)
+
+        self.step_count += 1
+        logger.info(f"第 {self.step_count} 步攀爬完成，用时 {max(end for _, _, end in timings):.2f}秒")
+        return next(end - start for name, start, end in timings if name == 'vertical')
+
+    async def climb(self):
+        """攀爬主循环"""
+        self.initial_height = await self.get_current_position()
+        logger.info(f"初始位置: {self.initial_height:.2f}cm")
+
+        previous_height = self.initial_height
+        while self.step_count < self.max_steps:
+            current_height = await self.get_current_position()
+            logger.info(f"当前位置: {current_height:.2f}cm")
+
+            if self.step_count > 0 and abs(current_height - previous_height) < self.height_threshold:
+                logger.warning("攀爬进度不足，可能遇到障碍")
+
+            movement_time = self.calculate_movement_time(current_height)
+            step_start_height = current_height
+            on_time = await self.climb_one_step(movement_time)
+
+            current_height = await self.get_current_position()
+            self.update_rate_estimate(on_time, current_height - step_start_height)
+            height_to_target = abs(self.target_height - current_height)
+            if height_to_target <= 2.0:  # 2cm容忍度
+                logger.info(f"已达到目标高度! 当前: {current_height:.2f}cm, 目标: {self.target_height}cm")
+                # 如果是偶数步完成，需要继续执行下一步（奇数步）来抬升下方杆
+                if self.step_count % 2 == 0:
+                    logger.info("偶数步完成，继续执行下一步抬升下方杆...")
+                    # PID模式使用固定时间执行这一步；规划模式按剩余距离规划这一步
+                    if self.planner == 'pid':
+                        await self.climb_one_step(3.0)
+                    else:
+                        await self.climb_one_step(self.plan_steps(current_height)[0])
+                break
+
+            # 等待稳定（期间监测任务继续测距）
+            await asyncio.sleep(1)
+            previous_height = current_height
+
+        final_height = await self.get_current_position()
+        logger.info("=== 攀爬完成 ===")
+        logger.info(f"初始高度: {self.initial_height:.2f}cm")
+        logger.info(f"最终高度: {final_height:.2f}cm")
+        logger.info(f"总攀爬距离: {final_height - self.initial_height:.2f}cm")
+        logger.info(f"总步数: {self.step_count}")
+
+    async def start_climbing(self):
+        """开始攀爬过程，SIGINT/SIGTERM 会取消攀爬任务并立即断开继电器"""
+        logger.info("=== 开始上升攀爬 (asyncio) ===")
+        loop = asyncio.get_running_loop()
+        monitor = asyncio.ensure_future(self.monitor_height())
+        climb = asyncio.ensure_future(self.climb())
+
+        def operator_stop():
+            logger.warning("收到停止信号，取消攀爬")
+            self.robot.stop_all()
+            climb.cancel()
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, operator_stop)
+
+        try:
+            # 看门狗在 power_off 中正常关闭
+            if self.watchdog_ms > 0:
+                self.robot.start_watchdog(self.watchdog_ms)
+            await climb
+
+        except asyncio.CancelledError:
+            logger.info("攀爬已取消")
+
+        except Exception as e:
+            logger.error(f"攀爬过程中出错: {e}")
+
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+            monitor.cancel()
+            await asyncio.gather(monitor, return_exceptions=True)
+
+            # 重置舵机并清理
+            await self.robot.reset_servos()
+            await self.robot.power_off()
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='上升攀爬控制程序 (asyncio)')
+    parser.add_argument('-t', '--target', type=float, default=120.0,
+                        help='目标高度 (cm)')
+    parser.add_argument('--pid', action='store_true',
+                        help='用PID计算每步移动时间（旧方法），默认按速度模型规划')
+    parser.add_argument('--watchdog-ms', type=int, default=2000,
+                        help='看门狗心跳超时（毫秒），事件循环卡住超过该时间时由独立进程断开全部继电器，0 表示不启用')
+    args = parser.parse_args()
+
+    print("上升攀爬控制程序 (asyncio)")
+
+    controller = AsyncUpClimbController(target_height=args.target, planner='pid' if args.pid else 'model',
+                                        watchdog_ms=args.watchdog_ms)
+    asyncio.run(controller.start_climbing())
+
+if __name__ == "__main__":
+    main()
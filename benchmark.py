@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+攀爬性能基准测试 - 在仿真后端上端到端运行上升/下降控制器
+对每种柱子直径、攀爬方向和目标高度统计到达时间、步数、每步距离、每分钟距离、各阶段耗时和超调量，
+到达时间从该直径的初始收缩开始计时；结果写入JSON文件，便于比较不同版本
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+
+from robot import ClimbingRobot
+from sim_backend import SimulatedGPIO
+from clock import create_clock
+from gait import STEP_PHASES, StepExecutor
+from up import UpClimbController
+from down import DownClimbController
+
+logger = logging.getLogger(__name__)
+
+DIAMETERS = (30, 60)
+UP_TARGETS = (80.0, 120.0, 200.0)  # 上升目标高度 (cm)，从 --up-start 出发
+DOWN_TARGETS = (150.0, 100.0, 60.0)  # 下降目标高度 (cm)，从 --down-start 出发
+TARGET_TOLERANCE = 2.0  # 与控制器相同的到达容忍度 (cm)
+
+
+class RecordingStepExecutor(StepExecutor):
+    """记录每一步的阶段时间、结束时刻和仿真真实高度"""
+
+    def __init__(self, robot, offsets=None):
+        super().__init__(robot, offsets)
+        self.steps = []  # [(结束时刻, 真实高度, 阶段时间)]
+
+    def run(self, side, direction, movement_time, radial_time=None, displacement=None, start_height=None,
+            rate=None):
+        timings = super().run(side, direction, movement_time, radial_time, displacement, start_height, rate)
+        self.steps.append((self.robot.clock.monotonic(), self.robot.gpio.height, timings))
+        return timings
+
+
+def phase_breakdown(steps):
+    """
+    汇总各阶段耗时
+    :param steps: RecordingStepExecutor.steps
+    :return: {阶段名: 累计秒数}，另含 'step_total' 为各步总时长之和
+    """
+    totals = {name: 0.0 for name in STEP_PHASES}
+    step_total = 0.0
+    for _, _, timings in steps:
+        for name, start, end in timings:
+            totals[name] += end - start
+        step_total += max(end for _, _, end in timings)
+    totals['step_total'] = step_total
+    return totals
+
+
+def mount_on_pole(robot, gpio, diameter):
+    """
+    仿真机器人刚装上柱子时的状态: 径向杆张开，60cm 柱子的水平杆也张开，张开的行程正好由该直径的初始收缩收回
+    :param robot: ClimbingRobot，读取各直径的收缩时间
+    :param gpio: SimulatedGPIO
+    :param diameter: 柱子直径 30 或 60
+    """
+    radial = robot.radial_retract_time_30cm if diameter == 30 else robot.radial_retract_time_60cm
+    opened = {'upper_radial': radial, 'lower_radial': radial}
+    if diameter == 60:
+        opened['upper_horizontal'] = opened['lower_horizontal'] = robot.horizontal_retract_time_60cm
+    for cylinder, on_time in opened.items():
+        simulated = gpio.cylinders[cylinder]
+        simulated.position = min(on_time / simulated.stroke_time, 1.0)
+
+
+def run_case(direction, diameter, start_height, target, continuous=False, clock_name='virtual', seed=0,
+             calibration_file='', pressure_decay=0.0, planner='model', closed_loop=True):
+    """
+    运行一次完整任务
+    :param direction: 'up' 或 'down'
+    :param diameter: 柱子直径 30 或 60，决定装上柱子时的张开状态和初始收缩方式，收缩时间计入到达时间
+    :param start_height: 仿真初始高度 (cm)
+    :param target: 目标高度 (cm)
+    :param continuous: 是否使用连续攀爬模式
+    :param clock_name: 'virtual' 或 'real'
+    :param seed: 仿真随机数种子
+    :param calibration_file: 标定文件，默认不加载，保证不同版本的结果可比
+    :param pressure_decay: 仿真气源压力下降速率（见 SimulatedGPIO）
+    :param planner: 逐步模式的移动时间计算方式 'model' 或 'pid'
+    :param closed_loop: 最后一步竖直杆是否按实测高度闭环断电
+    :return: 结果字典
+    """
+    gpio = SimulatedGPIO(initial_height=start_height, pressure_decay=pressure_decay, seed=seed)
+    robot = ClimbingRobot(gpio=gpio, clock=create_clock(clock_name), calibration_file=calibration_file,
+                          state_file='', state_block='')
+    clock = robot.clock
+    mount_on_pole(robot, gpio, diameter)
+    # 仿真伸缩杆的初始位置已知，相当于读取了上次任务保存的行程状态
+    for cylinder, simulated in gpio.cylinders.items():
+        robot.stroke_tracker.set_position(cylinder, simulated.position)
+
+    wall_start = time.monotonic()
+    t0 = clock.monotonic()
+    # 初始收缩抓紧柱子之前由操作者扶住机器人，不计下滑
+    slip_speed, gpio.slip_speed = gpio.slip_speed, 0.0
+    if diameter == 30:
+        robot.initial_retraction_30cm()
+    else:
+        robot.initial_retraction_60cm()
+    gpio.slip_speed, gpio.slip_time = slip_speed, 0.0
+    retraction_time = clock.monotonic() - t0
+
+    if direction == 'up':
+        controller = UpClimbController(target_height=target, robot=robot, planner=planner)
+        mission = controller.start_climbing_continuous if continuous else controller.start_climbing
+    else:
+        controller = DownClimbController(target_height=target, robot=robot, planner=planner)
+        mission = controller.start_climbing_down_continuous if continuous else controller.start_climbing_down
+    controller.closed_loop = closed_loop
+    executor = RecordingStepExecutor(robot, controller.step_executor.offsets)
+    controller.step_executor = executor
+
+    mission()
+    total_time = clock.monotonic() - t0
+    wall_time = time.monotonic() - wall_start
+
+    # 到达时间从初始收缩开始、以最后一步结束为准；总时间另含收尾的舵机复位、最终释放和断电
+    steps = executor.steps
+    time_to_target = steps[-1][0] - t0 if steps else 0.0
+    final_height = steps[-1][1] if steps else start_height
+    distance = abs(final_height - start_height)
+    if direction == 'up':
+        overshoot = max(final_height - target, 0.0)
+    else:
+        overshoot = max(target - final_height, 0.0)
+    stats = gpio.stats()
+
+    return {
+        'direction': direction,
+        'diameter': diameter,
+        'mode': 'continuous' if continuous else 'stepwise',
+        'start_height': start_height,
+        'target_height': target,
+        'final_height': round(final_height, 3),
+        'reached': abs(final_height - target) <= TARGET_TOLERANCE,
+        'steps': controller.step_count,
+        'retraction_time': round(retraction_time, 3),
+        'time_to_target': round(time_to_target, 3),
+        'total_time': round(total_time, 3),
+        'cm_per_step': round(distance / controller.step_count, 3) if controller.step_count else 0.0,
+        'cm_per_minute': round(distance / time_to_target * 60, 3) if time_to_target > 0 else 0.0,
+        'overshoot': round(overshoot, 3),
+        'phase_time': {name: round(value, 3) for name, value in phase_breakdown(steps).items()},
+        'slip_time': round(stats['slip_time'], 3),
+        'stall_time': round(stats['stall_time'], 3),
+        'pings': stats['pings'],
+        'final_vertical_speed': round(stats['vertical_speed'], 3),
+        'trimmed_relay_time': round(robot.trimmed_time, 3),
+        'wall_time': round(wall_time, 3),
+    }
+
+
+def git_revision():
+    """当前代码版本，非git仓库时返回 None"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def case_key(result):
+    return (result['direction'], result['diameter'], result['mode'], result['target_height'])
+
+
+def print_results(results):
+    """打印结果表"""
+    print(f"{'方向':<5}{'直径':>5}{'模式':>12}{'目标':>8}{'最终':>9}{'步数':>6}{'收缩(s)':>9}{'到达(s)':>10}"
+          f"{'cm/步':>8}{'cm/min':>9}{'超调':>7}")
+    for r in results:
+        print(f"{r['direction']:<5}{r['diameter']:>5}{r['mode']:>12}{r['target_height']:>8.1f}"
+              f"{r['final_height']:>9.2f}{r['steps']:>6}{r['retraction_time']:>9.2f}{r['time_to_target']:>10.2f}"
+              f"{r['cm_per_step']:>8.2f}{r['cm_per_minute']:>9.2f}{r['overshoot']:>7.2f}"
+              f"{'' if r['reached'] else '  未到达'}")
+
+
+def print_comparison(results, baseline):
+    """与基线结果逐项比较到达时间和每分钟距离"""
+    previous = {case_key(r): r for r in baseline['results']}
+    print(f"\n与基线 {baseline.get('revision')} 比较:")
+    for r in results:
+        old = previous.get(case_key(r))
+        if old is None:
+            continue
+        dt = r['time_to_target'] - old['time_to_target']
+        dv = r['cm_per_minute'] - old['cm_per_minute']
+        print(f"{r['direction']:<5}{r['diameter']:>5}{r['mode']:>12}{r['target_height']:>8.1f}  "
+              f"到达时间 {old['time_to_target']:.2f} -> {r['time_to_target']:.2f}s ({dt:+.2f})  "
+              f"速度 {old['cm_per_minute']:.2f} -> {r['cm_per_minute']:.2f}cm/min ({dv:+.2f})")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='攀爬性能基准测试（仿真后端）')
+    parser.add_argument('-d', '--diameter', type=int, choices=DIAMETERS, action='append',
+                        help='柱子直径，可重复指定，默认全部')
+    parser.add_argument('--direction', choices=['up', 'down'], action='append',
+                        help='攀爬方向，可重复指定，默认全部')
+    parser.add_argument('--up-targets', type=float, nargs='+', default=list(UP_TARGETS),
+                        help='上升目标高度 (cm)')
+    parser.add_argument('--down-targets', type=float, nargs='+', default=list(DOWN_TARGETS),
+                        help='下降目标高度 (cm)')
+    parser.add_argument('--up-start', type=float, default=50.0, help='上升初始高度 (cm)')
+    parser.add_argument('--down-start', type=float, default=200.0, help='下降初始高度 (cm)')
+    parser.add_argument('-c', '--continuous', action='store_true', help='同时测试连续攀爬模式')
+    parser.add_argument('--clock', choices=['virtual', 'real'], default='virtual',
+                        help='时钟，默认虚拟时钟（远快于实时）')
+    parser.add_argument('--seed', type=int, default=0, help='仿真随机数种子')
+    parser.add_argument('--calibration', default='', help='使用的标定文件，默认不加载标定')
+    parser.add_argument('--pressure-decay', type=float, default=0.0,
+                        help='仿真气源压力下降速率（竖直杆每通电1秒速度下降的比例）')
+    parser.add_argument('--pid', action='store_true', help='逐步模式使用PID计算移动时间（旧方法）')
+    parser.add_argument('--open-loop', action='store_true', help='最后一步竖直杆也按计划时间通电，不闭环断电')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='结果JSON文件')
+    parser.add_argument('--compare', help='与之前的结果JSON文件比较')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出控制器日志')
+
+    args = parser.parse_args()
+
+    # 控制器模块导入时已配置日志，基准测试默认只保留警告以上
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+
+    diameters = args.diameter or list(DIAMETERS)
+    directions = args.direction or ['up', 'down']
+    modes = [False, True] if args.continuous else [False]
+
+    results = []
+    for direction in directions:
+        start = args.up_start if direction == 'up' else args.down_start
+        targets = args.up_targets if direction == 'up' else args.down_targets
+        for diameter in diameters:
+            for continuous in modes:
+                for target in targets:
+                    result = run_case(direction, diameter, start, target, continuous, args.clock, args.seed,
+                                      args.calibration, args.pressure_decay, 'pid' if args.pid else 'model',
+                                      not args.open_loop)
+                    results.append(result)
+                    print(f"完成: {direction} {diameter}cm {result['mode']} -> {target}cm "
+                          f"({result['wall_time']:.2f}s)", file=sys.stderr)
+
+    print_results(results)
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'clock': args.clock,
+        'seed': args.seed,
+        'calibration': args.calibration or None,
+        'pressure_decay': args.pressure_decay,
+        'planner': 'pid' if args.pid else 'model',
+        'closed_loop': not args.open_loop,
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
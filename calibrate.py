@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+执行器标定 - 机器人抓在柱子上时，按不同通电时间驱动竖直杆，用超声波测出高度变化，
+拟合竖直杆伸长/收缩的速度 (cm/s) 和延迟（秒）；再用二分法找出径向杆松开抓握所需的最短伸长时间
+结果写入标定文件，ClimbingRobot 启动时自动读取
+"""
+
+from robot import ClimbingRobot, NoEcho
+from actuators import StopRequested
+from gait import StepExecutor
+from datetime import datetime
+import json
+import logging
+import argparse
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def fit_rate_model(samples):
+    """
+    最小二乘拟合 距离 = 速度 * (通电时间 - 延迟)
+    :param samples: [(通电时间, 移动距离), ...]，至少两个不同的通电时间
+    :return: (速度 cm/s, 延迟秒数, 决定系数)
+    """
+    n = len(samples)
+    mean_t = sum(t for t, _ in samples) / n
+    mean_d = sum(d for _, d in samples) / n
+    sxx = sum((t - mean_t) ** 2 for t, _ in samples)
+    sxy = sum((t - mean_t) * (d - mean_d) for t, d in samples)
+    if sxx == 0:
+        raise ValueError("至少需要两个不同的通电时间")
+
+    rate = sxy / sxx
+    if rate <= 0:
+        raise ValueError(f"拟合速度无效: {rate:.3f}cm/s，请检查传感器和气源")
+    intercept = mean_d - rate * mean_t
+    dead_time = max(-intercept / rate, 0.0)
+
+    ss_tot = sum((d - mean_d) ** 2 for _, d in samples)
+    ss_res = sum((d - (rate * t + intercept)) ** 2 for t, d in samples)
+    r2 = 1.0 - ss_res / ss_tot if ss_tot > 0 else 1.0
+    return rate, dead_time, r2
+
+
+class Calibrator:
+    def __init__(self, robot, readings=9, settle_time=0.5, noise=0.5):
+        """
+        初始化标定器
+        :param robot: ClimbingRobot 实例，需已抓在柱子上
+        :param readings: 每次测高取中值的有效读数个数
+        :param settle_time: 动作结束后等待稳定的时间（秒）
+        :param noise: 静止测高的噪声 (cm)，高度变化超过该值才认为机器人移动了
+        """
+        self.robot = robot
+        self.readings = readings
+        self.settle_time = settle_time
+        self.noise = noise
+        self.step_executor = StepExecutor(robot)
+
+    def measure_height(self):
+        """静止时测高 - 取多次有效读数的中值"""
+        heights = []
+        for _ in range(self.readings * 3):
+            height = self.robot.get_current_height()
+            if not isinstance(height, NoEcho):
+                heights.append(height)
+                if len(heights) >= self.readings:
+                    break
+        if not heights:
+            raise RuntimeError("超声波无回声，无法标定")
+        heights.sort()
+        return heights[len(heights) // 2]
+
+    def step_displacement(self, direction, on_time, radial_time, side='upper'):
+        """
+        执行一步并测量高度变化
+        :param direction: 'up' 竖直杆伸长 / 'down' 竖直杆收缩
+        :param on_time: 竖直杆通电时间（秒）
+        :param radial_time: 径向杆伸长/收缩时间（秒）
+        :return: 高度变化 (cm)
+        """
+        before = self.measure_height()
+        self.step_executor.run(side, direction, on_time, radial_time=radial_time)
+        self.robot.clock.sleep(self.settle_time)
+        after = self.measure_height()
+        return after - before
+
+    def calibrate_vertical(self, pulses, repeats=2):
+        """
+        竖直杆标定 - 每个通电时间先伸长一步再收缩一步，机器人回到原位附近
+        :param pulses: 通电时间列表（秒）
+        :param repeats: 每个通电时间重复次数
+        :return: {'vertical_extend': 模型, 'vertical_retract': 模型}
+        """
+        # 标定前的径向杆时间足够长，保证每步都能松开抓握
+        radial_time = self.robot.extend_time
+        extend_samples = []
+        retract_samples = []
+        for on_time in pulses:
+            for _ in range(repeats):
+                rise = self.step_displacement('up', on_time, radial_time)
+                drop = -self.step_displacement('down', on_time, radial_time)
+                logger.info(f"通电 {on_time:.2f}秒: 伸长 {rise:.2f}cm, 收缩 {drop:.2f}cm")
+                extend_samples.append((on_time, rise))
+                retract_samples.append((on_time, drop))
+
+        models = {}
+        for name, samples in (('vertical_extend', extend_samples), ('vertical_retract', retract_samples)):
+            rate, dead_time, r2 = fit_rate_model(samples)
+            logger.info(f"{name}: 速度 {rate:.3f}cm/s, 延迟 {dead_time:.3f}秒, R²={r2:.3f}")
+            models[name] = {'rate': rate, 'dead_time': dead_time, 'r2': r2, 'samples': samples}
+        return models
+
+    def undo_displacement(self, displacement, vertical, side):
+        """
+        反向走一步抵消试探步的高度变化，径向杆按完整时间伸长保证这一步确实松开
+        :param displacement: 要抵消的高度变化 (cm)
+        :param vertical: calibrate_vertical 的结果，按伸长/收缩模型算出通电时间
+        :param side: 'upper' 或 'lower'
+        :return: 抵消后剩余的高度偏差 (cm)
+        """
+        direction, model = ('down', vertical['vertical_retract']) if displacement > 0 else \
+            ('up', vertical['vertical_extend'])
+        on_time = model['dead_time'] + abs(displacement) / model['rate']
+        return displacement + self.step_displacement(direction, on_time, self.robot.extend_time, side)
+
+    def calibrate_radial_release(self, side, vertical, probe_time=1.0, resolution=0.1):
+        """
+        二分查找径向杆松开抓握所需的最短伸长时间
+        以固定的竖直杆通电时间试探，高度变化达到预期的一半即认为已松开；
+        只要高度变化超过测高噪声（包括没松开但滑动了一部分），就反向走回原位，每次试探都从同一高度开始
+        :param side: 'upper' 或 'lower'
+        :param vertical: calibrate_vertical 的结果，伸长速度用于判断是否松开，两个模型用于走回原位
+        :param probe_time: 试探时竖直杆的通电时间（秒）
+        :param resolution: 查找精度（秒）
+        :return: 模型字典
+        """
+        low, high = 0.0, self.robot.extend_time
+        expected = vertical['vertical_extend']['rate'] * probe_time
+        samples = []
+        while high - low > resolution:
+            radial_time = (low + high) / 2
+            rise = self.step_displacement('up', probe_time, radial_time, side)
+            samples.append((radial_time, rise))
+            if rise >= 0.5 * expected:
+                high = radial_time
+            else:
+                low = radial_time
+            logger.info(f"{side}径向杆伸长 {radial_time:.2f}秒: 移动 {rise:.2f}cm")
+            if abs(rise) > self.noise:
+                offset = self.undo_displacement(rise, vertical, side)
+                logger.info(f"  反向回到原位，剩余偏差 {offset:.2f}cm")
+
+        logger.info(f"{side}径向杆松开抓握时间: {high:.2f}秒")
+        return {'release_time': high, 'samples': samples}
+
+    def run(self, pulses, repeats=2, radial=True):
+        """执行全部标定，返回标定结果"""
+        actuators = self.calibrate_vertical(pulses, repeats)
+        if radial:
+            vertical = dict(actuators)
+            for side in ('upper', 'lower'):
+                actuators[f'{side}_radial_extend'] = self.calibrate_radial_release(side, vertical)
+        return {
+            'version': 1,
+            'created': datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
+            'actuators': actuators,
+        }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='执行器标定程序（机器人需已抓在柱子上）')
+    parser.add_argument('-o', '--output', default='calibration.json', help='标定文件路径')
+    parser.add_argument('-p', '--pulses', type=float, nargs='+', default=[1.0, 1.5, 2.0, 2.5, 3.0],
+                        help='竖直杆通电时间（秒）')
+    parser.add_argument('-n', '--repeats', type=int, default=2, help='每个通电时间重复次数')
+    parser.add_argument('--no-radial', action='store_true', help='跳过径向杆松开时间标定')
+
+    args = parser.parse_args()
+
+    print("执行器标定程序")
+    # 标定时不使用旧的标定结果，也不按行程推算裁剪命令
+    robot = ClimbingRobot(calibration_file='', state_file='')
+    # kill -TERM / kill -USR1 立即断开全部继电器并中止标定
+    robot.install_stop_signals()
+    calibrator = Calibrator(robot)
+
+    try:
+        calibration = calibrator.run(args.pulses, args.repeats, radial=not args.no_radial)
+        with open(args.output, 'w') as f:
+            json.dump(calibration, f, indent=2, ensure_ascii=False)
+        logger.info(f"标定结果已写入 {args.output}")
+
+    except StopRequested as e:
+        # 继电器已全部断开，不写标定文件；关机在 finally 中完成
+        logger.warning(f"标定被停止: {e}")
+
+    except KeyboardInterrupt:
+        logger.info("用户中断标定")
+
+    except Exception as e:
+        logger.error(f"标定过程中出错: {e}")
+
+    finally:
+        try:
+            robot.reset_servos()
+        finally:
+            robot.power_off()
+
+
+if __name__ == "__main__":
+    main()
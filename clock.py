@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+时钟抽象 - 执行器脉冲、舵机稳定、等待稳定和测距时间戳都通过时钟完成
+RealClock 使用系统时间，延迟调用都由一个常驻的定时器线程按到期顺序执行；
+VirtualClock 的时间只在等待时跳到下一个定时事件，仿真任务可以远快于实时
+"""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RealClock:
+    """系统时钟"""
+    virtual = False
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def monotonic_ns(self):
+        return time.monotonic_ns()
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def spin(self):
+        """忙等循环中的一次空转，系统时钟下什么都不做"""
+
+    def wait(self, event, timeout=None):
+        """
+        等待 threading.Event
+        :return: 事件是否已发生
+        """
+        return event.wait(timeout)
+
+    def call_later(self, delay, callback, *args):
+        """
+        延迟调用，返回带 cancel() 的定时器；回调在共用的定时器线程中执行，不应阻塞
+        """
+        return timer_thread().call_at(time.monotonic() + max(delay, 0), callback, args)
+
+    def start_periodic(self, period, callback, name="periodic"):
+        """
+        按固定周期重复调用，返回带 cancel() 的句柄
+        """
+        return _RealPeriodic(self, period, callback, name)
+
+
+class _RealTimer:
+    """定时器线程中的一个延迟调用"""
+    __slots__ = ('due', 'callback', 'args', 'cancelled')
+
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        # 只做标记，定时器线程取出时跳过；不唤醒线程，提前取消的脉冲不增加切换
+        self.cancelled = True
+
+
+class TimerThread:
+    """
+    常驻定时器线程 - 到期时刻放在最小堆中，线程在 Condition 上等待最早的一个
+    每个脉冲不再创建一个 threading.Timer 线程: 实时模式下线程创建和退出的开销与调度抖动都不出现在脉冲路径上
+    """
+
+    def __init__(self, name="clock-timer"):
+        self._timers = []  # (到期时刻, 序号, _RealTimer)
+        self._seq = itertools.count()
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def call_at(self, due, callback, args=()):
+        """
+        在 time.monotonic() 到达 due 时调用
+        :return: 带 cancel() 的定时器
+        """
+        timer = _RealTimer(due, callback, args)
+        with self._condition:
+            heapq.heappush(self._timers, (due, next(self._seq), timer))
+            # 只有新定时器成为最早的一个时才需要唤醒线程重新计算等待时间
+            if self._timers[0][2] is timer:
+                self._condition.notify()
+        return timer
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    while self._timers and self._timers[0][2].cancelled:
+                        heapq.heappop(self._timers)
+                    if not self._timers:
+                        self._condition.wait()
+                        continue
+                    delay = self._timers[0][0] - time.monotonic()
+                    if delay <= 0:
+                        _, _, timer = heapq.heappop(self._timers)
+                        break
+                    self._condition.wait(delay)
+            # 在锁外执行回调，回调中可以再登记定时器
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                logger.exception(f"定时回调 {timer.callback!r} 出错")
+
+
+_timer_thread = None
+_timer_thread_lock = threading.Lock()
+
+
+def timer_thread():
+    """
+    :return: 进程共用的定时器线程，第一次使用时启动；
+             实时模式在 configure_realtime 中提前启动它，线程继承实时调度和CPU绑定
+    """
+    global _timer_thread
+    if _timer_thread is None:
+        with _timer_thread_lock:
+            if _timer_thread is None:
+                _timer_thread = TimerThread()
+    return _timer_thread
+
+
+class _RealPeriodic:
+    """系统时钟下的周期任务 - 独立线程，按绝对时间排程避免漂移"""
+
+    def __init__(self, clock, period, callback, name):
+        self.clock = clock
+        self.period = period
+        self.callback = callback
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            self.callback()
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay < 0:
+                next_time = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
+
+    def cancel(self):
+        self._stop_event.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout=1.0)
+
+
+class _VirtualTimer:
+    """虚拟时钟定时器"""
+
+    def __init__(self, due, callback, args):
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _VirtualPeriodic:
+    """虚拟时钟下的周期任务 - 每次执行后重新登记下一次定时器"""
+
+    def __init__(self, clock, period, callback):
+        self.clock = clock
+        self.period = period
+        self.callback = callback
+        self.cancelled = False
+        self._next_due = clock.monotonic()
+        self._timer = clock.call_later(0, self._tick)
+
+    def _tick(self):
+        if self.cancelled:
+            return
+        self.callback()
+        self._next_due = max(self._next_due + self.period, self.clock.monotonic())
+        self._timer = self.clock.call_later(self._next_due - self.clock.monotonic(), self._tick)
+
+    def cancel(self):
+        self.cancelled = True
+        self._timer.cancel()
+
+
+class VirtualClock:
+    """
+    虚拟时钟 - 单线程使用
+    sleep/wait 不真正等待，而是按到期顺序执行定时器并把时间直接推进过去
+    """
+    virtual = True
+    spin_quantum = 0.00001  # 忙等循环每次空转推进的时间（秒）
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._timers = []  # (到期时刻, 序号, _VirtualTimer)
+        self._seq = itertools.count()
+
+    def monotonic(self):
+        return self._now
+
+    def monotonic_ns(self):
+        return int(self._now * 1e9)
+
+    def call_later(self, delay, callback, *args):
+        timer = _VirtualTimer(self._now + max(delay, 0), callback, args)
+        heapq.heappush(self._timers, (timer.due, next(self._seq), timer))
+        return timer
+
+    def start_periodic(self, period, callback, name="periodic"):
+        return _VirtualPeriodic(self, period, callback)
+
+    def _run_next(self, deadline):
+        """执行下一个不晚于 deadline 的定时器，没有则返回 False"""
+        while self._timers and self._timers[0][2].cancelled:
+            heapq.heappop(self._timers)
+        if not self._timers or (deadline is not None and self._timers[0][0] > deadline):
+            return False
+        due, _, timer = heapq.heappop(self._timers)
+        # 定时器回调中也可能推进时间，时间只前进不后退
+        self._now = max(self._now, due)
+        timer.callback(*timer.args)
+        return True
+
+    def sleep(self, seconds):
+        target = self._now + max(seconds, 0)
+        while self._run_next(target):
+            pass
+        self._now = max(self._now, target)
+
+    def spin(self):
+        """忙等循环中的一次空转 - 推进一个很小的时间片，否则轮询永远等不到条件变化"""
+        self.sleep(self.spin_quantum)
+
+    def wait(self, event, timeout=None):
+        deadline = None if timeout is None else self._now + timeout
+        while not event.is_set():
+            if not self._run_next(deadline):
+                if deadline is None:
+                    raise RuntimeError("虚拟时钟: 没有待执行的定时器，等待的事件不会发生")
+                self._now = max(self._now, deadline)
+                break
+        return event.is_set()
+
+
+def create_clock(name=None):
+    """
+    按名称创建时钟
+    :param name: 'real' 或 'virtual'，默认读取环境变量 ROBOT_CLOCK，未设置时为 'real'
+    """
+    name = name or os.environ.get('ROBOT_CLOCK', 'real')
+    if name == 'real':
+        return RealClock()
+    if name == 'virtual':
+        logger.info("使用虚拟时钟")
+        return VirtualClock()
+    raise ValueError(f"未知的时钟: {name}")
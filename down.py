@@ -1,105 +1,197 @@
 #!/usr/bin/env python3
 """
-下降攀爬控制 - 使用PID控制移动时间
+下降攀爬控制 - 按竖直杆速度模型规划步数和每步移动时间，可选旧的PID逐步控制
 """
 
-from robot import ClimbingRobot
+from robot import ClimbingRobot, NoEcho, STEP_BUCKETS
+from actuators import StopRequested
+from height_sampler import HeightSampler
+from gait import StepExecutor
+from tracer import EV_POSITION, EV_PID_OUTPUT, EV_STEP_START, EV_STEP_END, EV_HEIGHT_CHANGE, EV_PROGRESS, \
+    EV_RATE_ESTIMATE
+from rate_estimator import StrokeRateEstimator
+from step_planner import plan_step_times
+from realtime import start_realtime
+from state_block import DEFAULT_NAME as STATE_BLOCK_NAME
 from simple_pid import PID
-import time
+import os
 import logging
+import atexit
+import argparse
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 class DownClimbController:
-    def __init__(self, target_height=20):
+    def __init__(self, target_height=20, robot=None, planner='model'):
         """
         初始化下降攀爬控制器
         :param target_height: 目标高度 (cm)
+        :param robot: ClimbingRobot 实例，默认新建一个（可传入使用仿真后端的实例）
+        :param planner: 逐步模式的移动时间计算方式，'model' 按速度模型规划，'pid' 使用PID控制器
         """
-        self.robot = ClimbingRobot()
+        if planner not in ('model', 'pid'):
+            raise ValueError(f"未知的规划方式: {planner}")
+        self.robot = robot or ClimbingRobot()
         self.target_height = target_height
+        self.planner = planner
         
         # PID控制器参数（下降时参数可能需要调整）
-        self.height_pid = PID(Kp=0.02, Ki=0.001, Kd=0.01, setpoint=target_height)
-        self.height_pid.output_limits = (0.5, 3.0)  # 限制时间范围 0.5-3.0秒
+        # PID按机器人的时钟计算积分和微分时间，虚拟时钟和回放下结果与实时运行一致
+        self.height_pid = PID(Kp=0.02, Ki=0.001, Kd=0.01, setpoint=target_height, time_fn=self.robot.clock.monotonic)
+        self.movement_time_limits = (0.5, 3.0)  # 限制时间范围 0.5-3.0秒
+        self.height_pid.output_limits = self.movement_time_limits
         
         # 攀爬参数
         self.max_steps = 50  # 最大攀爬步数
         self.step_count = 0
         self.initial_height = 0
         self.height_threshold = 2.0  # 高度变化阈值 (cm)
+        self.last_valid_height = None  # 最近一次有效的超声波读数
+
+        # 后台超声波采样器，控制循环直接读取滤波后的高度
+        self.sampler = HeightSampler(self.robot)
+        self.max_sample_age = 0.5  # 允许使用的最大样本年龄 (秒)
+
+        # 单步流水线执行器，按阶段偏移表重叠执行各阶段
+        self.step_executor = StepExecutor(self.robot)
+
+        # 循环中的逐步信息写入机器人的事件追踪器，由后台线程渲染成日志
+        self.tracer = self.robot.tracer
+
+        # 运行指标: 每步用时、相邻两步开始的间隔（逐步模式含测距、规划和等待稳定）、计划通电时间和速度估计
+        metrics = self.robot.metrics
+        self.step_seconds = metrics.histogram('climb_step_seconds', '一步从开始到各阶段全部结束的用时',
+                                              STEP_BUCKETS, labels=('direction',)).labels('down')
+        self.cycle_seconds = metrics.histogram('climb_cycle_seconds', '相邻两步开始的间隔',
+                                               STEP_BUCKETS, labels=('direction',)).labels('down')
+        self.movement_time_gauge = metrics.gauge('climb_movement_time_seconds', '最近一步竖直杆的计划通电时间',
+                                                 labels=('direction',)).labels('down')
+        self.rate_gauge = metrics.gauge('climb_rate_estimate_cm_per_s', '竖直杆速度的在线估计',
+                                        labels=('direction',)).labels('down')
+        self.last_step_start = None  # 上一步开始的时刻，用于步间隔
+
+        # 连续下降参数
+        self.vertical_speed = self.robot.vertical_retract_speed  # 竖直杆速度估计 (cm/s)，每步按实测在线修正
+        self.dead_time = self.robot.vertical_retract_dead_time  # 竖直杆通电后开始移动前的延迟（秒）
+        self.replan_tolerance = 3.0  # 实测高度偏离计划超过该值时重新规划 (cm)
+        self.plan = []  # 逐步模式中剩余的计划移动时间
+        self.expected_height = None  # 按计划预期的当前高度 (cm)
+        self.closed_loop = True  # 最后一步竖直杆按实测高度闭环逼近目标，False 时按计划时间通电
+
+        # 竖直杆速度在线估计，初值为标定结果；PID输出按标定模型换算的行程再按当前估计折算为通电时间
+        self.nominal_speed = self.vertical_speed
+        self.nominal_dead_time = self.dead_time
+        self.rate_estimator = StrokeRateEstimator(self.vertical_speed, self.dead_time)
+        self.max_movement_time = 6.0  # 速度下降后每步允许的最长通电时间（秒）
         
         logger.info(f"下降攀爬控制器初始化完成，目标高度: {target_height}cm")
 
     def get_current_position(self):
-        """获取当前位置（距离）"""
-        return self.robot.get_current_height()
+        """
+        获取当前位置（距离）
+        优先读取后台采样器的中值滤波高度；采样器未就绪或样本过期时直接测距
+        测距失败时沿用最近一次有效读数，从未成功测距则抛出异常结束攀爬
+        """
+        age = self.sampler.age()
+        if age is not None and age <= self.max_sample_age:
+            self.last_valid_height = self.sampler.median_height()
+            return self.last_valid_height
+
+        height = self.robot.get_current_height()
+        if isinstance(height, NoEcho):
+            if self.last_valid_height is None:
+                raise RuntimeError(f"超声波无回声，无法获取高度: {height.reason}")
+            logger.warning(f"超声波无回声 ({height.reason})，沿用上一次有效高度 {self.last_valid_height:.2f}cm")
+            return self.last_valid_height
+
+        self.last_valid_height = height
+        return height
 
     def calculate_movement_time(self, current_height):
+        """
+        计算下一步的移动时间
+        :param current_height: 当前高度
+        :return: 计算出的移动时间
+        """
+        if self.planner == 'pid':
+            return self.pid_movement_time(current_height)
+
+        # 计划走完或实测高度偏离计划时，从当前高度重新规划
+        if not self.plan or abs(current_height - self.expected_height) > self.replan_tolerance:
+            if self.plan:
+                logger.warning(f"实测高度 {current_height:.2f}cm 偏离计划 {self.expected_height:.2f}cm")
+            self.plan = self.plan_steps(current_height) or [self.movement_time_limits[0]]
+            self.expected_height = current_height
+            logger.info(f"规划 {len(self.plan)} 步，每步移动时间 {self.plan[0]:.2f}秒")
+
+        movement_time = self.plan.pop(0)
+        self.expected_height -= self.rate_estimator.displacement(movement_time)
+        self.tracer.record(EV_PID_OUTPUT, self.step_count + 1, movement_time)
+        return movement_time
+
+    def pid_movement_time(self, current_height):
         """
         使用PID控制器计算移动时间
         :param current_height: 当前高度
         :return: 计算出的移动时间
         """
-        # 计算高度差（当前 - 目标，下降时为正值）
-        height_error = current_height - self.target_height
-        
         # 使用PID控制器计算输出时间
         control_output = self.height_pid(current_height)
         
-        logger.info(f"高度误差: {height_error:.2f}cm, PID输出时间: {control_output:.2f}秒")
-        return control_output
+        self.tracer.record(EV_PID_OUTPUT, self.step_count + 1, control_output)
+
+        # PID输出按标定速度对应一段行程，气源压力变化后按在线估计的速度折算为通电时间，保持每步行程不变
+        distance = max(control_output - self.nominal_dead_time, 0.0) * self.nominal_speed
+        min_time = self.movement_time_limits[0]
+        return min(max(self.rate_estimator.time_for(distance), min_time), self.max_movement_time)
+
+    def update_rate_estimate(self, movement_time, displacement):
+        """
+        用一步的实测高度变化更新竖直杆速度估计
+        :param movement_time: 本步竖直杆通电时间（秒）
+        :param displacement: 本步实测移动距离 (cm)，沿攀爬方向为正
+        """
+        if self.rate_estimator.update(movement_time, displacement):
+            self.vertical_speed = self.rate_estimator.rate
+            self.dead_time = self.rate_estimator.dead_time
+            self.rate_gauge.set(self.vertical_speed)
+            self.tracer.record(EV_RATE_ESTIMATE, self.step_count, self.vertical_speed)
 
-    def climb_one_step_down(self, movement_time):
+    def climb_one_step_down(self, movement_time, start_height=None):
         """
         执行一步下降动作（反向攀爬）
-        :param movement_time: PID计算出的移动时间
+        :param movement_time: 计算出的移动时间
+        :param start_height: 本步开始时的高度；最后一步给出，启用闭环时竖直杆按实测高度移动到目标高度即断电
+        :return: 竖直杆实际通电时间（秒）
         """
-        logger.info(f"=== 开始第 {self.step_count + 1} 步下降 ===")
+        step_start = self.robot.clock.monotonic()
+        if self.last_step_start is not None:
+            self.cycle_seconds.observe(step_start - self.last_step_start)
+        self.last_step_start = step_start
+        self.movement_time_gauge.set(movement_time)
+        self.tracer.record(EV_STEP_START, self.step_count + 1, movement_time)
         
         # 根据步数决定使用上方杆还是下方杆
         if self.step_count % 2 == 0:
             # 偶数步使用下方杆（下降时先用下方杆）
-            logger.info("使用下方杆下降")
-            
-            # 1. 下方径向伸缩杆伸长
-            self.robot.control_lower_radial_extend(movement_time)
-            
-            # 2. 下方舵机顺时针旋转（下降时方向相反）
-            self.robot.rotate_lower_servo_cw(5)
-            
-            # 3. 竖直伸缩杆收缩（下降动作）
-            self.robot.control_vertical_retract(movement_time)
-            
-            # 4. 下方舵机逆时针旋转回来
-            self.robot.rotate_lower_servo_ccw(5)
-            
-            # 5. 下方径向伸缩杆收缩
-            self.robot.control_lower_radial_retract(movement_time)
-            
+            side = 'lower'
         else:
             # 奇数步使用上方杆
-            logger.info("使用上方杆下降")
-            
-            # 1. 上方径向伸缩杆伸长
-            self.robot.control_upper_radial_extend(movement_time)
-            
-            # 2. 上方舵机顺时针旋转（下降时方向相反）
-            self.robot.rotate_upper_servo_cw(5)
-            
-            # 3. 竖直伸缩杆收缩（下降动作）
-            self.robot.control_vertical_retract(movement_time)
-            
-            # 4. 上方舵机逆时针旋转回来
-            self.robot.rotate_upper_servo_ccw(5)
-            
-            # 5. 上方径向伸缩杆收缩
-            self.robot.control_upper_radial_retract(movement_time)
+            side = 'upper'
+
+        # 径向杆伸长 -> 舵机顺时针 -> 竖直杆收缩 -> 舵机逆时针 -> 径向杆收缩，按偏移表重叠执行
+        displacement = None
+        if self.closed_loop and start_height is not None:
+            displacement = start_height - self.target_height
+        timings = self.step_executor.run(side, 'down', movement_time, displacement=displacement,
+                                         start_height=start_height, rate=self.vertical_speed)
         
         self.step_count += 1
-        logger.info(f"第 {self.step_count} 步下降完成")
+        self.step_seconds.observe(self.robot.clock.monotonic() - step_start)
+        self.tracer.record(EV_STEP_END, self.step_count, max(end for _, _, end in timings))
+        return next(end - start for name, start, end in timings if name == 'vertical')
 
     def check_progress(self, previous_height, current_height):
         """
@@ -119,7 +211,7 @@ class DownClimbController:
             logger.warning(f"未检测到下降，当前: {current_height:.2f}cm, 之前: {previous_height:.2f}cm")
             return False
         
-        logger.info(f"下降距离: {height_change:.2f}cm")
+        self.tracer.record(EV_HEIGHT_CHANGE, 0, height_change)
         return True
 
     def start_climbing_down(self):
@@ -127,6 +219,11 @@ class DownClimbController:
         logger.info("=== 开始下降攀爬 ===")
         
         try:
+            # 启动后台采样并等待第一个有效样本
+            self.sampler.start()
+            if not self.sampler.wait_ready():
+                logger.warning("超声波采样器未就绪，改为直接测距")
+
             # 获取初始高度
             self.initial_height = self.get_current_position()
             logger.info(f"初始位置: {self.initial_height:.2f}cm")
@@ -141,7 +238,7 @@ class DownClimbController:
             while self.step_count < self.max_steps:
                 # 获取当前高度
                 current_height = self.get_current_position()
-                logger.info(f"当前位置: {current_height:.2f}cm")
+                self.tracer.record(EV_POSITION, 0, current_height)
                 
                 # 检查下降进度（从第2步开始）
                 if self.step_count > 0:
@@ -149,33 +246,38 @@ class DownClimbController:
                         logger.warning("下降进度不足，可能遇到障碍")
                         # 可以选择继续或停止
                 
-                # 使用PID控制器计算移动时间
+                # 按计划（或PID）计算移动时间
                 movement_time = self.calculate_movement_time(current_height)
+                step_start_height = current_height
                 
-                # 执行一步下降
-                self.climb_one_step_down(movement_time)
+                # 执行一步下降，计划的最后一步按实测高度闭环逼近目标
+                final_step = self.planner == 'model' and not self.plan
+                on_time = self.climb_one_step_down(movement_time, step_start_height if final_step else None)
                 
                 # 检查是否达到目标高度
                 current_height = self.get_current_position()
+                self.update_rate_estimate(on_time, step_start_height - current_height)
                 height_to_target = current_height - self.target_height
                 if height_to_target <= 2.0:  # 2cm容忍度
                     logger.info(f"已达到目标高度! 当前: {current_height:.2f}cm, 目标: {self.target_height}cm")
                     # 如果是偶数步完成，需要继续执行下一步（奇数步）来回收竖直杆
                     if self.step_count % 2 == 0:
                         logger.info("偶数步完成，继续执行下一步回收竖直杆...")
-                        # 使用固定时间来执行下一步，而不是PID计算的时间
-                        self.climb_one_step_down(3.0)  # TODO:
+                        # PID模式使用固定时间来执行下一步；规划模式按剩余距离规划这一步
+                        if self.planner == 'pid':
+                            self.climb_one_step_down(3.0)  # TODO:
+                        else:
+                            self.climb_one_step_down(self.plan_steps(current_height)[0])
                     break
                 
                 # 等待稳定
-                time.sleep(1)
+                self.robot.wait(1)
                 
                 # 更新上一次高度
                 previous_height = current_height
                 
                 # 显示进度
-                total_progress = self.initial_height - current_height
-                logger.info(f"总下降: {total_progress:.2f}cm, 剩余: {height_to_target:.2f}cm")
+                self.tracer.record(EV_PROGRESS, 0, height_to_target)
             
             # 下降结束
             final_height = self.get_current_position()
@@ -187,6 +289,9 @@ class DownClimbController:
             logger.info(f"总下降距离: {total_descent:.2f}cm")
             logger.info(f"总步数: {self.step_count}")
             
+        except StopRequested as e:
+            logger.warning(f"下降被停止: {e}")
+        
         except KeyboardInterrupt:
             logger.info("用户中断下降")
         
@@ -194,22 +299,178 @@ class DownClimbController:
             logger.error(f"下降过程中出错: {e}")
         
         finally:
-            # 重置舵机并清理
-            self.robot.reset_servos()
-            time.sleep(1)
-            self.robot.final_extract()
-            self.robot.power_off()
+            try:
+                self.sampler.stop()
+
+                # 重置舵机并清理
+                self.robot.reset_servos()
+                self.robot.heartbeat(1)
+                self.robot.clock.sleep(1)
+                # 停止请求后引擎已拒绝新动作，继电器保持断开，不再松开抓握
+                if self.robot.stop_event.is_set():
+                    logger.warning("已请求停止，跳过最终松开操作")
+                else:
+                    self.robot.final_extend()
+            except StopRequested:
+                pass  # 松开过程中收到停止请求，final_extend 已记录
+            finally:
+                # 无论清理是否出错都要关机: 关闭看门狗、清理GPIO、保存行程状态并写出事件
+                self.robot.power_off()
+
+    def plan_steps(self, current_height):
+        """
+        按竖直杆速度估计规划下降到目标所需的剩余步骤
+        :param current_height: 当前高度
+        :return: 每步的移动时间列表
+        """
+        min_time, max_time = self.movement_time_limits
+        # 每步最大行程为标定速度下通电 max_time 秒的距离，速度下降时延长通电时间走满行程
+        max_stroke = (max_time - self.nominal_dead_time) * self.nominal_speed
+        return plan_step_times(current_height - self.target_height, self.step_count, self.vertical_speed, self.dead_time,
+                               max_stroke, min_time, self.max_movement_time)
+
+    def start_climbing_down_continuous(self):
+        """
+        连续下降 - 预先规划多步并首尾相接执行，步间不停顿测量
+        后台采样器持续监测高度，仅当实测高度偏离计划时修正速度估计并重新规划
+        """
+        logger.info("=== 开始连续下降攀爬 ===")
+
+        try:
+            # 启动后台采样并等待第一个有效样本
+            self.sampler.start()
+            if not self.sampler.wait_ready():
+                logger.warning("超声波采样器未就绪，改为直接测距")
+
+            self.initial_height = self.get_current_position()
+            logger.info(f"初始位置: {self.initial_height:.2f}cm")
+
+            # 检查是否已经在目标高度附近
+            if self.initial_height <= self.target_height + 5.0:
+                logger.info("已经在目标高度附近，无需下降")
+                return
+
+            plan_start_height = self.initial_height
+            step_start_height = self.initial_height
+            expected_height = plan_start_height
+            plan = self.plan_steps(plan_start_height)
+            logger.info(f"规划 {len(plan)} 步，每步移动时间 {plan[0]:.2f}秒")
+
+            while self.step_count < self.max_steps:
+                movement_time = plan.pop(0)
+                on_time = self.climb_one_step_down(movement_time, None if plan else step_start_height)
+                expected_height -= max(movement_time - self.dead_time, 0) * self.vertical_speed
+
+                # 读取后台采样器的滤波高度，不阻塞
+                current_height = self.get_current_position()
+                self.update_rate_estimate(on_time, step_start_height - current_height)
+                step_start_height = current_height
+                if current_height - self.target_height <= 2.0 and self.step_count % 2 == 1:
+                    logger.info(f"已达到目标高度! 当前: {current_height:.2f}cm, 目标: {self.target_height}cm")
+                    break
+
+                deviation = current_height - expected_height
+                if plan and abs(deviation) <= self.replan_tolerance:
+                    continue
+
+                if abs(deviation) > self.replan_tolerance:
+                    logger.warning(f"实测高度 {current_height:.2f}cm 偏离计划 {expected_height:.2f}cm")
+                    actual_gain = plan_start_height - current_height
+                    if actual_gain < self.height_threshold:
+                        logger.warning("下降进度不足，可能遇到障碍，停止连续下降")
+                        break
+
+                # 计划偏离或已执行完，从当前高度重新规划
+                plan_start_height = current_height
+                expected_height = current_height
+                plan = self.plan_steps(current_height)
+                logger.info(f"重新规划 {len(plan)} 步，每步移动时间 {plan[0]:.2f}秒")
+
+            # 下降结束
+            final_height = self.get_current_position()
+            total_descent = self.initial_height - final_height
+
+            logger.info("=== 连续下降完成 ===")
+            logger.info(f"初始高度: {self.initial_height:.2f}cm")
+            logger.info(f"最终高度: {final_height:.2f}cm")
+            logger.info(f"总下降距离: {total_descent:.2f}cm")
+            logger.info(f"总步数: {self.step_count}")
+
+        except StopRequested as e:
+            logger.warning(f"下降被停止: {e}")
+        
+        except KeyboardInterrupt:
+            logger.info("用户中断下降")
+
+        except Exception as e:
+            logger.error(f"下降过程中出错: {e}")
+
+        finally:
+            try:
+                self.sampler.stop()
+
+                # 重置舵机并清理
+                self.robot.reset_servos()
+                self.robot.heartbeat(1)
+                self.robot.clock.sleep(1)
+                # 停止请求后引擎已拒绝新动作，继电器保持断开，不再松开抓握
+                if self.robot.stop_event.is_set():
+                    logger.warning("已请求停止，跳过最终松开操作")
+                else:
+                    self.robot.final_extend()
+            except StopRequested:
+                pass  # 松开过程中收到停止请求，final_extend 已记录
+            finally:
+                # 无论清理是否出错都要关机: 关闭看门狗、清理GPIO、保存行程状态并写出事件
+                self.robot.power_off()
 
 def main():
     """主函数"""
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='下降攀爬控制程序')
+    parser.add_argument('-c', '--continuous', action='store_true',
+                       help='连续下降模式，预先规划多步连续执行')
+    parser.add_argument('--pid', action='store_true',
+                       help='逐步下降时用PID计算每步移动时间（旧方法），默认按速度模型规划')
+    parser.add_argument('--open-loop', action='store_true',
+                       help='最后一步竖直杆也按计划时间通电，不按实测高度闭环断电')
+    parser.add_argument('--watchdog-ms', type=int, default=2000,
+                       help='看门狗心跳超时（毫秒），控制线程卡住超过该时间时由独立进程断开全部继电器，0 表示不启用')
+    parser.add_argument('--realtime', action='store_true',
+                       help='实时模式: 控制进程独占一个CPU核心、实时调度并锁定内存，日志和事件输出移到独立进程')
+    parser.add_argument('--rt-cpu', type=int,
+                       help='实时模式独占的CPU，默认为编号最大的CPU')
+    parser.add_argument('--rt-priority', type=int, default=50,
+                       help='实时模式的 SCHED_FIFO 优先级，0 表示不改调度策略')
+
+    args = parser.parse_args()
+
     print("下降攀爬控制程序")
+
+    # 实时模式: 先启动日志进程再设置本进程，之后创建的线程都继承实时设置；程序结束时写完剩余日志
+    io_process = None
+    if args.realtime:
+        io_process = start_realtime(args.rt_cpu, args.rt_priority)
+        atexit.register(io_process.close)
+    # 任务默认发布共享内存状态块供监视程序读取，ROBOT_STATE_BLOCK=none 关闭
+    state_block = os.environ.get('ROBOT_STATE_BLOCK', STATE_BLOCK_NAME)
     target = 0.0 # TODO:
     
     # 创建下降控制器
-    controller = DownClimbController(target_height=target)
+    controller = DownClimbController(target_height=target,
+                                     robot=ClimbingRobot(io_process=io_process, state_block=state_block),
+                                     planner='pid' if args.pid else 'model')
+    controller.closed_loop = not args.open_loop
+    # kill -TERM / kill -USR1 立即断开全部继电器并中止攀爬
+    controller.robot.install_stop_signals()
+    if args.watchdog_ms > 0:
+        controller.robot.start_watchdog(args.watchdog_ms)
     
     # 开始下降
-    controller.start_climbing_down()
+    if args.continuous:
+        controller.start_climbing_down_continuous()
+    else:
+        controller.start_climbing_down()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -6,12 +6,13 @@
 from robot import ClimbingRobot
 import time
 import logging
+import argparse
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def test_final_extract():
+def test_final_extract(profile=None):
     """测试final_extract函数"""
     print("=== 测试final_extract函数 ===")
     
@@ -23,7 +24,7 @@ def test_final_extract():
         
         # 测试final_extract函数
         logger.info("开始测试final_extract函数...")
-        robot.final_extend()
+        robot.final_extend(profile)
         
         logger.info("final_extract函数测试完成")
         
@@ -45,13 +46,20 @@ def test_final_extract():
 
 def main():
     """主函数"""
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='final_extract函数测试程序')
+    parser.add_argument('-p', '--profile', choices=['parallel', 'serial'],
+                       help='松开方案 (默认 parallel，serial 为逐个执行)')
+
+    args = parser.parse_args()
+
     print("final_extract函数测试程序")
     print("此程序将测试机器人的final_extract函数")
     print("该函数会同时伸长上下两个径向杆来松开对柱子的抓握")
     print("")
     
     # 开始测试
-    test_final_extract()
+    test_final_extract(args.profile)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
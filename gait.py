@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+单步步态流水线 - 按阶段偏移表把一步攀爬的五个阶段排成时间表执行，允许相邻阶段重叠
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 一步攀爬的五个阶段（按顺序）
+STEP_PHASES = ('radial_extend', 'servo_rotate', 'vertical', 'servo_return', 'radial_retract')
+
+# 阶段偏移表: 阶段相对上一阶段结束的开始偏移（秒），负数表示提前开始、与上一阶段重叠
+# 全为0时与原来的逐阶段串行执行完全一致
+SERIAL_PHASE_OFFSETS = {
+    'radial_extend': 0.0,
+    'servo_rotate': 0.0,
+    'vertical': 0.0,
+    'servo_return': 0.0,
+    'radial_retract': 0.0,
+}
+
+DEFAULT_PHASE_OFFSETS = {
+    'radial_extend': 0.0,
+    'servo_rotate': -0.5,  # 舵机在径向杆行程末尾预先转动
+    'vertical': 0.0,  # 竖直杆必须等舵机转到位
+    'servo_return': 0.0,
+    'radial_retract': -0.5,  # 径向杆收缩与舵机回转同时开始
+}
+
+
+class StepPlan:
+    """一步攀爬的时间表"""
+
+    def __init__(self, side, direction, phases):
+        self.side = side  # 'upper' 或 'lower'
+        self.direction = direction  # 'up' 或 'down'
+        self.phases = phases  # [(阶段名, 类型, 参数, 计划开始秒数, 持续秒数)]
+
+    def duration(self):
+        """计划的单步总时长（秒）"""
+        return max(start + length for _, _, _, start, length in self.phases)
+
+
+def build_step_plan(robot, side, direction, movement_time, offsets=None, servo_degrees=5, radial_time=None):
+    """
+    生成一步攀爬的时间表
+    :param robot: ClimbingRobot 实例
+    :param side: 本步移动的一侧 'upper' 或 'lower'
+    :param direction: 'up' 竖直杆伸长 / 'down' 竖直杆收缩
+    :param movement_time: 竖直杆的通电时间（秒）
+    :param offsets: 阶段偏移表，默认 DEFAULT_PHASE_OFFSETS
+    :param servo_degrees: 舵机转动角度
+    :param radial_time: 径向杆伸长/收缩时间（秒），默认 robot.radial_step_time，未标定时与移动时间相同
+    :return: StepPlan
+    """
+    offsets = DEFAULT_PHASE_OFFSETS if offsets is None else offsets
+    if radial_time is None:
+        radial_time = robot.radial_step_time or movement_time
+
+    # 上升时舵机先逆时针（杆向后）再顺时针；下降时方向相反
+    rotate = -servo_degrees if direction == 'up' else servo_degrees
+    vertical_action = 'vertical_extend' if direction == 'up' else 'vertical_retract'
+
+    specs = [
+        ('radial_extend', 'actuator', f'{side}_radial_extend', radial_time),
+        ('servo_rotate', 'servo', rotate, robot.servo_rotation_time),
+        ('vertical', 'actuator', vertical_action, movement_time),
+        ('servo_return', 'servo', -rotate, robot.servo_rotation_time),
+        ('radial_retract', 'actuator', f'{side}_radial_retract', radial_time),
+    ]
+
+    phases = []
+    previous_start = 0.0
+    previous_end = 0.0
+    for name, kind, arg, length in specs:
+        # 重叠不能早于上一阶段的开始，保持阶段顺序
+        start = max(previous_end + offsets.get(name, 0.0), previous_start)
+        phases.append((name, kind, arg, start, length))
+        previous_start = start
+        previous_end = start + length
+
+    return StepPlan(side, direction, phases)
+
+
+class StepExecutor:
+    def __init__(self, robot, offsets=None):
+        """
+        初始化单步流水线执行器
+        :param robot: ClimbingRobot 实例
+        :param offsets: 阶段偏移表，默认 DEFAULT_PHASE_OFFSETS
+        """
+        self.robot = robot
+        self.offsets = DEFAULT_PHASE_OFFSETS if offsets is None else offsets
+        self.last_timings = []  # 最近一步的实际阶段时间 [(阶段名, 开始秒数, 结束秒数)]
+        self.last_vertical_move = None  # 最近一步闭环竖直移动的结果 VerticalMove
+        self.closed_loop_margin = 1.5  # 闭环竖直移动的最长通电时间为计划移动时间的倍数
+
+    def run(self, side, direction, movement_time, radial_time=None, displacement=None, start_height=None,
+            rate=None):
+        """
+        按时间表执行一步攀爬
+        :param radial_time: 径向杆伸长/收缩时间（秒），默认见 build_step_plan
+        :param displacement: 竖直杆目标位移 (cm)，给出时竖直阶段改为闭环移动（见 ClimbingRobot.move_vertical），
+                             达到位移即断电，之后的阶段按实际结束时刻顺延或提前
+        :param start_height: 本步开始时的高度 (cm)，闭环移动的位移参考，默认通电前测量
+        :param rate: 闭环移动的预计速度 (cm/s)
+        :return: 实际阶段时间 [(阶段名, 开始秒数, 结束秒数)]
+        """
+        plan = build_step_plan(self.robot, side, direction, movement_time, self.offsets, radial_time=radial_time)
+
+        clock = self.robot.clock
+        t0 = clock.monotonic()
+        handles = {}  # 阶段名 -> PulseHandle
+        servo_phases = {}  # 阶段名 -> (开始, 结束)
+        cylinder_handles = {}  # 伸缩杆 -> 最近一个 PulseHandle
+        shift = 0.0  # 闭环竖直移动实际结束与计划结束之差，之后的阶段随之平移
+        self.last_vertical_move = None
+
+        for name, kind, arg, start, length in plan.phases:
+            self.robot.wait(t0 + shift + start - clock.monotonic())
+
+            if name == 'vertical' and displacement is not None:
+                move = self.robot.move_vertical(direction, displacement, length * self.closed_loop_margin,
+                                                start_height, rate)
+                handles[name] = move.handle
+                shift = move.handle.end_time - (t0 + start + length)
+                self.last_vertical_move = move
+            elif kind == 'actuator':
+                # 同一伸缩杆上的前一个脉冲可能因定时误差尚未断电
+                cylinder = self.robot.actuators[arg][0]
+                previous = cylinder_handles.get(cylinder)
+                if previous is not None:
+                    previous.join()
+                handles[name] = cylinder_handles[cylinder] = self.robot.start_actuator(arg, length)
+            else:
+                begin = clock.monotonic()
+                self.robot.set_servo_angle(side, arg)
+                servo_phases[name] = (begin - t0, begin - t0 + length)
+
+        # 等待最后的舵机稳定和所有脉冲结束
+        self.robot.wait(t0 + shift + plan.duration() - clock.monotonic())
+        for handle in handles.values():
+            handle.join()
+        self.robot.check_stop()
+
+        timings = []
+        for name, _, _, _, _ in plan.phases:
+            if name in handles:
+                handle = handles[name]
+                timings.append((name, handle.start_time - t0, handle.end_time - t0))
+            else:
+                timings.append((name,) + servo_phases[name])
+        self.last_timings = timings
+        return timings
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+GPIO后端接口 - ClimbingRobot 通过该接口访问引脚，默认使用树莓派 RPi.GPIO，也可以换成仿真后端
+"""
+
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class GPIOBackend:
+    """
+    GPIO后端接口，方法和常量与 RPi.GPIO 保持一致
+    子类需要实现 setmode/setwarnings/setup/output/input/PWM/add_event_detect/cleanup
+    setup 和 output 与 RPi.GPIO 一样接受引脚列表，output 的电平可以是等长列表或单个电平，多个引脚一次写入
+    """
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def bind(self, robot):
+        """
+        在 ClimbingRobot 定义好引脚和参数、初始化GPIO之前调用
+        仿真后端用它读取引脚分配，真实硬件后端不需要
+        """
+
+    def setmode(self, mode):
+        raise NotImplementedError
+
+    def setwarnings(self, flag):
+        raise NotImplementedError
+
+    def setup(self, channel, direction):
+        raise NotImplementedError
+
+    def output(self, channel, value):
+        raise NotImplementedError
+
+    def input(self, channel):
+        raise NotImplementedError
+
+    def PWM(self, channel, frequency):
+        raise NotImplementedError
+
+    def add_event_detect(self, channel, edge, callback=None):
+        raise NotImplementedError
+
+    def cleanup(self):
+        raise NotImplementedError
+
+
+class RPiGPIOBackend(GPIOBackend):
+    """树莓派 RPi.GPIO 后端 - 仅在实例化时才导入 RPi.GPIO"""
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        self._gpio = GPIO
+        self.BCM = GPIO.BCM
+        self.OUT = GPIO.OUT
+        self.IN = GPIO.IN
+        self.LOW = GPIO.LOW
+        self.HIGH = GPIO.HIGH
+        self.RISING = GPIO.RISING
+        self.FALLING = GPIO.FALLING
+        self.BOTH = GPIO.BOTH
+
+    def setmode(self, mode):
+        self._gpio.setmode(mode)
+
+    def setwarnings(self, flag):
+        self._gpio.setwarnings(flag)
+
+    def setup(self, channel, direction):
+        self._gpio.setup(channel, direction)
+
+    def output(self, channel, value):
+        self._gpio.output(channel, value)
+
+    def input(self, channel):
+        return self._gpio.input(channel)
+
+    def PWM(self, channel, frequency):
+        return self._gpio.PWM(channel, frequency)
+
+    def add_event_detect(self, channel, edge, callback=None):
+        self._gpio.add_event_detect(channel, edge, callback=callback)
+
+    def cleanup(self):
+        self._gpio.cleanup()
+
+
+class PinShadow:
+    """
+    输出引脚影子寄存器 - 记录每个输出引脚最后写入的电平，丢弃不改变电平的写入，
+    同时变化的多个引脚合并为一次列表形式的 output 调用
+    提供与GPIO后端相同的 output/HIGH/LOW，可以直接交给 ActuatorEngine 使用
+    """
+
+    def __init__(self, gpio):
+        """
+        :param gpio: GPIO后端
+        """
+        self.gpio = gpio
+        self.HIGH = gpio.HIGH
+        self.LOW = gpio.LOW
+        self._levels = {}  # 引脚 -> 最后写入的电平，没有记录表示未知
+        self._lock = threading.Lock()  # 执行器定时线程与控制线程共用，写后端和更新影子状态不可分
+        self.writes = 0  # 实际调用后端 output 的次数
+        self.dropped = 0  # 因电平未变被丢弃的引脚写入次数
+
+    def level(self, channel):
+        """引脚最后写入的电平，未知时返回 None"""
+        return self._levels.get(channel)
+
+    def output(self, channel, value, force=False):
+        """
+        写入一个或多个引脚，参数形式与 RPi.GPIO.output 相同
+        :param channel: 引脚或引脚列表，列表按顺序写入
+        :param value: 电平，或与引脚列表等长的电平列表
+        :param force: 不论影子状态都写入，用于紧急停止等不能依赖记录的场合
+        """
+        channels = list(channel) if isinstance(channel, (list, tuple)) else [channel]
+        values = list(value) if isinstance(value, (list, tuple)) else [value] * len(channels)
+        if len(values) != len(channels):
+            raise ValueError(f"引脚数 {len(channels)} 与电平数 {len(values)} 不一致")
+
+        with self._lock:
+            pins = []
+            levels = []
+            for pin, level in zip(channels, values):
+                if not force and self._levels.get(pin) == level:
+                    self.dropped += 1
+                    continue
+                pins.append(pin)
+                levels.append(level)
+            if not pins:
+                return
+            if len(pins) == 1:
+                self.gpio.output(pins[0], levels[0])
+            else:
+                self.gpio.output(pins, levels)
+            self._levels.update(zip(pins, levels))
+            self.writes += 1
+
+    def invalidate(self):
+        """GPIO被清理或重新初始化后，所有引脚电平视为未知"""
+        with self._lock:
+            self._levels.clear()
+
+
+def create_backend(name=None):
+    """
+    按名称创建GPIO后端
+    :param name: 'rpi' 或 'sim'，默认读取环境变量 ROBOT_GPIO_BACKEND，未设置时为 'rpi'
+    :return: GPIOBackend 实例
+    """
+    name = name or os.environ.get('ROBOT_GPIO_BACKEND', 'rpi')
+    if name == 'rpi':
+        return RPiGPIOBackend()
+    if name == 'sim':
+        from sim_backend import SimulatedGPIO
+        logger.info("使用仿真GPIO后端")
+        return SimulatedGPIO()
+    raise ValueError(f"未知的GPIO后端: {name}")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+超声波后台采样器 - 固定频率测距，环形缓冲区保存样本，常数时间读取滤波后的高度
+"""
+
+import threading
+import logging
+from array import array
+
+from robot import NoEcho
+
+logger = logging.getLogger(__name__)
+
+
+class HeightSampler:
+    def __init__(self, robot, rate_hz=15.0, buffer_size=64, median_window=5, ema_alpha=0.3):
+        """
+        初始化后台采样器
+        :param robot: ClimbingRobot 实例，使用其 get_current_height 测距
+        :param rate_hz: 采样频率 (Hz)，HC-SR04 建议不超过约16Hz
+        :param buffer_size: 环形缓冲区容量（样本数）
+        :param median_window: 中值滤波窗口（最近N个样本）
+        :param ema_alpha: 指数滑动平均系数 (0-1)，越大越跟随新样本
+        """
+        if median_window > buffer_size:
+            raise ValueError("中值滤波窗口不能大于缓冲区容量")
+
+        self.robot = robot
+        self.period = 1.0 / rate_hz
+        self.buffer_size = buffer_size
+        self.median_window = median_window
+        self.ema_alpha = ema_alpha
+
+        # 预分配的环形缓冲区：高度 (cm) 和单调时钟时间戳 (秒)
+        self._heights = array('d', [0.0] * buffer_size)
+        self._times = array('d', [0.0] * buffer_size)
+        self._count = 0  # 累计写入的有效样本数
+        self._sum = 0.0  # 缓冲区内样本之和（用于常数时间方差）
+        self._sum_sq = 0.0  # 缓冲区内样本平方和
+
+        # 每次写入时更新的滤波结果，读取时直接返回
+        self._median = None
+        self._ema = None
+        self._last_time = None
+        self.miss_count = 0  # 无回声次数
+
+        self.clock = robot.clock
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._periodic = None
+
+    def start(self):
+        """
+        启动后台采样
+        系统时钟下为独立线程；虚拟时钟下为周期定时器，在控制线程等待时执行
+        """
+        if self._periodic is not None:
+            return
+        self._periodic = self.clock.start_periodic(self.period, self._sample_once, "height-sampler")
+        logger.info(f"超声波后台采样启动，频率: {1.0 / self.period:.1f}Hz")
+
+    def stop(self):
+        """停止后台采样"""
+        if self._periodic is not None:
+            self._periodic.cancel()
+            self._periodic = None
+        logger.info(f"超声波后台采样停止，有效样本: {self._count}，无回声: {self.miss_count}")
+
+    def wait_ready(self, timeout=2.0):
+        """等待第一个有效样本，返回是否就绪"""
+        return self.clock.wait(self._ready, timeout)
+
+    def _sample_once(self):
+        """触发一次测距；控制线程正在直接测距时跳过本次"""
+        height = self.robot.get_current_height(blocking=False)
+        if isinstance(height, NoEcho):
+            if height.attempts:
+                self.miss_count += 1
+        else:
+            self.push(self.clock.monotonic(), height)
+
+    def push(self, timestamp, height):
+        """
+        写入一个样本并更新滤波结果 - 与缓冲区大小无关的常数时间
+        后台线程之外的采样源（如asyncio任务）也可以直接调用
+        :param timestamp: clock.monotonic() 时间戳
+        :param height: 高度 (cm)
+        """
+        with self._lock:
+            index = self._count % self.buffer_size
+            if self._count >= self.buffer_size:
+                old = self._heights[index]
+                self._sum -= old
+                self._sum_sq -= old * old
+
+            self._heights[index] = height
+            self._times[index] = timestamp
+            self._sum += height
+            self._sum_sq += height * height
+            self._count += 1
+
+            # 最近 median_window 个样本的中值（窗口固定，代价为常数）
+            window = min(self._count, self.median_window)
+            recent = sorted(self._heights[(self._count - 1 - i) % self.buffer_size] for i in range(window))
+            if window % 2:
+                self._median = recent[window // 2]
+            else:
+                self._median = (recent[window // 2 - 1] + recent[window // 2]) / 2
+
+            # 对中值结果再做指数滑动平均
+            if self._ema is None:
+                self._ema = self._median
+            else:
+                self._ema += self.ema_alpha * (self._median - self._ema)
+
+            self._last_time = timestamp
+
+        self._ready.set()
+
+    def latest(self):
+        """最新原始样本 (cm)，尚无样本时返回 None"""
+        with self._lock:
+            if self._count == 0:
+                return None
+            return self._heights[(self._count - 1) % self.buffer_size]
+
+    def median_height(self):
+        """中值滤波后的高度 (cm)，尚无样本时返回 None"""
+        return self._median
+
+    def ema_height(self):
+        """中值+指数滑动平均滤波后的高度 (cm)，尚无样本时返回 None"""
+        return self._ema
+
+    def age(self):
+        """最新样本距今的时间（秒），尚无样本时返回 None"""
+        last_time = self._last_time
+        if last_time is None:
+            return None
+        return self.clock.monotonic() - last_time
+
+    def variance(self):
+        """缓冲区内样本的方差 (cm²)"""
+        with self._lock:
+            n = min(self._count, self.buffer_size)
+            if n < 2:
+                return 0.0
+            mean = self._sum / n
+            return max(self._sum_sq / n - mean * mean, 0.0)
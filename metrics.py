@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+运行指标 - 进程内的计数器、数值和固定分桶直方图，回答测距耗时的 p99、继电器实际通电比请求多出多少、
+每步用时的分布等问题
+
+记录一次只做一次二分查找和加锁的累加，热路径上不分配对象、不格式化；
+指标以 Prometheus 文本格式通过 HTTP 提供（抓取端点），也可以定期写入JSON快照文件
+
+设置环境变量启用:
+    ROBOT_METRICS=0.0.0.0:9108 python3 up.py        # curl http://raspberrypi.local:9108/metrics
+    ROBOT_METRICS_FILE=metrics.json python3 up.py   # 每 ROBOT_METRICS_INTERVAL 秒（默认10）写一次，关机时再写一次
+也可以直接运行，显示快照文件中的分位数和计数:
+    python3 metrics.py metrics.json
+"""
+
+import os
+import json
+import time
+import bisect
+import argparse
+import threading
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)  # 快照中给出的分位数估计
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Counter:
+    """只增不减的计数"""
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()  # 定时器线程、采样线程和控制线程都会累加
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [('', (), self.value)]
+
+
+class Gauge:
+    """可以任意设置的数值"""
+    kind = 'gauge'
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self):
+        return [('', (), self.value)]
+
+
+class Histogram:
+    """固定分桶直方图，桶按上界 le（包含）计数"""
+    kind = 'histogram'
+
+    def __init__(self, buckets):
+        """
+        :param buckets: 各桶的上界，递增；另有一个 +Inf 桶
+        """
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)  # 各桶自己的计数，不累加
+        self.sum = 0.0
+        self.count = 0
+        self.min = float('inf')  # 分位数估计限制在实际出现过的范围内，避免桶很宽时插值偏离
+        self.max = float('-inf')
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """记录一个值"""
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        """:return: (各桶计数, 总和, 总数, 最小值, 最大值) 的一致副本"""
+        with self._lock:
+            return list(self.counts), self.sum, self.count, self.min, self.max
+
+    def quantile(self, q, snapshot=None):
+        """
+        按桶内线性插值估计分位数（与 Prometheus 的 histogram_quantile 相同），再限制在最小值和最大值之间
+        :param q: 0-1
+        :param snapshot: snapshot() 的结果，默认取当前值
+        :return: 估计值，没有数据时为 None
+        """
+        counts, _, count, low, high = snapshot or self.snapshot()
+        if count == 0:
+            return None
+        rank = q * count
+        cumulative = 0
+        estimate = high
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if index < len(self.bounds):
+                    upper = self.bounds[index]
+                    lower = self.bounds[index - 1] if index else min(0.0, upper)
+                    estimate = lower + (upper - lower) * (rank - cumulative) / bucket_count
+                break
+            cumulative += bucket_count
+        return min(max(estimate, low), high)
+
+    def samples(self):
+        counts, total, count, _, _ = self.snapshot()
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + (float('inf'),), counts):
+            cumulative += bucket_count
+            samples.append(('_bucket', (('le', _format_value(bound)),), cumulative))
+        samples.append(('_sum', (), total))
+        samples.append(('_count', (), count))
+        return samples
+
+
+class MetricFamily:
+    """同名指标按标签值分开的一组"""
+
+    def __init__(self, name, help_text, kind, label_names, factory):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self._factory = factory
+        self.children = {}  # 标签值元组 -> 指标
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        取出一组标签值对应的指标，第一次使用时创建；热路径上应预先取出并保存
+        :param values: 与 label_names 对应的标签值
+        """
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} 需要标签 {self.label_names}，得到 {values}")
+            with self._lock:
+                child = self.children.setdefault(values, self._factory())
+        return child
+
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, labels=()):
+        """
+        :return: 没有标签时为 Counter，否则为 MetricFamily（用 labels() 取出 Counter）
+        """
+        return self._get(name, help_text, 'counter', labels, Counter)
+
+    def gauge(self, name, help_text, labels=()):
+        """:return: 没有标签时为 Gauge，否则为 MetricFamily"""
+        return self._get(name, help_text, 'gauge', labels, Gauge)
+
+    def histogram(self, name, help_text, buckets, labels=()):
+        """
+        :param buckets: 各桶的上界
+        :return: 没有标签时为 Histogram，否则为 MetricFamily
+        """
+        buckets = tuple(buckets)
+        return self._get(name, help_text, 'histogram', labels, lambda: Histogram(buckets))
+
+    def _get(self, name, help_text, kind, labels, factory):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = MetricFamily(name, help_text, kind, labels, factory)
+            elif family.kind != kind or family.label_names != tuple(labels):
+                raise ValueError(f"指标 {name} 已注册为 {family.kind} {family.label_names}")
+        return family if labels else family.labels()
+
+    def families(self):
+        with self._lock:
+            return list(self._families.values())
+
+    def render(self):
+        """:return: Prometheus 文本格式"""
+        lines = []
+        for family in self.families():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, child in list(family.children.items()):
+                base = tuple(zip(family.label_names, values))
+                for suffix, extra, value in child.samples():
+                    lines.append(f"{family.name}{suffix}{_format_labels(base + extra)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """:return: 可写成JSON的快照，直方图另给出分位数估计"""
+        metrics = {}
+        for family in self.families():
+            entries = []
+            for values, child in list(family.children.items()):
+                entry = {'labels': dict(zip(family.label_names, values))}
+                if family.kind == 'histogram':
+                    snapshot = child.snapshot()
+                    counts, total, count, low, high = snapshot
+                    entry.update(count=count, sum=total, min=low if count else None, max=high if count else None,
+                                 buckets=[[bound, bucket_count] for bound, bucket_count
+                                          in zip(list(child.bounds) + ['+Inf'], counts)])
+                    for q in QUANTILES:
+                        entry[f'p{round(q * 100)}'] = child.quantile(q, snapshot)
+                else:
+                    entry['value'] = child.value
+                entries.append(entry)
+            metrics[family.name] = {'type': family.kind, 'help': family.help, 'samples': entries}
+        return {'time': time.time(), 'metrics': metrics}
+
+    def write_snapshot(self, path):
+        """把快照写入文件；先写临时文件再改名，读取者不会看到写了一半的文件"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{name}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsServer:
+    """HTTP 抓取端点，GET /metrics 返回 Prometheus 文本格式，在自己的线程中运行"""
+
+    def __init__(self, registry, address):
+        """
+        开始监听，失败时抛出 OSError
+        :param registry: MetricsRegistry
+        :param address: 'host:port' 或 'port'（只监听本机）
+        """
+        host, _, port = address.rpartition(':')
+        self.registry = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split('?')[0] not in ('/metrics', '/'):
+                    handler.send_error(404)
+                    return
+                body = registry.render().encode()
+                handler.send_response(200)
+                handler.send_header('Content-Type', CONTENT_TYPE)
+                handler.send_header('Content-Length', str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), Handler)
+        self.server.daemon_threads = True
+        self.address = '%s:%d' % self.server.server_address[:2]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        logger.info(f"指标端点: http://{self.address}/metrics")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join(timeout=2.0)
+
+
+class SnapshotWriter:
+    """定期把指标快照写入文件的后台线程"""
+
+    def __init__(self, registry, path, interval=10.0):
+        """
+        :param registry: MetricsRegistry
+        :param path: 快照文件路径
+        :param interval: 写入周期（秒）
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.registry.write_snapshot(self.path)
+        except OSError as e:
+            logger.warning(f"无法写入指标快照 {self.path}: {e}")
+
+    def close(self):
+        """停止定期写入，再写最后一次"""
+        self._stop_event.set()
+        self._thread.join(timeout=2.0)
+        self.write()
+
+
+def format_snapshot(snapshot):
+    """把快照渲染为可读文本，每个指标一行"""
+    lines = []
+    for name, metric in snapshot['metrics'].items():
+        for sample in metric['samples']:
+            labels = ','.join(f"{key}={value}" for key, value in sample['labels'].items())
+            label = f"{name}{{{labels}}}" if labels else name
+            if metric['type'] == 'histogram':
+                if not sample['count']:
+                    continue
+                quantiles = '  '.join(f"p{round(q * 100)} {sample[f'p{round(q * 100)}']:.6g}" for q in QUANTILES)
+                lines.append(f"{label:<60} n {sample['count']:<6} 平均 {sample['sum'] / sample['count']:<10.6g} "
+                             f"{quantiles}  最大 {sample['max']:.6g}")
+            else:
+                lines.append(f"{label:<60} {sample['value']:.6g}")
+    return '\n'.join(lines)
+
+
+def main():
+    """显示指标快照文件"""
+    parser = argparse.ArgumentParser(description='显示指标快照')
+    parser.add_argument('path', nargs='?', default=os.environ.get('ROBOT_METRICS_FILE') or 'metrics.json',
+                        help='快照文件，默认读取环境变量 ROBOT_METRICS_FILE')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"文件不存在: {args.path}")
+    with open(args.path) as f:
+        snapshot = json.load(f)
+    print(f"快照时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot['time']))}")
+    print(format_snapshot(snapshot))
+
+
+if __name__ == "__main__":
+    main()
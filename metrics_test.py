@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+测试运行指标 - 测量计数和直方图记录一次的用时（热路径开销），多线程同时记录后检查总数不丢，
+用已知分布检查分位数估计落在实际分位数所在的桶内，并从 HTTP 端点抓取一次检查文本格式
+
+    python3 metrics_test.py
+    python3 metrics_test.py -n 200000 --max-observe 5
+"""
+
+import sys
+import time
+import bisect
+import random
+import logging
+import argparse
+import threading
+import urllib.request
+
+from metrics import MetricsRegistry, MetricsServer
+from robot import RANGING_BUCKETS
+
+# 配置日志
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def measure_overhead(n):
+    """
+    :return: (计数一次的用时, 直方图记录一次的用时)，微秒，已减去空循环的用时
+    """
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', '测试计数')
+    histogram = registry.histogram('test_seconds', '测试直方图', RANGING_BUCKETS)
+    values = [random.uniform(0.0, 0.6) for _ in range(1024)]
+
+    def run(action):
+        start = time.perf_counter()
+        for i in range(n):
+            action(values[i & 1023])
+        return time.perf_counter() - start
+
+    baseline = run(lambda value: None)
+    inc = run(lambda value: counter.inc())
+    observe = run(histogram.observe)
+    return (inc - baseline) / n * 1e6, (observe - baseline) / n * 1e6
+
+
+def check_concurrent(threads, n):
+    """多个线程同时记录同一个直方图和计数，:return: 丢失的记录数"""
+    registry = MetricsRegistry()
+    counter = registry.counter('test_total', '测试计数', labels=('name',))
+    histogram = registry.histogram('test_seconds', '测试直方图', RANGING_BUCKETS)
+
+    def worker():
+        child = counter.labels('shared')  # 各线程各自取出，同时检查并发创建只得到一个
+        for i in range(n):
+            child.inc()
+            histogram.observe(i * 1e-5)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    counts, _, count, _, _ = histogram.snapshot()
+    expected = threads * n
+    return (expected - counter.labels('shared').value) + (expected - count) + (expected - sum(counts))
+
+
+def check_quantiles(n):
+    """
+    指数分布（均值 5ms）的分位数估计
+    :return: [(分位数, 估计值, 实际值, 是否在同一个桶内)]
+    """
+    registry = MetricsRegistry()
+    histogram = registry.histogram('test_seconds', '测试直方图', RANGING_BUCKETS)
+    rng = random.Random(0)
+    values = sorted(rng.expovariate(200.0) for _ in range(n))
+    for value in values:
+        histogram.observe(value)
+    results = []
+    for q in (0.5, 0.9, 0.99):
+        estimate, actual = histogram.quantile(q), values[int(q * n) - 1]
+        same = bisect.bisect_left(RANGING_BUCKETS, estimate) == bisect.bisect_left(RANGING_BUCKETS, actual)
+        results.append((q, estimate, actual, same))
+    return results
+
+
+def check_scrape():
+    """:return: 从 HTTP 端点抓取的文本"""
+    registry = MetricsRegistry()
+    registry.counter('test_total', '测试计数', labels=('name',)).labels('a"b').inc(3)
+    registry.histogram('test_seconds', '测试直方图', (0.1, 1.0)).observe(0.5)
+    server = MetricsServer(registry, '127.0.0.1:0')
+    try:
+        with urllib.request.urlopen(f"http://{server.address}/metrics", timeout=2.0) as response:
+            return response.read().decode()
+    finally:
+        server.close()
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='运行指标测试程序')
+    parser.add_argument('-n', '--count', type=int, default=100000,
+                        help='测量开销和分位数时的记录次数，并发测试中各线程平分')
+    parser.add_argument('--threads', type=int, default=8, help='并发记录的线程数')
+    parser.add_argument('--max-observe', type=float, default=10.0, help='直方图记录一次的用时上限（微秒）')
+
+    args = parser.parse_args()
+
+    print("运行指标测试程序")
+    print("测量记录开销，检查并发记录、分位数估计和抓取端点")
+    print("")
+
+    failures = []
+    inc, observe = measure_overhead(args.count)
+    print(f"开销: 计数 {inc:.2f}us/次，直方图 {observe:.2f}us/次")
+    if observe > args.max_observe:
+        failures.append(f"直方图记录一次 {observe:.2f}us 超过 {args.max_observe}us")
+
+    lost = check_concurrent(args.threads, args.count // args.threads)
+    print(f"并发: {args.threads} 个线程，丢失 {lost:.0f} 次记录")
+    if lost:
+        failures.append(f"并发记录丢失 {lost:.0f} 次")
+
+    for q, estimate, actual, same in check_quantiles(args.count):
+        print(f"分位数: p{round(q * 100):<3} 估计 {estimate * 1000:.3f}ms，实际 {actual * 1000:.3f}ms")
+        if not same:
+            failures.append(f"p{round(q * 100)} 估计 {estimate * 1000:.3f}ms 不在实际值所在的桶内")
+
+    text = check_scrape()
+    expected = ['# TYPE test_total counter', 'test_total{name="a\\"b"} 3', 'test_seconds_bucket{le="0.1"} 0',
+                'test_seconds_bucket{le="1"} 1', 'test_seconds_bucket{le="+Inf"} 1', 'test_seconds_count 1']
+    missing = [line for line in expected if line not in text.splitlines()]
+    print(f"抓取: {len(text.splitlines())} 行")
+    if missing:
+        failures.append(f"抓取结果缺少 {missing}")
+
+    print("")
+    if failures:
+        for failure in failures:
+            print(f"失败 {failure}")
+        sys.exit(1)
+    print("通过: 记录开销在上限以内，并发不丢记录，分位数估计落在正确的桶内，抓取格式正确")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+任务存档 - 按列存储一次攀爬任务的超声波样本、继电器边沿、舵机占空比、PID输出和每步开始
+每一列是任务目录下的一个定长二进制文件，写入时按大块追加；读取时用 numpy.memmap 直接映射，不复制数据
+超声波的时间和高度列做差分编码，读取时累加还原
+
+也可以直接运行，打印一个任务目录的概要:
+    python3 mission_archive.py missions/mission-20250101-120000
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from array import array
+
+from tracer import EV_ACTUATOR_ON, EV_ACTUATOR_OFF, EV_ACTUATOR_CANCEL, EV_SERVO, EV_HEIGHT, EV_PID_OUTPUT, \
+    EV_STEP_START
+
+try:
+    import numpy as np
+except ImportError:  # 只有读取存档需要 numpy，机器人上写存档不需要
+    np = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# 数据流 -> [(列名, array类型码, 编码)]；编码为 None 表示原值，('delta', 量化单位) 表示量化后差分
+STREAMS = {
+    'ultrasonic': [('time', 'i', ('delta', 1e-6)), ('height', 'i', ('delta', 0.01))],
+    'relay': [('time', 'd', None), ('pin', 'B', None), ('level', 'B', None)],
+    'servo': [('time', 'd', None), ('pin', 'B', None), ('duty', 'd', None)],
+    'pid': [('time', 'd', None), ('step', 'H', None), ('output', 'd', None)],
+    'step': [('time', 'd', None), ('step', 'H', None), ('movement_time', 'd', None)],
+}
+
+# array类型码 -> numpy dtype（小端）
+DTYPES = {'B': '<u1', 'H': '<u2', 'i': '<i4', 'd': '<f8'}
+
+
+def column_path(path, stream, column):
+    return os.path.join(path, f'{stream}.{column}.bin')
+
+
+def create_mission_dir(archive_dir):
+    """
+    在存档目录下创建本次任务的目录 mission-%Y%m%d-%H%M%S
+    同一秒内已有任务目录时依次加后缀 -2、-3……，目录用 os.mkdir 独占创建，两个任务不会共用一个目录
+    :param archive_dir: 存档目录，不存在时创建
+    :return: 新建的任务目录
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    base = os.path.join(archive_dir, time.strftime('mission-%Y%m%d-%H%M%S'))
+    path, suffix = base, 1
+    while True:
+        try:
+            os.mkdir(path)
+            return path
+        except FileExistsError:
+            suffix += 1
+            path = f"{base}-{suffix}"
+
+
+class MissionWriter:
+    def __init__(self, path, t0=0.0, chunk_rows=4096, pin_names=None, servo_neutral_duty=7.5,
+                 servo_degree_ratio=18.0):
+        """
+        创建任务存档
+        :param path: 任务目录，不存在时创建（见 create_mission_dir）；目录中已有存档时抛出 FileExistsError
+        :param t0: 任务开始时刻 (clock.monotonic)，存档中的时间都相对该时刻
+        :param chunk_rows: 每列缓冲多少行后追加写入一次
+        :param pin_names: 引脚 -> 名称，写入元数据
+        :param servo_neutral_duty: 舵机中性位置占空比，用于把舵机角度事件换算为占空比
+        :param servo_degree_ratio: 舵机角度转换比例
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.t0 = t0
+        self.chunk_rows = chunk_rows
+        self.servo_neutral_duty = servo_neutral_duty
+        self.servo_degree_ratio = servo_degree_ratio
+
+        self._buffers = {stream: [array(code) for _, code, _ in columns] for stream, columns in STREAMS.items()}
+        # 列文件独占创建，不会追加到另一个任务的存档后面
+        self._files = {stream: [open(column_path(path, stream, name), 'xb') for name, _, _ in columns]
+                       for stream, columns in STREAMS.items()}
+        self._last = {}  # (数据流, 列名) -> 上一个量化值，差分编码用
+        self.rows = {stream: 0 for stream in STREAMS}
+
+        self.meta = {
+            'version': FORMAT_VERSION,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            't0': t0,
+            'pin_names': {str(pin): name for pin, name in (pin_names or {}).items()},
+            'streams': {stream: [{'name': name, 'dtype': DTYPES[code], 'encoding': encoding and encoding[0],
+                                  'scale': encoding[1] if encoding else None}
+                                 for name, code, encoding in columns]
+                        for stream, columns in STREAMS.items()},
+        }
+        self._write_meta()
+
+    def _write_meta(self):
+        self.meta['rows'] = self.rows
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2, ensure_ascii=False)
+
+    def append(self, stream, *values):
+        """
+        追加一行
+        :param stream: 'ultrasonic' / 'relay' / 'servo' / 'pid'
+        :param values: 按 STREAMS 中的列顺序；时间为 clock.monotonic() 时刻
+        """
+        buffers = self._buffers[stream]
+        for (name, _, encoding), buffer, value in zip(STREAMS[stream], buffers, values):
+            if name == 'time':
+                value -= self.t0
+            if encoding is not None:
+                quantized = round(value / encoding[1])
+                key = (stream, name)
+                value = quantized - self._last.get(key, 0)
+                self._last[key] = quantized
+            buffer.append(value)
+        self.rows[stream] += 1
+        if len(buffers[0]) >= self.chunk_rows:
+            self._flush_stream(stream)
+
+    def _flush_stream(self, stream):
+        for buffer, f in zip(self._buffers[stream], self._files[stream]):
+            if sys.byteorder != 'little':
+                buffer.byteswap()
+            buffer.tofile(f)
+            f.flush()
+            del buffer[:]
+
+    def flush(self):
+        """把所有缓冲的行写入文件"""
+        for stream in STREAMS:
+            self._flush_stream(stream)
+
+    def close(self):
+        self.flush()
+        for files in self._files.values():
+            for f in files:
+                f.close()
+        self._write_meta()
+
+    # 作为 EventTracer 输出端使用
+    def write(self, records):
+        """把追踪事件写入对应的数据流"""
+        for timestamp, event, pin, value in records:
+            if event == EV_HEIGHT:
+                self.append('ultrasonic', timestamp, value)
+            elif event == EV_ACTUATOR_ON:
+                self.append('relay', timestamp, pin, 1)
+            elif event == EV_ACTUATOR_OFF or event == EV_ACTUATOR_CANCEL:
+                self.append('relay', timestamp, pin, 0)
+            elif event == EV_SERVO:
+                self.append('servo', timestamp, pin, self.servo_neutral_duty + value / self.servo_degree_ratio)
+            elif event == EV_PID_OUTPUT:
+                self.append('pid', timestamp, pin, value)
+            elif event == EV_STEP_START:
+                self.append('step', timestamp, pin, value)
+
+
+def _map_column(path, stream, column, rows):
+    """把一列映射为 numpy 数组（零拷贝）"""
+    dtype = np.dtype(column['dtype'])
+    filename = column_path(path, stream, column['name'])
+    if rows == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r', shape=(rows,))
+
+
+def load_mission(path):
+    """
+    读取任务存档
+    原值列直接映射文件，不复制；差分列累加还原为 float64（时间为相对 t0 的秒数，高度为 cm）
+    :param path: 任务目录
+    :return: {数据流: {列名: numpy数组}}，另含 'meta'
+    """
+    if np is None:
+        raise RuntimeError("读取任务存档需要安装 numpy")
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"不支持的存档版本: {meta.get('version')}")
+
+    mission = {'meta': meta}
+    for stream, columns in meta['streams'].items():
+        # 以文件大小为准，异常退出时元数据中的行数可能没有更新；各列取最短的完整行数
+        rows = min(os.path.getsize(column_path(path, stream, c['name'])) // np.dtype(c['dtype']).itemsize
+                   for c in columns)
+        data = {}
+        for column in columns:
+            values = _map_column(path, stream, column, rows)
+            if column['encoding'] == 'delta':
+                values = np.cumsum(values, dtype=np.int64) * column['scale']
+            data[column['name']] = values
+        mission[stream] = data
+    return mission
+
+
+def main():
+    """打印任务存档概要"""
+    parser = argparse.ArgumentParser(description='任务存档概要')
+    parser.add_argument('path', help='任务目录')
+    args = parser.parse_args()
+
+    mission = load_mission(args.path)
+    meta = mission['meta']
+    print(f"任务: {args.path} (创建于 {meta['created']})")
+    size = sum(os.path.getsize(os.path.join(args.path, name)) for name in os.listdir(args.path))
+    print(f"存档大小: {size / 1024:.1f}KB")
+    for stream in STREAMS:
+        data = mission[stream]
+        times = data['time']
+        if len(times):
+            print(f"  {stream}: {len(times)} 行, {times[0]:.2f}s -> {times[-1]:.2f}s")
+        else:
+            print(f"  {stream}: 0 行")
+    heights = mission['ultrasonic']['height']
+    if len(heights):
+        print(f"高度范围: {heights.min():.2f}cm -> {heights.max():.2f}cm")
+
+
+if __name__ == "__main__":
+    main()
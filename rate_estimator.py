@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+竖直杆速度在线估计 - 每走一步用 (竖直杆通电时间, 实测高度变化) 更新递推最小二乘模型
+高度变化 = 速度 * (通电时间 - 延迟)，带遗忘因子，气源压力下降、温度和磨损引起的速度变化会被逐步跟踪
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StrokeRateEstimator:
+    def __init__(self, rate=1.0, dead_time=0.0, forgetting=0.9, rate_variance=1.0, offset_variance=0.25,
+                 max_variance=100.0, outlier_threshold=4.0, min_rate=0.1, max_rate=10.0):
+        """
+        初始化估计器
+        :param rate: 初始速度估计 (cm/s)，一般取标定值
+        :param dead_time: 初始延迟估计（秒）
+        :param forgetting: 遗忘因子 (0-1]，越小越快跟随新样本
+        :param rate_variance: 初始速度估计的方差
+        :param offset_variance: 初始截距 (cm) 估计的方差；连续攀爬各步通电时间相同，截距主要靠先验约束
+        :param max_variance: 协方差迹的上限，防止通电时间长期不变时协方差发散
+        :param outlier_threshold: 预测误差超过该值 (cm) 的样本视为打滑或测距异常，不参与更新
+        :param min_rate: 速度估计下限 (cm/s)
+        :param max_rate: 速度估计上限 (cm/s)
+        """
+        self.forgetting = forgetting
+        self.max_variance = max_variance
+        self.outlier_threshold = outlier_threshold
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+
+        # 模型 高度变化 = a * 通电时间 + b，其中 a 为速度，b = -速度 * 延迟
+        self._a = rate
+        self._b = -rate * dead_time
+        self._p = [[rate_variance, 0.0], [0.0, offset_variance]]
+        self.samples = 0  # 已采用的样本数
+        self.rejected = 0  # 连续被判为异常的样本数
+
+    @property
+    def rate(self):
+        """当前速度估计 (cm/s)"""
+        return self._a
+
+    @property
+    def dead_time(self):
+        """当前延迟估计（秒）"""
+        return max(-self._b / self._a, 0.0)
+
+    def displacement(self, on_time):
+        """预测通电 on_time 秒的高度变化 (cm)"""
+        return max(on_time - self.dead_time, 0.0) * self._a
+
+    def time_for(self, distance):
+        """移动 distance (cm) 所需的通电时间（秒）"""
+        return distance / self._a + self.dead_time
+
+    def update(self, on_time, displacement):
+        """
+        用一步的实测结果更新模型
+        :param on_time: 本步竖直杆通电时间（秒）
+        :param displacement: 本步实测高度变化 (cm)，按运动方向取正
+        :return: 是否采用了该样本
+        """
+        error = displacement - (self._a * on_time + self._b)
+        # 连续多次异常说明速度确实变了，此时仍然采用，避免估计永远停在旧值
+        if displacement <= 0 or (abs(error) > self.outlier_threshold and self.rejected < 2):
+            self.rejected += 1
+            logger.warning(f"速度估计忽略异常样本: 通电 {on_time:.2f}秒, 移动 {displacement:.2f}cm")
+            return False
+        self.rejected = 0
+
+        (p00, p01), (p10, p11) = self._p
+        # 增益 k = P φ / (λ + φᵀ P φ)，φ = [通电时间, 1]
+        pp0 = p00 * on_time + p01
+        pp1 = p10 * on_time + p11
+        denominator = self.forgetting + on_time * pp0 + pp1
+        k0 = pp0 / denominator
+        k1 = pp1 / denominator
+
+        self._a += k0 * error
+        self._b += k1 * error
+
+        # P = (P - k φᵀ P) / λ
+        p00 = (p00 - k0 * pp0) / self.forgetting
+        p01 = (p01 - k0 * pp1) / self.forgetting
+        p10 = (p10 - k1 * pp0) / self.forgetting
+        p11 = (p11 - k1 * pp1) / self.forgetting
+        trace = p00 + p11
+        if trace > self.max_variance:
+            scale = self.max_variance / trace
+            p00, p01, p10, p11 = p00 * scale, p01 * scale, p10 * scale, p11 * scale
+        self._p = [[p00, p01], [p10, p11]]
+
+        # 速度限制在合理范围内；截距不允许为正（延迟不能为负）
+        self._a = min(max(self._a, self.min_rate), self.max_rate)
+        self._b = min(self._b, 0.0)
+        self.samples += 1
+        return True
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+实时运行模式 - 控制进程独占一个CPU核心、使用实时调度策略、锁定内存并调整垃圾回收；
+日志和事件输出移到独立的日志进程，控制进程只把日志记录放入队列、把事件写入共享内存中的环形缓冲区，
+文件和终端的写入不再占用控制进程的时间
+
+每一项设置在权限不足时只记录警告并跳过，普通用户也可以使用该模式（只有CPU绑定和垃圾回收设置生效）:
+    sudo python3 up.py --realtime
+    python3 down.py --realtime --rt-cpu 2 --rt-priority 60
+"""
+
+import os
+import gc
+import sys
+import queue
+import signal
+import ctypes
+import ctypes.util
+import logging
+import logging.handlers
+import resource
+import multiprocessing
+from multiprocessing import shared_memory
+
+from clock import timer_thread
+
+logger = logging.getLogger(__name__)
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+# 控制进程绑定的CPU之外、其他进程（日志进程、看门狗）应该使用的CPU，由 configure_realtime 设置，子进程继承
+IO_CPUS_ENV = 'ROBOT_IO_CPUS'
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def control_cpu(cpu=None):
+    """
+    选择控制进程独占的CPU
+    :param cpu: 指定的CPU编号，默认为可用CPU中编号最大的一个（系统中断和大多数后台任务在 CPU0 上）
+    :return: CPU编号
+    """
+    available = sorted(os.sched_getaffinity(0))
+    if cpu is None:
+        return available[-1]
+    if cpu not in available:
+        raise ValueError(f"CPU {cpu} 不可用，可用: {available}")
+    return cpu
+
+
+def leave_control_cpu(cpus=None):
+    """
+    把当前进程移出控制进程的CPU（日志进程、看门狗启动时调用）
+    :param cpus: 可以使用的CPU，默认读取环境变量 ROBOT_IO_CPUS，未设置时什么都不做
+    """
+    if cpus is None:
+        value = os.environ.get(IO_CPUS_ENV)
+        if not value:
+            return
+        cpus = {int(cpu) for cpu in value.split(',')}
+    if not cpus:
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+    except OSError as e:
+        logger.warning(f"无法移出控制进程的CPU: {e}")
+
+
+def configure_realtime(cpu, priority=50, lock_memory=True, gc_threshold=50000, switch_interval=0.001):
+    """
+    设置当前进程为实时控制进程，应在创建机器人和其他线程之前、在主线程中调用，之后创建的线程继承这些设置
+    :param cpu: 独占的CPU编号（见 control_cpu）
+    :param priority: SCHED_FIFO 优先级 (1-99)，0 表示不改调度策略
+    :param lock_memory: 是否用 mlockall 锁定当前和以后的内存，避免缺页换入造成的停顿
+    :param gc_threshold: 第0代垃圾回收阈值，启动时的对象冻结后不再参与回收，回收次数也随阈值减少
+    :param switch_interval: GIL切换间隔（秒），脉冲定时线程等待GIL的时间不超过该值
+    :return: 实际生效的设置 {'cpu', 'policy', 'memory_locked', 'gc_frozen', 'switch_interval'}
+    """
+    applied = {'cpu': None, 'policy': 'SCHED_OTHER', 'memory_locked': False, 'gc_frozen': 0,
+               'switch_interval': sys.getswitchinterval()}
+
+    others = os.sched_getaffinity(0) - {cpu}
+    try:
+        os.sched_setaffinity(0, {cpu})
+        applied['cpu'] = cpu
+        os.environ[IO_CPUS_ENV] = ','.join(map(str, sorted(others)))
+    except OSError as e:
+        logger.warning(f"无法绑定到 CPU {cpu}: {e}")
+
+    if priority:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+            applied['policy'] = f'SCHED_FIFO/{priority}'
+        except PermissionError:
+            logger.warning("没有实时调度权限（需要 root 或 CAP_SYS_NICE），保持普通调度")
+        except OSError as e:
+            logger.warning(f"无法设置实时调度: {e}")
+
+    if lock_memory:
+        applied['memory_locked'] = _lock_memory()
+
+    # 启动时创建的对象（模块、类、配置）不会变成垃圾，冻结后每次回收都不再遍历它们
+    gc.collect()
+    gc.freeze()
+    applied['gc_frozen'] = gc.get_freeze_count()
+    gen0, gen1, gen2 = gc.get_threshold()
+    gc.set_threshold(max(gen0, gc_threshold), gen1, gen2)
+
+    if switch_interval:
+        sys.setswitchinterval(switch_interval)
+        applied['switch_interval'] = switch_interval
+
+    # 脉冲定时的常驻线程在这里创建，继承上面的设置，第一个脉冲不再承担线程创建的开销
+    timer_thread()
+
+    logger.info(f"实时模式: CPU {applied['cpu']}, 调度 {applied['policy']}, "
+                f"内存锁定 {'是' if applied['memory_locked'] else '否'}, 冻结对象 {applied['gc_frozen']}, "
+                f"GIL切换间隔 {applied['switch_interval'] * 1000:.1f}ms")
+    return applied
+
+
+def start_realtime(cpu=None, priority=50):
+    """
+    按正确的顺序进入实时模式: 先启动不继承实时设置的日志进程，再设置本进程
+    :param cpu: 独占的CPU编号，默认见 control_cpu
+    :param priority: SCHED_FIFO 优先级，0 表示不改调度策略
+    :return: IOProcess，交给 ClimbingRobot(io_process=...)，结束时调用 close()
+    """
+    cpu = control_cpu(cpu)
+    io_process = IOProcess(cpus=os.sched_getaffinity(0) - {cpu})
+    configure_realtime(cpu, priority)
+    return io_process
+
+
+def _lock_memory():
+    """锁定当前和以后分配的全部内存，返回是否成功"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+    if os.geteuid() != 0 and soft != resource.RLIM_INFINITY:
+        # 带 MCL_FUTURE 锁定后，超过锁定上限的内存分配会直接失败，宁可不锁
+        logger.warning(f"内存锁定上限为 {soft // 1024}KB，不锁定内存（需要 root 或 ulimit -l unlimited）")
+        return False
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        logger.warning(f"无法锁定内存: {os.strerror(ctypes.get_errno())}")
+        return False
+    return True
+
+
+class IOProcess:
+    """
+    日志进程 - 接收控制进程的日志记录，并从共享内存中的事件环形缓冲区取出事件交给输出端
+    控制进程中的根日志处理器换成队列，终端和文件的写入都在日志进程中完成
+    """
+
+    def __init__(self, cpus=None, level=logging.INFO, log_format=LOG_FORMAT):
+        """
+        启动日志进程，应在 configure_realtime 之前创建，日志进程和队列的后台线程不继承实时设置
+        :param cpus: 日志进程使用的CPU，默认不限制
+        :param level: 日志级别
+        :param log_format: 日志格式
+        """
+        # 控制进程中可能已有GPIO回调等线程，用 spawn 而不是 fork
+        context = multiprocessing.get_context('spawn')
+        self._queue = context.Queue()  # 日志记录和命令共用一个队列，保持先后顺序
+        self._tracer_stopped = context.Event()
+        self._shm = None
+        self.process = context.Process(target=_io_main, name='robot-io', daemon=True,
+                                       args=(self._queue, self._tracer_stopped, cpus, level, log_format))
+        self.process.start()
+
+        root = logging.getLogger()
+        self._handlers = root.handlers[:]
+        for handler in self._handlers:
+            root.removeHandler(handler)
+        root.addHandler(logging.handlers.QueueHandler(self._queue))
+        # 第一条日志同时启动队列的后台写入线程，它在 configure_realtime 之前创建，不占用控制进程的CPU
+        logger.info(f"日志进程已启动 (pid {self.process.pid})")
+
+    def trace_buffer(self, size):
+        """
+        分配事件环形缓冲区的共享内存
+        :param size: 字节数（见 EventTracer.buffer_size）
+        :return: 可写的缓冲区，交给 EventTracer
+        """
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        return self._shm.buf
+
+    def start_tracer(self, tracer, sinks):
+        """
+        在日志进程中创建输出端并开始定期取出事件
+        :param tracer: 使用 trace_buffer 分配的缓冲区的 EventTracer
+        :param sinks: [(输出端类, 参数元组, 关键字参数字典)]，在日志进程中实例化
+        """
+        self._queue.put(('start_tracer', self._shm.name, tracer.capacity, tracer.flush_interval, sinks))
+
+    def stop_tracer(self, timeout=5.0):
+        """写出剩余事件并关闭输出端，等待日志进程完成"""
+        if self._shm is None:
+            return
+        self._tracer_stopped.clear()
+        self._queue.put(('stop_tracer',))
+        if not self._tracer_stopped.wait(timeout):
+            logger.warning("日志进程没有按时写完事件")
+
+    def close(self, timeout=5.0):
+        """恢复本进程的日志处理器，等待日志进程写完剩余日志后退出"""
+        self.stop_tracer(timeout)
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            if isinstance(handler, logging.handlers.QueueHandler):
+                root.removeHandler(handler)
+        for handler in self._handlers:
+            root.addHandler(handler)
+
+        self._queue.put(('exit',))
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.warning("日志进程没有按时退出")
+            self.process.terminate()
+        self._queue.close()
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _io_main(commands, tracer_stopped, cpus, level, log_format):
+    """日志进程主循环"""
+    from tracer import EventTracer
+
+    # 终端的 Ctrl+C 由控制进程处理，日志进程要写完控制进程关机过程中的日志
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+
+    # spawn 会重新导入启动脚本，robot.py 中的 basicConfig 已经加了一个处理器，换成这里唯一的一个
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(log_format))
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    parent = multiprocessing.parent_process()
+    tracer = None
+    shm = None
+    while True:
+        try:
+            item = commands.get(timeout=tracer.flush_interval if tracer else 0.5)
+        except queue.Empty:
+            if tracer is not None:
+                tracer.flush()
+            if not parent.is_alive():
+                # 控制进程被结束（如看门狗跳闸），写出共享内存中剩余的事件后退出
+                item = ('exit',)
+            else:
+                continue
+
+        if isinstance(item, logging.LogRecord):
+            handler.handle(item)
+        elif item[0] == 'start_tracer':
+            _, name, capacity, flush_interval, sinks = item
+            shm = shared_memory.SharedMemory(name=name)
+            tracer = EventTracer(None, capacity, flush_interval, buffer=shm.buf)
+            for sink_class, args, kwargs in sinks:
+                tracer.add_sink(sink_class(*args, **kwargs))
+        elif item[0] in ('stop_tracer', 'exit'):
+            if tracer is not None:
+                tracer.stop()
+                tracer = None
+                shm.close()
+            tracer_stopped.set()
+            if item[0] == 'exit':
+                return
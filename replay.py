@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+任务回放 - 用任务存档中记录的超声波高度轨迹代替传感器，在虚拟时钟下重新运行上升/下降控制器，
+并把新的决策（每步PID输出/移动时间、每步使用的一侧、停止位置）与存档中记录的决策逐项比较
+
+用法:
+    python3 replay.py missions/mission-20250101-120000 --direction up --target 120
+    python3 replay.py missions/* --direction down --target 60 -c
+"""
+
+import os
+import sys
+import json
+import logging
+import argparse
+from bisect import bisect_left
+
+from robot import ClimbingRobot
+from sim_backend import SimulatedGPIO
+from clock import VirtualClock
+from mission_archive import load_mission
+from tracer import EV_ACTUATOR_ON, EV_PID_OUTPUT, EV_STEP_START, EV_HEIGHT
+from up import UpClimbController
+from down import DownClimbController
+
+logger = logging.getLogger(__name__)
+
+# 每步开始时最先通电的径向杆决定本步移动的一侧
+SIDE_ACTUATORS = {'upper_radial_extend': 'upper', 'lower_radial_extend': 'lower'}
+
+
+class ReplayRobot(ClimbingRobot):
+    def __init__(self, times, heights, gpio=None, clock=None):
+        """
+        初始化回放机器人 - 执行器照常驱动（默认仿真后端），测距改为读取记录的高度轨迹
+        :param times: 记录的测距时刻（相对任务开始的秒数，升序）
+        :param heights: 对应的高度 (cm)
+        :param gpio: GPIO后端，默认仿真后端
+        :param clock: 时钟，默认虚拟时钟
+        """
+        clock = clock or VirtualClock()
+        self.trace_times = list(times)
+        self.trace_heights = list(heights)
+        self.trace_exhausted = False  # 控制器运行超出了记录的时间范围
+        self.ranging_window = 0.03  # 一次测距的最长用时（秒），约 4m 量程的往返时间
+        # 与存档的 t0 对应: 都在初始化GPIO之前取时刻
+        self.replay_t0 = clock.monotonic()
+        super().__init__(gpio=gpio or SimulatedGPIO(seed=0), clock=clock, state_file='', state_block='')
+
+    def get_current_height(self, blocking=True):
+        """
+        返回记录轨迹中的测距结果
+        存档的时刻是测距结束的时刻：当前时刻之后 ranging_window 内有记录时视为同一次测量，等到该时刻再返回，
+        与原任务一样消耗测距时间；否则返回之前最近的一次测距（与传感器一样保持到下一次测量）
+        """
+        if not self.trace_times:
+            raise RuntimeError("回放轨迹为空")
+        t = self.clock.monotonic() - self.replay_t0
+        j = bisect_left(self.trace_times, t)
+        if j < len(self.trace_times) and self.trace_times[j] - t <= self.ranging_window:
+            self.clock.sleep(self.trace_times[j] - t)
+            i = j
+        else:
+            i = max(j - 1, 0)
+        if i == len(self.trace_times) - 1 and t > self.trace_times[-1] + 1.0:
+            self.trace_exhausted = True
+        height = self.trace_heights[i]
+        self.last_height = (self.clock.monotonic(), height)
+        self.tracer.record(EV_HEIGHT, self.ultrasonic_echo_pin, height)
+        return height
+
+
+class DecisionRecorder:
+    """EventTracer 输出端 - 收集回放中的决策事件"""
+
+    def __init__(self, t0):
+        self.t0 = t0
+        self.pid = []  # [(时刻, 步数, 输出)]
+        self.steps = []  # [(时刻, 步数, 移动时间)]
+        self.relay_on = []  # [(时刻, 引脚)]
+
+    def write(self, records):
+        for timestamp, event, pin, value in records:
+            if event == EV_PID_OUTPUT:
+                self.pid.append((timestamp - self.t0, pin, value))
+            elif event == EV_STEP_START:
+                self.steps.append((timestamp - self.t0, pin, value))
+            elif event == EV_ACTUATOR_ON:
+                self.relay_on.append((timestamp - self.t0, pin))
+
+    def close(self):
+        pass
+
+
+def extract_decisions(pid, steps, relay_on, pin_names):
+    """
+    整理一次任务的决策
+    :param pid: [(时刻, 步数, PID输出)]
+    :param steps: [(时刻, 步数, 移动时间)]
+    :param relay_on: [(时刻, 通电引脚)]
+    :param pin_names: 引脚 -> 动作名称
+    :return: {'pid': [...], 'movement_times': [...], 'sides': [...], 'steps': 步数, 'stop_time': 最后一步开始时刻}
+    """
+    side_edges = [(t, SIDE_ACTUATORS[pin_names[pin]]) for t, pin in relay_on
+                  if pin_names.get(pin) in SIDE_ACTUATORS]
+    sides = []
+    for start, _, _ in steps:
+        side = next((s for t, s in side_edges if t >= start - 1e-6), None)
+        sides.append(side)
+    return {
+        'pid': [output for _, _, output in pid],
+        'movement_times': [movement_time for _, _, movement_time in steps],
+        'sides': sides,
+        'steps': len(steps),
+        'stop_time': steps[-1][0] if steps else 0.0,
+    }
+
+
+def recorded_decisions(mission):
+    """从任务存档读取记录的决策"""
+    pin_names = {int(pin): name for pin, name in mission['meta']['pin_names'].items()}
+    pid = mission['pid']
+    relay = mission['relay']
+    step = mission.get('step')
+    if step is None:
+        raise ValueError("存档没有每步开始记录，无法回放比较")
+    return extract_decisions(
+        list(zip(pid['time'].tolist(), pid['step'].tolist(), pid['output'].tolist())),
+        list(zip(step['time'].tolist(), step['step'].tolist(), step['movement_time'].tolist())),
+        [(t, pin) for t, pin, level in zip(relay['time'].tolist(), relay['pin'].tolist(), relay['level'].tolist())
+         if level],
+        pin_names)
+
+
+def compare_decisions(recorded, replayed, tolerance=0.01, time_tolerance=1.0):
+    """
+    比较两次决策
+    :param tolerance: PID输出和移动时间允许的误差（秒）
+    :param time_tolerance: 停止时刻允许的误差（秒）
+    :return: 差异说明列表，为空表示一致
+    """
+    differences = []
+    if recorded['steps'] != replayed['steps']:
+        differences.append(f"步数 {recorded['steps']} -> {replayed['steps']}")
+
+    for key, label in (('pid', 'PID输出'), ('movement_times', '移动时间')):
+        for i, (old, new) in enumerate(zip(recorded[key], replayed[key])):
+            if abs(old - new) > tolerance:
+                differences.append(f"第 {i + 1} 步{label} {old:.3f} -> {new:.3f}秒")
+                break
+        if len(recorded[key]) != len(replayed[key]) and recorded['steps'] == replayed['steps']:
+            differences.append(f"{label}次数 {len(recorded[key])} -> {len(replayed[key])}")
+
+    for i, (old, new) in enumerate(zip(recorded['sides'], replayed['sides'])):
+        if old != new:
+            differences.append(f"第 {i + 1} 步使用 {old} -> {new}")
+            break
+
+    if abs(recorded['stop_time'] - replayed['stop_time']) > time_tolerance:
+        differences.append(f"最后一步开始时刻 {recorded['stop_time']:.2f} -> {replayed['stop_time']:.2f}秒")
+    return differences
+
+
+def replay_mission(path, direction, target, continuous=False, tolerance=0.01, time_tolerance=1.0, planner='model',
+                   closed_loop=True):
+    """
+    回放一次任务并与记录比较
+    :param path: 任务存档目录
+    :param direction: 记录任务的方向 'up' 或 'down'
+    :param target: 记录任务的目标高度 (cm)
+    :param continuous: 记录任务是否为连续攀爬模式
+    :param planner: 记录任务逐步模式的移动时间计算方式 'model' 或 'pid'
+    :param closed_loop: 记录任务最后一步的竖直杆是否闭环断电
+    :return: 结果字典
+    """
+    mission = load_mission(path)
+    recorded = recorded_decisions(mission)
+
+    ultrasonic = mission['ultrasonic']
+    robot = ReplayRobot(ultrasonic['time'].tolist(), ultrasonic['height'].tolist())
+    recorder = DecisionRecorder(robot.replay_t0)
+    robot.tracer.add_sink(recorder)
+
+    if direction == 'up':
+        controller = UpClimbController(target_height=target, robot=robot, planner=planner)
+        run = controller.start_climbing_continuous if continuous else controller.start_climbing
+    else:
+        controller = DownClimbController(target_height=target, robot=robot, planner=planner)
+        run = controller.start_climbing_down_continuous if continuous else controller.start_climbing_down
+    controller.closed_loop = closed_loop
+    run()
+    # power_off 已停止追踪器并写出全部事件
+    robot.tracer.flush()
+
+    replayed = extract_decisions(recorder.pid, recorder.steps, recorder.relay_on, robot.pin_names)
+    differences = compare_decisions(recorded, replayed, tolerance, time_tolerance)
+    if robot.trace_exhausted:
+        differences.append("回放超出了记录的高度轨迹")
+
+    return {
+        'mission': path,
+        'recorded': recorded,
+        'replayed': replayed,
+        'differences': differences,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='任务回放 - 用记录的高度轨迹重新运行控制器并比较决策')
+    parser.add_argument('missions', nargs='+', help='任务存档目录')
+    parser.add_argument('--direction', choices=['up', 'down'], required=True, help='记录任务的方向')
+    parser.add_argument('--target', type=float, required=True, help='记录任务的目标高度 (cm)')
+    parser.add_argument('-c', '--continuous', action='store_true', help='记录任务为连续攀爬模式')
+    parser.add_argument('--pid', action='store_true', help='记录任务使用PID计算移动时间')
+    parser.add_argument('--open-loop', action='store_true', help='记录任务最后一步的竖直杆也按计划时间通电')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='PID输出/移动时间允许误差（秒）')
+    parser.add_argument('--time-tolerance', type=float, default=1.0, help='停止时刻允许误差（秒）')
+    parser.add_argument('-o', '--output', help='把全部结果写入JSON文件')
+    parser.add_argument('-v', '--verbose', action='store_true', help='输出控制器日志')
+
+    args = parser.parse_args()
+
+    # 控制器模块导入时已配置日志，回放默认只保留错误
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+    # 回放本身不再生成新的任务存档
+    os.environ.pop('ROBOT_ARCHIVE_DIR', None)
+
+    results = []
+    for path in args.missions:
+        try:
+            result = replay_mission(path, args.direction, args.target, args.continuous,
+                                    args.tolerance, args.time_tolerance, 'pid' if args.pid else 'model',
+                                    not args.open_loop)
+        except Exception as e:
+            result = {'mission': path, 'error': str(e), 'differences': [f"回放失败: {e}"]}
+        results.append(result)
+
+        if result['differences']:
+            print(f"不同  {path}")
+            for difference in result['differences']:
+                print(f"      {difference}")
+        else:
+            print(f"一致  {path} ({result['recorded']['steps']} 步)")
+
+    changed = sum(1 for result in results if result['differences'])
+    print(f"\n共 {len(results)} 个任务，{changed} 个决策不同")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+    sys.exit(1 if changed else 0)
+
+
+if __name__ == "__main__":
+    main()
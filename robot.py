@@ -3,21 +3,94 @@
 攀爬机器人控制类 - 修正版本
 """
 
-import time
-import RPi.GPIO as GPIO
+import os
+import json
+import signal
+import threading
+from datetime import datetime
 from simple_pid import PID
 import logging
 
+from gpio_backend import create_backend, PinShadow
+from clock import create_clock
+from actuators import ActuatorEngine, ScheduledAction, StopRequested, run_schedule, wait_all
+from tracer import (EventTracer, LogSink, BinaryTraceSink, EV_SERVO, EV_HEIGHT, EV_NO_ECHO, EV_VERTICAL_STOP,
+                    EV_ACTUATOR_TRIM, EV_STOP_REQUEST)
+from mission_archive import MissionWriter, create_mission_dir
+from stroke_tracker import StrokeTracker
+from watchdog import Heartbeat
+from state_block import StateBlock, FLAG_STOP_REQUESTED
+from telemetry import TelemetrySink
+from metrics import MetricsRegistry, MetricsServer, SnapshotWriter
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
+# 指标直方图分桶上界（秒）: 一次测距最长为 重试次数 x (截止时间 + 重试间隔)；脉冲超时和停止以毫秒计
+RANGING_BUCKETS = (0.0005, 0.001, 0.002, 0.003, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15,
+                   0.2, 0.3, 0.5)
+OVERSHOOT_BUCKETS = (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)
+STEP_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 60)  # 一步和步间隔，竖直杆最长通电 6 秒
+
+
+class NoEcho:
+    """
+    超声波测距失败结果 - 在截止时间和重试次数内没有得到有效回声
+    结果为假值，调用方可以用 isinstance(result, NoEcho) 区分测距失败
+    """
+    __slots__ = ('reason', 'attempts')
+
+    def __init__(self, reason, attempts):
+        self.reason = reason  # 最后一次失败的原因
+        self.attempts = attempts  # 已尝试的测量次数
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return f"NoEcho(reason={self.reason!r}, attempts={self.attempts})"
+
+
+class VerticalMove:
+    """闭环竖直移动的结果"""
+    __slots__ = ('displacement', 'elapsed', 'reason', 'handle')
+
+    REASONS = ('reached', 'stalled', 'timeout')  # 断电原因，下标写入追踪事件
+
+    def __init__(self, displacement, elapsed, reason, handle):
+        self.displacement = displacement  # 断电时估计的位移 (cm)，沿运动方向为正
+        self.elapsed = elapsed  # 实际通电时间（秒）
+        self.reason = reason  # 'reached' 达到目标 / 'stalled' 停滞 / 'timeout' 达到最长通电时间
+        self.handle = handle  # 竖直杆的 PulseHandle
+
+    def __repr__(self):
+        return f"VerticalMove(displacement={self.displacement:.2f}, elapsed={self.elapsed:.3f}, reason={self.reason!r})"
+
+
 class ClimbingRobot:
-    def __init__(self):
+    def __init__(self, gpio=None, clock=None, calibration_file=None, state_file=None, io_process=None,
+                 state_block=None):
+        """
+        初始化攀爬机器人
+        :param gpio: GPIO后端（见 gpio_backend），默认按环境变量 ROBOT_GPIO_BACKEND 创建，未设置时使用 RPi.GPIO
+        :param clock: 时钟（见 clock），默认按环境变量 ROBOT_CLOCK 创建，未设置时使用系统时钟
+        :param calibration_file: 标定文件（见 calibrate.py），默认见 load_calibration；'' 表示不加载
+        :param state_file: 伸缩杆行程状态文件，默认读取环境变量 ROBOT_ACTUATOR_STATE，未设置时为程序目录下的
+                           actuator_state.json；'' 表示不读取也不保存，所有伸缩杆从位置未知开始
+        :param io_process: 日志进程（见 realtime.IOProcess），给出时事件环形缓冲区放在共享内存中，
+                           事件的渲染和写文件都在日志进程中完成
+        :param state_block: 共享内存状态块名称（见 state_block.py），默认读取环境变量 ROBOT_STATE_BLOCK，
+                            未设置时不创建（up.py/down.py 的任务默认使用 climbing_robot）；'' 或 'none' 表示不创建
+        """
+        # 所有定时、等待和时间戳都通过该时钟
+        self.clock = clock or create_clock()
+
         # GPIO设置
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setwarnings(False)
+        self.gpio = gpio or create_backend()
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setwarnings(False)
 
         # 引脚定义 (您可以根据实际接线修改)
         # 径向伸缩杆 (用于抓紧柱子)
@@ -44,6 +117,81 @@ class ClimbingRobot:
         self.ultrasonic_trig_pin = 27  # 超声波触发引脚
         self.ultrasonic_echo_pin = 17  # 超声波回声引脚
 
+        # 执行器表: 动作名称 -> (伸缩杆, 通电引脚, 需要先断开的对向引脚)
+        self.actuators = {
+            'upper_radial_extend': ('upper_radial', self.upper_radial_extend_pin, self.upper_radial_retract_pin),
+            'upper_radial_retract': ('upper_radial', self.upper_radial_retract_pin, self.upper_radial_extend_pin),
+            'lower_radial_extend': ('lower_radial', self.lower_radial_extend_pin, self.lower_radial_retract_pin),
+            'lower_radial_retract': ('lower_radial', self.lower_radial_retract_pin, self.lower_radial_extend_pin),
+            'upper_horizontal_extend': ('upper_horizontal', self.upper_horizontal_extend_pin, None),
+            'upper_horizontal_retract': ('upper_horizontal', self.upper_horizontal_retract_pin, None),
+            'lower_horizontal_extend': ('lower_horizontal', self.lower_horizontal_extend_pin, None),
+            'lower_horizontal_retract': ('lower_horizontal', self.lower_horizontal_retract_pin, None),
+            'vertical_extend': ('vertical', self.vertical_extend_pin, self.vertical_retract_pin),
+            'vertical_retract': ('vertical', self.vertical_retract_pin, self.vertical_extend_pin),
+        }
+
+        # 事件追踪: 控制线程只写环形缓冲区，由后台线程渲染日志和写追踪文件
+        # 虚拟时钟下一个刷新周期内会产生大量仿真事件，加大缓冲区避免被覆盖
+        trace_capacity = 65536 if self.clock.virtual else 4096
+        # 遥测客户端看到的延迟取决于刷新周期，启用遥测时缩短
+        telemetry = os.environ.get('ROBOT_TELEMETRY')
+        flush_interval = 0.1 if telemetry else 0.5
+        self.io_process = io_process
+        if io_process is None:
+            self.tracer = EventTracer(self.clock, capacity=trace_capacity, flush_interval=flush_interval)
+        else:
+            self.tracer = EventTracer(self.clock, capacity=trace_capacity, flush_interval=flush_interval,
+                                      buffer=io_process.trace_buffer(EventTracer.buffer_size(trace_capacity)))
+        self.pin_names = {on_pin: name for name, (_, on_pin, _) in self.actuators.items()}  # 引脚 -> 名称
+        self.pin_names[self.upper_servo_pin] = 'upper_servo'
+        self.pin_names[self.lower_servo_pin] = 'lower_servo'
+        # 输出端按 (类, 参数, 关键字参数) 记录，使用日志进程时在那里创建
+        trace_sinks = [(LogSink, (logger, self.pin_names), {})]
+        trace_file = os.environ.get('ROBOT_TRACE_FILE')
+        if trace_file:
+            trace_sinks.append((BinaryTraceSink, (trace_file,), {}))
+        if telemetry:
+            trace_sinks.append((TelemetrySink, (telemetry,),
+                                {'framing': os.environ.get('ROBOT_TELEMETRY_FRAMING', 'json'),
+                                 'pin_names': self.pin_names}))
+
+        # 运行指标: 控制器和本类在热路径上只做计数和分桶，抓取端点和快照文件见 start_metrics
+        self.metrics = MetricsRegistry()
+        self._ranging_seconds = self.metrics.histogram(
+            'robot_ranging_seconds', '一次 get_current_height 的用时（含等待传感器和重试）', RANGING_BUCKETS)
+        self._ranging_failures = self.metrics.counter('robot_ranging_failures_total', '测距失败次数')
+        self._height_gauge = self.metrics.gauge('robot_height_cm', '最近一次测得的高度')
+        pulse_overshoot = self.metrics.histogram(
+            'robot_pulse_overshoot_seconds', '继电器实际通电时间减去请求的通电时间（按时结束的脉冲）',
+            OVERSHOOT_BUCKETS, labels=('actuator',))
+        pulse_on_seconds = self.metrics.counter('robot_pulse_on_seconds_total', '继电器累计通电时间',
+                                                labels=('actuator',))
+        pulse_cancels = self.metrics.counter('robot_pulse_cancels_total', '提前取消的脉冲数', labels=('actuator',))
+        vertical_moves = self.metrics.counter('robot_vertical_moves_total', '闭环竖直移动次数，按结束原因',
+                                              labels=('reason',))
+        # 按标签值预先取出，定时器线程持有引擎锁时只做字典索引，不再分配标签元组
+        self._pulse_metrics = {name: (pulse_overshoot.labels(name), pulse_on_seconds.labels(name),
+                                      pulse_cancels.labels(name))
+                               for name in self.actuators}  # 动作名称 -> (超时, 通电时间, 取消次数)
+        self._vertical_moves = {reason: vertical_moves.labels(reason) for reason in VerticalMove.REASONS}
+        self._stop_seconds = self.metrics.histogram('robot_stop_seconds', '停止请求到全部继电器断开的用时',
+                                                    OVERSHOOT_BUCKETS)
+        self.metrics_server = None
+        self.metrics_writer = None
+
+        # 继电器输出经过影子寄存器: 丢弃电平未变的写入，多个引脚的变化合并为一次批量写入
+        self.pins = PinShadow(self.gpio)
+        self.relay_pins = list(dict.fromkeys(on_pin for _, on_pin, _ in self.actuators.values()))  # 全部继电器引脚
+        self.actuator_engine = ActuatorEngine(self.pins, self.clock, self.tracer, on_finish=self._on_pulse_finish)
+
+        # 停止请求: 任意线程或信号都可以设置，所有定时等待都在该事件上等待，可被立即打断
+        self.stop_event = threading.Event()
+        self.stop_reason = None
+
+        # 独立看门狗进程的心跳连接（见 start_watchdog），None 表示未启用
+        self.watchdog = None
+
         # 舵机参数 - 必须在setup_gpio()之前定义
         self.servo_frequency = 50  # 舵机PWM频率
         self.servo_neutral_duty = 7.5  # 中性位置占空比
@@ -62,10 +210,18 @@ class ClimbingRobot:
         self.extend_time = 3.0  # 径向杆伸长5cm所需时间 
         self.vertical_extend_time = 3.0  # 竖直杆伸长时间 
         self.servo_rotation_time = 0.5  # 舵机旋转时间 
+        self.vertical_speed = 1.0  # 竖直杆伸长估计速度 (cm/s)，连续攀爬规划的初始值
+        self.vertical_dead_time = 0.0  # 竖直杆伸长通电后开始带动机器人之前的延迟（秒）
+        self.vertical_retract_speed = 1.0  # 竖直杆收缩估计速度 (cm/s)
+        self.vertical_retract_dead_time = 0.0  # 竖直杆收缩的延迟（秒）
+        self.radial_step_time = None  # 攀爬每步径向杆伸长/收缩时间（秒），None 表示与移动时间相同
+        self.radial_release_margin = 1.5  # 标定的松开抓握时间乘以该余量作为每步径向杆时间
 
         # 最终松开时间参数
         self.final_extend_time_rad = 20.0  # 最终伸长时间（秒）
         self.final_extend_time_hor = 6.0  # 最终伸长时间（秒）
+        self.final_release_grip_time = 14.0  # 径向杆伸长多久后已松开抓握，可以开始收回水平杆（秒）
+        self.final_release_profile = 'parallel'  # 最终松开方案: 'parallel' 依赖图并行 / 'serial' 逐个执行
 
         # 系统参数
         self.height_tolerance = 2.0  # 高度容忍度 (cm)
@@ -76,248 +232,743 @@ class ClimbingRobot:
 
         # 超声波参数
         self.sound_speed = 34300  # 声速 cm/s
-        self.ultrasonic_timeout = 0.1  # 超声波测量超时时间
+        self.ultrasonic_timeout = 0.1  # 单次测量截止时间（秒）
+        self.ultrasonic_retries = 3  # 每次测距的最大尝试次数
+        self.ultrasonic_retry_interval = 0.06  # 两次触发之间的间隔（HC-SR04要求约60ms）
+        self.ultrasonic_max_distance = 400.0  # 有效测量上限 (cm)
+        self.ultrasonic_mode = 'edge'  # 测距模式: 'edge' 边沿中断 / 'poll' 有截止时间的轮询
+
+        # 回声边沿状态 (由GPIO边沿回调线程写入)
+        self._echo_rise_ns = None
+        self._echo_fall_ns = None
+        self._echo_done = threading.Event()
+        self.echo_listener = None  # 回声下降沿到达时的额外通知（如asyncio前端），在回调线程中调用
+        self._ranging_lock = threading.Lock()  # 后台采样线程与控制线程共用传感器
+        self.last_height = None  # 最近一次有效测距 (时刻, 距离)，无论由哪个线程触发
+
+        # 闭环竖直移动参数
+        self.vertical_stall_time = 0.8  # 超过该时间位移没有新增 vertical_stall_distance 视为停滞（秒）
+        self.vertical_stall_distance = 0.3  # 停滞判断的最小位移 (cm)
+        self.vertical_filter_window = 5  # 闭环移动中值滤波的样本数
+
+        # 伸缩杆行程推算: 伸缩杆 -> (全行程伸出时间, 全行程收缩时间)（秒），None 表示不推算
+        # 竖直杆的行程由高度闭环控制，且两侧都抓紧时会憋住不动，不做推算
+        self.actuator_stroke_times = {
+            'upper_radial': (20.0, 20.0),
+            'lower_radial': (20.0, 20.0),
+            'upper_horizontal': (6.0, 6.0),
+            'lower_horizontal': (6.0, 6.0),
+            'vertical': None,
+        }
+        self.actuator_state_max_age = 600.0  # 保存的行程状态超过该时间（秒）视为过期，期间可能被手动移动过
+        self.stroke_tracker = StrokeTracker(self.actuator_stroke_times)
+        self.trimmed_time = 0.0  # 按行程推算累计少通电的时间（秒）
+
+        # 读取标定结果，覆盖上面的估计值
+        self.calibration = None
+        self.load_calibration(calibration_file)
+
+        # 读取上次任务结束时保存的伸缩杆行程位置
+        if state_file is None:
+            state_file = os.environ.get('ROBOT_ACTUATOR_STATE',
+                                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'actuator_state.json'))
+        self.actuator_state_file = '' if state_file == 'none' else state_file
+        if self.actuator_state_file:
+            self.stroke_tracker.load(self.actuator_state_file, datetime.now().timestamp(),
+                                     self.actuator_state_max_age)
+
+        archive_dir = os.environ.get('ROBOT_ARCHIVE_DIR')
+        if archive_dir:
+            # 每次任务一个存档目录，记录超声波、继电器边沿、舵机占空比和PID输出
+            mission_path = create_mission_dir(archive_dir)
+            trace_sinks.append((MissionWriter, (mission_path, self.clock.monotonic()),
+                                {'pin_names': self.pin_names, 'servo_neutral_duty': self.servo_neutral_duty,
+                                 'servo_degree_ratio': self.servo_degree_ratio}))
+            logger.info(f"任务存档: {mission_path}")
+        if io_process is None:
+            for sink_class, args, kwargs in trace_sinks:
+                self.tracer.add_sink(sink_class(*args, **kwargs))
+            self.tracer.start()
+        else:
+            io_process.start_tracer(self.tracer, trace_sinks)
+
+        # 共享内存状态块: 每条改变状态的事件在记录时同步更新，供监视程序轮询
+        if state_block is None:
+            state_block = os.environ.get('ROBOT_STATE_BLOCK', '')
+        self.state_block = None
+        if state_block and state_block != 'none':
+            try:
+                self.state_block = StateBlock(state_block, self.relay_pins,
+                                              (self.upper_servo_pin, self.lower_servo_pin),
+                                              self.servo_neutral_duty, self.servo_degree_ratio)
+                self.tracer.listener = self.state_block.apply
+            except (OSError, ValueError) as e:
+                logger.warning(f"无法创建状态块 {state_block}: {e}")
+
+        self.start_metrics()
 
         # 初始化GPIO - 现在所有参数都已经定义了
+        self.gpio.bind(self)
         self.setup_gpio()
 
         # 机器人状态
         self.is_climbing = False
 
+    def load_calibration(self, path=None):
+        """
+        读取标定文件并应用执行器速度和延迟
+        :param path: 标定文件路径，默认读取环境变量 ROBOT_CALIBRATION，未设置时为程序目录下的 calibration.json；
+                     '' 或 'none' 表示不加载
+        :return: 是否加载了标定
+        """
+        if path is None:
+            path = os.environ.get('ROBOT_CALIBRATION',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json'))
+        if not path or path == 'none' or not os.path.exists(path):
+            return False
+
+        with open(path) as f:
+            calibration = json.load(f)
+        actuators = calibration.get('actuators', {})
+
+        extend = actuators.get('vertical_extend')
+        if extend:
+            self.vertical_speed = extend['rate']
+            self.vertical_dead_time = extend['dead_time']
+        retract = actuators.get('vertical_retract')
+        if retract:
+            self.vertical_retract_speed = retract['rate']
+            self.vertical_retract_dead_time = retract['dead_time']
+
+        # 标定了全行程时间的伸缩杆用于行程推算
+        for name, (cylinder, _, _) in self.actuators.items():
+            stroke_time = actuators.get(name, {}).get('stroke_time')
+            if stroke_time and self.actuator_stroke_times.get(cylinder) is not None:
+                extend_time, retract_time = self.actuator_stroke_times[cylinder]
+                if name.endswith('_extend'):
+                    self.actuator_stroke_times[cylinder] = (stroke_time, retract_time)
+                else:
+                    self.actuator_stroke_times[cylinder] = (extend_time, stroke_time)
+
+        # 两侧径向杆取较慢的一侧，保证每步都能可靠松开
+        release_times = [actuators[name]['release_time'] for name in ('upper_radial_extend', 'lower_radial_extend')
+                         if name in actuators]
+        if release_times:
+            self.radial_step_time = max(release_times) * self.radial_release_margin
+            self.extend_time = self.radial_step_time
+
+        self.calibration = calibration
+        logger.info(f"已加载标定 {path}: 竖直杆伸长 {self.vertical_speed:.2f}cm/s, "
+                    f"收缩 {self.vertical_retract_speed:.2f}cm/s, 径向杆每步 {self.extend_time:.2f}秒")
+        return True
+
     def setup_gpio(self):
         """初始化GPIO引脚"""
-        # 设置径向伸缩杆控制引脚为输出
-        GPIO.setup(self.upper_radial_extend_pin, GPIO.OUT)
-        GPIO.setup(self.upper_radial_retract_pin, GPIO.OUT)
-        GPIO.setup(self.lower_radial_extend_pin, GPIO.OUT)
-        GPIO.setup(self.lower_radial_retract_pin, GPIO.OUT)
-
-        # 设置水平伸缩杆控制引脚为输出
-        GPIO.setup(self.upper_horizontal_extend_pin, GPIO.OUT)
-        GPIO.setup(self.upper_horizontal_retract_pin, GPIO.OUT)
-        GPIO.setup(self.lower_horizontal_extend_pin, GPIO.OUT)
-        GPIO.setup(self.lower_horizontal_retract_pin, GPIO.OUT)
-
-        # 设置竖直伸缩杆控制引脚为输出
-        GPIO.setup(self.vertical_extend_pin, GPIO.OUT)
-        GPIO.setup(self.vertical_retract_pin, GPIO.OUT)
+        # 设置径向、水平和竖直伸缩杆的继电器引脚为输出
+        self.gpio.setup(self.relay_pins, self.gpio.OUT)
 
         # 设置超声波传感器引脚
-        GPIO.setup(self.ultrasonic_trig_pin, GPIO.OUT)
-        GPIO.setup(self.ultrasonic_echo_pin, GPIO.IN)
+        self.gpio.setup(self.ultrasonic_trig_pin, self.gpio.OUT)
+        self.gpio.setup(self.ultrasonic_echo_pin, self.gpio.IN)
 
         # 设置舵机引脚为PWM输出
-        GPIO.setup(self.upper_servo_pin, GPIO.OUT)
-        GPIO.setup(self.lower_servo_pin, GPIO.OUT)
+        self.gpio.setup(self.upper_servo_pin, self.gpio.OUT)
+        self.gpio.setup(self.lower_servo_pin, self.gpio.OUT)
 
         # 初始化PWM - 现在servo_frequency已经定义了
-        self.upper_servo = GPIO.PWM(self.upper_servo_pin, self.servo_frequency)
-        self.lower_servo = GPIO.PWM(self.lower_servo_pin, self.servo_frequency)
+        self.upper_servo = self.gpio.PWM(self.upper_servo_pin, self.servo_frequency)
+        self.lower_servo = self.gpio.PWM(self.lower_servo_pin, self.servo_frequency)
         self.upper_servo.start(self.servo_neutral_duty)
         self.lower_servo.start(self.servo_neutral_duty)
 
-        # 初始状态设为低电平
-        GPIO.output(self.upper_radial_extend_pin, GPIO.LOW)
-        GPIO.output(self.upper_radial_retract_pin, GPIO.LOW)
-        GPIO.output(self.lower_radial_extend_pin, GPIO.LOW)
-        GPIO.output(self.lower_radial_retract_pin, GPIO.LOW)
-        GPIO.output(self.upper_horizontal_extend_pin, GPIO.LOW)
-        GPIO.output(self.upper_horizontal_retract_pin, GPIO.LOW)
-        GPIO.output(self.lower_horizontal_extend_pin, GPIO.LOW)
-        GPIO.output(self.lower_horizontal_retract_pin, GPIO.LOW)
-        GPIO.output(self.vertical_extend_pin, GPIO.LOW)
-        GPIO.output(self.vertical_retract_pin, GPIO.LOW)
+        # 初始状态设为低电平，一次写入全部继电器
+        self.pins.invalidate()
+        self.pins.output(self.relay_pins, self.gpio.LOW)
 
         # 初始化超声波传感器
-        GPIO.output(self.ultrasonic_trig_pin, GPIO.LOW)
-        time.sleep(0.1)  # 让传感器稳定
+        self.gpio.output(self.ultrasonic_trig_pin, self.gpio.LOW)
+        if self.ultrasonic_mode == 'edge':
+            try:
+                # 回声上升沿/下降沿都触发回调，由回调记录时间戳
+                self.gpio.add_event_detect(self.ultrasonic_echo_pin, self.gpio.BOTH, callback=self._on_echo_edge)
+            except RuntimeError as e:
+                logger.warning(f"无法启用回声边沿检测，改用轮询测距: {e}")
+                self.ultrasonic_mode = 'poll'
+        self.clock.sleep(0.1)  # 让传感器稳定
+
+    def _on_echo_edge(self, channel):
+        """回声引脚边沿回调 - 使用单调纳秒时钟记录上升沿和下降沿"""
+        now = self.clock.monotonic_ns()
+        if self.gpio.input(channel):
+            self._echo_rise_ns = now
+        elif self._echo_rise_ns is not None:
+            self._echo_fall_ns = now
+            self._echo_done.set()
+            listener = self.echo_listener
+            if listener is not None:
+                listener()
+
+    def _send_trigger(self):
+        """发送10微秒的触发信号"""
+        self.gpio.output(self.ultrasonic_trig_pin, self.gpio.HIGH)
+        self.clock.sleep(0.00001)
+        self.gpio.output(self.ultrasonic_trig_pin, self.gpio.LOW)
+
+    def _start_echo(self):
+        """清除上一次的边沿记录并发送触发信号"""
+        self._echo_rise_ns = None
+        self._echo_fall_ns = None
+        self._echo_done.clear()
+        self._send_trigger()
+
+    def _echo_result(self):
+        """
+        根据回调记录的边沿计算回声脉宽
+        返回: (脉宽秒数, None) 或 (None, 失败原因)
+        """
+        if self._echo_fall_ns is None:
+            if self._echo_rise_ns is None:
+                return None, "未检测到回声上升沿"
+            return None, "回声下降沿超时"
+        return (self._echo_fall_ns - self._echo_rise_ns) / 1e9, None
+
+    def _measure_echo_edge(self):
+        """
+        边沿中断方式测量一次回声脉宽
+        返回: (脉宽秒数, None) 或 (None, 失败原因)
+        """
+        self._start_echo()
+        # 阻塞等待下降沿回调，不占用CPU，超过截止时间直接放弃
+        self.clock.wait(self._echo_done, self.ultrasonic_timeout)
+        return self._echo_result()
 
-    def get_current_height(self):
+    def _measure_echo_poll(self):
+        """
+        轮询方式测量一次回声脉宽 - 带截止时间，不会无限等待
+        返回: (脉宽秒数, None) 或 (None, 失败原因)
+        """
+        self._send_trigger()
+        deadline = self.clock.monotonic_ns() + int(self.ultrasonic_timeout * 1e9)
+
+        # 记录发送超声波的时刻
+        pulse_start = self.clock.monotonic_ns()
+        while self.gpio.input(self.ultrasonic_echo_pin) == 0:
+            self.clock.spin()
+            pulse_start = self.clock.monotonic_ns()
+            if pulse_start > deadline:
+                return None, "未检测到回声上升沿"
+
+        # 记录接收到回声的时刻
+        pulse_end = self.clock.monotonic_ns()
+        while self.gpio.input(self.ultrasonic_echo_pin) == 1:
+            self.clock.spin()
+            pulse_end = self.clock.monotonic_ns()
+            if pulse_end > deadline:
+                return None, "回声下降沿超时"
+
+        return (pulse_end - pulse_start) / 1e9, None
+
+    def _pulse_to_distance(self, pulse_duration):
+        """
+        回声脉宽换算为距离
+        返回: (距离cm, None) 或 (None, 失败原因)
+        """
+        # 计算距离（声速34300cm/s，往返需除以2）
+        distance = pulse_duration * self.sound_speed / 2
+        if 0 < distance <= self.ultrasonic_max_distance:
+            return round(distance, 2), None
+        return None, f"距离超出量程: {distance:.2f}cm"
+
+    def get_current_height(self, blocking=True):
         """
         使用HC-SR04超声波传感器获取当前距离
-        返回: 当前检测距离 (cm)
+        每次测量都有截止时间，失败后按重试次数重新触发
+        :param blocking: 传感器正被其他调用使用时是否等待；为 False 时直接返回 NoEcho
+        返回: 当前检测距离 (cm)，测距失败时返回 NoEcho
         """
+        started = self.clock.monotonic_ns()
+        if not self._ranging_lock.acquire(blocking):
+            return NoEcho("传感器被占用", 0)
         try:
-            # 发送10微秒的触发信号
-            GPIO.output(self.ultrasonic_trig_pin, GPIO.HIGH)
-            time.sleep(0.00001)
-            GPIO.output(self.ultrasonic_trig_pin, GPIO.LOW)
-            
-            # 记录发送超声波的时刻
-            while GPIO.input(self.ultrasonic_echo_pin) == 0:
-                pulse_start = time.time()
-            
-            # 记录接收到回声的时刻
-            while GPIO.input(self.ultrasonic_echo_pin) == 1:
-                pulse_end = time.time()
-            
-            # 计算超声波往返时间
-            pulse_duration = pulse_end - pulse_start
-            
-            # 计算距离（声速34300cm/s，往返需除以2）
-            distance = pulse_duration * 34300 / 2
-            
-            return round(distance, 2)
+            height = self._measure_distance()
+        finally:
+            self._ranging_lock.release()
+        return self._record_height(height, started)
 
-        except Exception as e:
-            logger.error(f"超声波距离测量异常: {e}")
-            return 0.0
+    def _record_height(self, height, started):
+        """
+        记录一次测距的结果: 耗时、失败计数、最近高度和事件，同步和异步测距共用
+        :param height: 测得的距离 (cm) 或 NoEcho
+        :param started: 开始测距时的 clock.monotonic_ns()
+        :return: height
+        """
+        self._ranging_seconds.observe((self.clock.monotonic_ns() - started) / 1e9)
+        if isinstance(height, NoEcho):
+            self._ranging_failures.inc()
+            self.tracer.record(EV_NO_ECHO, self.ultrasonic_echo_pin, height.attempts)
+        else:
+            self.last_height = (self.clock.monotonic(), height)
+            self._height_gauge.set(height)
+            self.tracer.record(EV_HEIGHT, self.ultrasonic_echo_pin, height)
+        return height
+
+    def _measure_distance(self):
+        """按重试次数执行测距，调用方需持有 _ranging_lock"""
+        reason = None
+        for attempt in range(1, self.ultrasonic_retries + 1):
+            try:
+                if self.ultrasonic_mode == 'edge':
+                    pulse_duration, reason = self._measure_echo_edge()
+                else:
+                    pulse_duration, reason = self._measure_echo_poll()
+
+                if pulse_duration is not None:
+                    distance, reason = self._pulse_to_distance(pulse_duration)
+                    if distance is not None:
+                        return distance
+
+            except Exception as e:
+                logger.error(f"超声波距离测量异常: {e}")
+                reason = str(e)
+
+            # 等待上一次的回声散去后再重新触发
+            if attempt < self.ultrasonic_retries:
+                self.clock.sleep(self.ultrasonic_retry_interval)
+
+        logger.warning(f"超声波测距失败 ({self.ultrasonic_retries}次尝试): {reason}")
+        return NoEcho(reason, self.ultrasonic_retries)
+
+    # 非阻塞执行器接口
+    def start_actuator(self, name, duration):
+        """
+        启动一个定时继电器脉冲并立即返回
+        :param name: 执行器动作名称，见 self.actuators
+        :param duration: 通电时间（秒），按行程推算裁剪，伸缩杆已在端点时不通电
+        :return: PulseHandle，可调用 join() 等待结束
+        """
+        cylinder, on_pin, off_pin = self.actuators[name]
+        return self.actuator_engine.start(name, cylinder, on_pin, off_pin, self.trim_actuation(name, duration))
+
+    def start_actuators(self, commands):
+        """
+        同时启动多个互不相关的执行器并立即返回，所有继电器在一次批量写入中通电
+        :param commands: [(动作名称, 通电时间), ...]
+        :return: PulseHandle 列表
+        """
+        group = []
+        for name, duration in commands:
+            cylinder, on_pin, off_pin = self.actuators[name]
+            group.append((name, cylinder, on_pin, off_pin, self.trim_actuation(name, duration)))
+        return self.actuator_engine.start_group(group)
+
+    def trim_actuation(self, name, duration):
+        """
+        按行程推算把一次命令裁剪到伸缩杆到达端点实际需要的时间
+        :param name: 执行器动作名称
+        :param duration: 命令的通电时间（秒）
+        :return: 裁剪后的通电时间，伸缩杆已在端点时为 0，位置未知时不变
+        """
+        cylinder, on_pin, _ = self.actuators[name]
+        trimmed = self.stroke_tracker.trim(cylinder, self._stroke_direction(name), duration)
+        if trimmed < duration:
+            self.trimmed_time += duration - trimmed
+            self.tracer.record(EV_ACTUATOR_TRIM, on_pin, duration - trimmed)
+        return trimmed
+
+    def record_actuation(self, name, on_time):
+        """
+        把一次实际通电计入行程推算
+        :param name: 执行器动作名称
+        :param on_time: 实际通电时间（秒）
+        """
+        cylinder = self.actuators[name][0]
+        self.stroke_tracker.update(cylinder, self._stroke_direction(name), on_time)
+
+    @staticmethod
+    def _stroke_direction(name):
+        """动作名称对应的行程方向: 1 伸出 / -1 收缩"""
+        return 1 if name.endswith('_extend') else -1
+
+    def _on_pulse_finish(self, handle):
+        """执行器引擎在脉冲断电后调用"""
+        on_time = handle.elapsed()
+        self.record_actuation(handle.name, on_time)
+        overshoot, on_seconds, cancels = self._pulse_metrics[handle.name]
+        on_seconds.inc(on_time)
+        if handle.cancelled:
+            cancels.inc()
+        else:
+            overshoot.observe(on_time - handle.duration)
+
+    def save_actuator_state(self):
+        """保存伸缩杆行程位置，下次启动时读取"""
+        if not self.actuator_state_file:
+            return
+        try:
+            self.stroke_tracker.save(self.actuator_state_file, datetime.now().timestamp())
+        except OSError as e:
+            logger.warning(f"无法保存行程状态 {self.actuator_state_file}: {e}")
+
+    def run_actuators_parallel(self, commands):
+        """
+        同时启动多个互不相关的执行器，并等待全部结束
+        :param commands: [(动作名称, 通电时间), ...]
+        """
+        handles = self.start_actuators(commands)
+        self.heartbeat(max((duration for _, duration in commands), default=0.0))
+        wait_all(handles, clock=self.clock)
+        self.check_stop()
+        return handles
+
+    def run_actuator(self, name, duration):
+        """
+        执行一个定时继电器脉冲并等待结束
+        :param name: 执行器动作名称
+        :param duration: 通电时间（秒）
+        :return: PulseHandle
+        """
+        handle = self.start_actuator(name, duration)
+        self.heartbeat(duration)
+        handle.join()
+        self.check_stop()
+        return handle
+
+    # 停止请求
+    def request_stop(self, reason="外部停止请求"):
+        """
+        请求停止 - 可以在任意线程中调用（信号处理见 install_stop_signals）
+        在调用者的线程中一次写入断开全部继电器并取消所有脉冲；之后启动新动作和 wait() 都会抛出 StopRequested，
+        正在等待的控制线程因此立即退出，不用等当前的通电时间结束
+        :param reason: 停止原因
+        """
+        requested = self.clock.monotonic_ns()
+        self.stop_reason = reason
+        self.stop_event.set()
+        self.pins.output(self.relay_pins, self.gpio.LOW, force=True)
+        latency = self.clock.monotonic_ns() - requested
+        self._stop_seconds.observe(latency / 1e9)
+        self.tracer.record(EV_STOP_REQUEST, 0, latency / 1e6)
+        self.actuator_engine.halt()
+
+    def clear_stop(self):
+        """解除停止状态，允许再次启动动作"""
+        self.stop_event.clear()
+        self.stop_reason = None
+        self.actuator_engine.resume()
+        if self.state_block is not None:
+            self.state_block.set_flag(self.clock.monotonic(), FLAG_STOP_REQUESTED, False)
+
+    def check_stop(self):
+        """已请求停止时抛出 StopRequested"""
+        if self.stop_event.is_set():
+            raise StopRequested(f"已请求停止: {self.stop_reason}")
+
+    def wait(self, seconds):
+        """
+        可被停止请求打断的等待
+        :param seconds: 等待时间（秒）
+        """
+        self.heartbeat(seconds)
+        self.clock.wait(self.stop_event, max(seconds, 0))
+        self.check_stop()
+
+    def install_stop_signals(self, signums=(signal.SIGTERM, signal.SIGUSR1)):
+        """
+        收到指定信号时请求停止，必须在主线程中调用
+        信号处理函数在主线程中运行，主线程此时可能正持有引脚或执行器的锁，
+        所以只启动一个线程去执行 request_stop，不在处理函数中直接写引脚
+        :param signums: 信号列表
+        """
+        def handler(signum, frame):
+            threading.Thread(target=self.request_stop, args=(f"信号 {signal.Signals(signum).name}",),
+                             name="stop-request", daemon=True).start()
+
+        for signum in signums:
+            signal.signal(signum, handler)
+
+    # 看门狗
+    def start_watchdog(self, timeout_ms, backend=None, report=False):
+        """
+        启动独立的看门狗进程（见 watchdog.py）
+        控制线程在每次定时等待前发送心跳，声明接下来要等待的时间；超过该时间再加 timeout_ms 没有心跳，
+        或本进程退出时没有正常关闭看门狗，看门狗断开全部继电器、结束本进程并让舵机回中
+        :param timeout_ms: 心跳超时（毫秒）
+        :param backend: 看门狗使用的GPIO后端名称，默认读取环境变量 ROBOT_GPIO_BACKEND
+        :param report: 看门狗跳闸时在标准输出写一行记录，用于测量反应延迟（见 watchdog_test.py）
+        """
+        if self.watchdog is not None:
+            return
+        self.watchdog = Heartbeat(timeout_ms, self.relay_pins, (self.upper_servo_pin, self.lower_servo_pin),
+                                  self.servo_frequency, self.servo_neutral_duty, backend=backend, report=report)
+        self.watchdog.beat()
+
+    def heartbeat(self, expect=0.0):
+        """
+        向看门狗发送心跳，未启用看门狗时什么都不做
+        :param expect: 接下来要等待的时间（秒）
+        """
+        if self.watchdog is not None:
+            self.watchdog.beat(expect)
+
+    def stop_watchdog(self):
+        """正常关闭看门狗"""
+        if self.watchdog is not None:
+            self.watchdog.close()
+            self.watchdog = None
+
+    def start_metrics(self, address=None, path=None, interval=None):
+        """
+        启动指标抓取端点和定期快照（见 metrics.py）；失败时只记录警告，不影响任务
+        :param address: 抓取端点地址 'host:port' 或 'port'，默认读取环境变量 ROBOT_METRICS，未设置时不启动
+        :param path: 快照文件，默认读取环境变量 ROBOT_METRICS_FILE，未设置时不写
+        :param interval: 快照周期（秒），默认读取环境变量 ROBOT_METRICS_INTERVAL，未设置时为 10
+        """
+        address = address or os.environ.get('ROBOT_METRICS')
+        path = path or os.environ.get('ROBOT_METRICS_FILE')
+        if address:
+            try:
+                self.metrics_server = MetricsServer(self.metrics, address)
+            except (OSError, ValueError) as e:
+                logger.warning(f"无法启动指标端点 {address}: {e}")
+        if path:
+            interval = interval or float(os.environ.get('ROBOT_METRICS_INTERVAL', 10.0))
+            self.metrics_writer = SnapshotWriter(self.metrics, path, interval)
+
+    def stop_metrics(self):
+        """关闭指标抓取端点，写出最后一次快照"""
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+            self.metrics_server = None
+        if self.metrics_writer is not None:
+            self.metrics_writer.close()
+            self.metrics_writer = None
+
+    def close_state_block(self):
+        """停止更新并删除共享内存状态块，监视程序看到写入进程已停止"""
+        if self.state_block is not None:
+            self.tracer.listener = None
+            self.state_block.close(self.clock.monotonic())
+            self.state_block = None
 
     # 径向伸缩杆控制函数 - 双继电器控制
     def control_upper_radial_extend(self, duration):
         """控制上方径向伸缩杆伸长 - 双继电器控制"""
-        logger.info(f"上方径向伸缩杆伸长 {duration}秒")
-        # 确保收缩继电器断开
-        GPIO.output(self.upper_radial_retract_pin, GPIO.LOW)
-        # 激活伸长继电器
-        GPIO.output(self.upper_radial_extend_pin, GPIO.HIGH)
-        time.sleep(duration)
-        # 断电 - 两个继电器都设为低电平
-        GPIO.output(self.upper_radial_extend_pin, GPIO.LOW)
+        self.run_actuator('upper_radial_extend', duration)
 
     def control_upper_radial_retract(self, duration):
         """控制上方径向伸缩杆收缩 - 双继电器控制"""
-        logger.info(f"上方径向伸缩杆收缩 {duration}秒")
-        # 确保伸长继电器断开
-        GPIO.output(self.upper_radial_extend_pin, GPIO.LOW)
-        # 激活收缩继电器
-        GPIO.output(self.upper_radial_retract_pin, GPIO.HIGH)
-        time.sleep(duration)
-        # 断电 - 两个继电器都设为低电平
-        GPIO.output(self.upper_radial_retract_pin, GPIO.LOW)
+        self.run_actuator('upper_radial_retract', duration)
 
     def control_lower_radial_extend(self, duration):
         """控制下方径向伸缩杆伸长 - 双继电器控制"""
-        logger.info(f"下方径向伸缩杆伸长 {duration}秒")
-        # 确保收缩继电器断开
-        GPIO.output(self.lower_radial_retract_pin, GPIO.LOW)
-        # 激活伸长继电器
-        GPIO.output(self.lower_radial_extend_pin, GPIO.HIGH)
-        time.sleep(duration)
-        # 断电 - 两个继电器都设为低电平
-        GPIO.output(self.lower_radial_extend_pin, GPIO.LOW)
+        self.run_actuator('lower_radial_extend', duration)
 
     def control_lower_radial_retract(self, duration):
         """控制下方径向伸缩杆收缩 - 双继电器控制"""
-        logger.info(f"下方径向伸缩杆收缩 {duration}秒")
-        # 确保伸长继电器断开
-        GPIO.output(self.lower_radial_extend_pin, GPIO.LOW)
-        # 激活收缩继电器
-        GPIO.output(self.lower_radial_retract_pin, GPIO.HIGH)
-        time.sleep(duration)
-        # 断电 - 两个继电器都设为低电平
-        GPIO.output(self.lower_radial_retract_pin, GPIO.LOW)
+        self.run_actuator('lower_radial_retract', duration)
 
     # 水平伸缩杆控制函数
     def control_upper_horizontal_extend(self, duration):
         """控制上方水平伸缩杆伸长"""
-        logger.info(f"上方水平伸缩杆伸长 {duration}秒")
-        GPIO.output(self.upper_horizontal_extend_pin, GPIO.HIGH)
-        time.sleep(duration)
-        GPIO.output(self.upper_horizontal_extend_pin, GPIO.LOW)
+        self.run_actuator('upper_horizontal_extend', duration)
 
     def control_upper_horizontal_retract(self, duration):
         """控制上方水平伸缩杆收缩"""
-        logger.info(f"上方水平伸缩杆收缩 {duration}秒")
-        GPIO.output(self.upper_horizontal_retract_pin, GPIO.HIGH)
-        time.sleep(duration)
-        GPIO.output(self.upper_horizontal_retract_pin, GPIO.LOW)
+        self.run_actuator('upper_horizontal_retract', duration)
 
     # 红3黑4为先伸长后缩短
     def control_lower_horizontal_extend(self, duration):
         """控制下方水平伸缩杆伸长"""
-        logger.info(f"下方水平伸缩杆伸长 {duration}秒")
-        GPIO.output(self.lower_horizontal_extend_pin, GPIO.HIGH)
-        time.sleep(duration)
-        GPIO.output(self.lower_horizontal_extend_pin, GPIO.LOW)
+        self.run_actuator('lower_horizontal_extend', duration)
 
     def control_lower_horizontal_retract(self, duration):
         """控制下方水平伸缩杆收缩"""
-        logger.info(f"下方水平伸缩杆收缩 {duration}秒")
-        GPIO.output(self.lower_horizontal_retract_pin, GPIO.HIGH)
-        time.sleep(duration)
-        GPIO.output(self.lower_horizontal_retract_pin, GPIO.LOW)
+        self.run_actuator('lower_horizontal_retract', duration)
 
     # 竖直伸缩杆控制函数 - 修改为双继电器控制
     def control_vertical_extend(self, duration):
         """控制竖直伸缩杆伸长 - 双继电器控制"""
-        logger.info(f"竖直伸缩杆伸长 {duration}秒")
-        # 确保收缩继电器断开
-        GPIO.output(self.vertical_retract_pin, GPIO.LOW)
-        # 激活伸长继电器
-        GPIO.output(self.vertical_extend_pin, GPIO.HIGH)
-        time.sleep(duration)
-        # 断电 - 两个继电器都设为低电平
-        GPIO.output(self.vertical_extend_pin, GPIO.LOW)
+        self.run_actuator('vertical_extend', duration)
 
     def control_vertical_retract(self, duration):
         """控制竖直伸缩杆收缩 - 双继电器控制"""
-        logger.info(f"竖直伸缩杆收缩 {duration}秒")
-        # 确保伸长继电器断开
-        GPIO.output(self.vertical_extend_pin, GPIO.LOW)
-        # 激活收缩继电器
-        GPIO.output(self.vertical_retract_pin, GPIO.HIGH)
-        time.sleep(duration)
-        # 断电 - 两个继电器都设为低电平
-        GPIO.output(self.vertical_retract_pin, GPIO.LOW)
+        self.run_actuator('vertical_retract', duration)
+
+    def move_vertical(self, direction, displacement, max_time, start_height=None, rate=None):
+        """
+        闭环竖直移动 - 通电后持续测距，达到目标位移或停滞时立即断电，最长通电 max_time 秒
+        后台采样器在运行时直接使用它的新样本，否则自己按 HC-SR04 的最小间隔触发测距
+        每个样本按速度外推到当前时刻，再取最近 vertical_filter_window 个的中值，抵消测距滞后和单次噪声
+        :param direction: 'up' 竖直杆伸长 / 'down' 竖直杆收缩
+        :param displacement: 目标位移 (cm)，沿运动方向为正
+        :param max_time: 最长通电时间（秒）
+        :param start_height: 通电前的高度 (cm)，默认通电前测量
+        :param rate: 预计速度 (cm/s)，默认取该方向的标定速度
+        :return: VerticalMove
+        """
+        if direction == 'up':
+            action, sign = 'vertical_extend', 1.0
+            rate = rate or self.vertical_speed
+            dead_time = self.vertical_dead_time
+        else:
+            action, sign = 'vertical_retract', -1.0
+            rate = rate or self.vertical_retract_speed
+            dead_time = self.vertical_retract_dead_time
+        period = self.ultrasonic_retry_interval
+
+        if start_height is None:
+            height = self.get_current_height()
+            if isinstance(height, NoEcho):
+                raise RuntimeError(f"超声波无回声，无法闭环移动: {height.reason}")
+            start_height = height
+
+        handle = self.start_actuator(action, max_time)
+        clock = self.clock
+        last_sample = self.last_height
+        recent = []  # 最近几个样本 [(测距时刻, 位移)]
+        motion_start = handle.start_time + dead_time
+        progress = (motion_start, 0.0)  # 最近一次位移新增 vertical_stall_distance 的 (时刻, 位移)
+        moved = 0.0
+        reason = 'timeout'
+
+        while not handle.done():
+            self.heartbeat(period)
+            sample = self.last_height
+            if sample is last_sample and (sample is None or clock.monotonic() - sample[0] >= period * 1.2):
+                # 一个采样周期内没有新样本（后台采样器未运行），自己触发测距
+                self.get_current_height()
+                sample = self.last_height
+
+            if sample is not last_sample:
+                last_sample = sample
+                now = clock.monotonic()
+                recent.append((sample[0], sign * (sample[1] - start_height)))
+                del recent[:-self.vertical_filter_window]
+                moved = sorted(m + rate * (now - max(t, motion_start)) for t, m in recent)[len(recent) // 2]
+
+                remaining = displacement - moved
+                if remaining < rate * period:
+                    # 下一个样本之前就会到达，按速度算好剩余时间后断电
+                    if remaining > 0:
+                        handle.join(remaining / rate)
+                        moved = displacement
+                    reason = 'reached'
+                    break
+
+                if moved >= progress[1] + self.vertical_stall_distance:
+                    progress = (now, moved)
+                elif now - progress[0] > self.vertical_stall_time:
+                    reason = 'stalled'
+                    break
+
+            handle.join(period / 3)
+
+        if not handle.done():
+            self.actuator_engine.cancel(handle)
+        handle.join()
+        self.check_stop()
+        self._vertical_moves[reason].inc()
+        self.tracer.record(EV_VERTICAL_STOP, VerticalMove.REASONS.index(reason), moved)
+        return VerticalMove(moved, handle.elapsed(), reason, handle)
 
     # 舵机控制函数 - 使用测试代码中的精确控制方式
+    def set_servo_angle(self, side, degrees):
+        """
+        设置舵机相对中性位置的角度，立即返回不等待舵机转到位
+        :param side: 'upper' 或 'lower'
+        :param degrees: 角度，正数为顺时针（杆向前），负数为逆时针（杆向后）
+        """
+        servo = self.upper_servo if side == 'upper' else self.lower_servo
+        duty_cycle = self.servo_neutral_duty + (degrees / self.servo_degree_ratio)
+        servo.ChangeDutyCycle(duty_cycle)
+        self.tracer.record(EV_SERVO, self.upper_servo_pin if side == 'upper' else self.lower_servo_pin, degrees)
+
     def rotate_upper_servo_ccw(self, degrees=5):
         """上方舵机逆时针旋转（杆向后）"""
-        logger.info(f"上方舵机逆时针旋转 {degrees}度")
-        duty_cycle = self.servo_neutral_duty - (degrees / self.servo_degree_ratio)
-        self.upper_servo.ChangeDutyCycle(duty_cycle)
-        time.sleep(self.servo_rotation_time)
+        self.set_servo_angle('upper', -degrees)
+        self.wait(self.servo_rotation_time)
 
     def rotate_upper_servo_cw(self, degrees=5):
         """上方舵机顺时针旋转（杆向前）"""
-        logger.info(f"上方舵机顺时针旋转 {degrees}度")
-        duty_cycle = self.servo_neutral_duty + (degrees / self.servo_degree_ratio)
-        self.upper_servo.ChangeDutyCycle(duty_cycle)
-        time.sleep(self.servo_rotation_time)
+        self.set_servo_angle('upper', degrees)
+        self.wait(self.servo_rotation_time)
 
     def rotate_lower_servo_ccw(self, degrees=5):
         """下方舵机逆时针旋转（杆向后）"""
-        logger.info(f"下方舵机逆时针旋转 {degrees}度")
-        duty_cycle = self.servo_neutral_duty - (degrees / self.servo_degree_ratio)
-        self.lower_servo.ChangeDutyCycle(duty_cycle)
-        time.sleep(self.servo_rotation_time)
+        self.set_servo_angle('lower', -degrees)
+        self.wait(self.servo_rotation_time)
 
     def rotate_lower_servo_cw(self, degrees=5):
         """下方舵机顺时针旋转（杆向前）"""
-        logger.info(f"下方舵机顺时针旋转 {degrees}度")
-        duty_cycle = self.servo_neutral_duty + (degrees / self.servo_degree_ratio)
-        self.lower_servo.ChangeDutyCycle(duty_cycle)
-        time.sleep(self.servo_rotation_time)
+        self.set_servo_angle('lower', degrees)
+        self.wait(self.servo_rotation_time)
 
     def reset_servos(self):
         """重置舵机到中性位置"""
         logger.info("重置舵机到中性位置")
         self.upper_servo.ChangeDutyCycle(self.servo_neutral_duty)
         self.lower_servo.ChangeDutyCycle(self.servo_neutral_duty)
-        time.sleep(self.servo_rotation_time)
+        self.tracer.record(EV_SERVO, self.upper_servo_pin, 0.0)
+        self.tracer.record(EV_SERVO, self.lower_servo_pin, 0.0)
+        # 复位是停止和关机流程的一部分，不被停止请求打断
+        self.heartbeat(self.servo_rotation_time)
+        self.clock.sleep(self.servo_rotation_time)
 
-    def final_extend(self):
+    def final_release_plan(self, profile=None):
+        """
+        生成最终松开操作的依赖图
+        :param profile: 'parallel' 径向杆同时松开，水平杆在松开抓握后重叠收回；
+                        'serial' 保持原来的逐个执行顺序
+        :return: ScheduledAction 列表
+        """
+        profile = profile or self.final_release_profile
+        rad = self.final_extend_time_rad
+        hor = self.final_extend_time_hor
+
+        if profile == 'serial':
+            return [
+                ScheduledAction('upper_radial', 'upper_radial_extend', rad),
+                ScheduledAction('upper_horizontal', 'upper_horizontal_retract', hor, [('upper_radial', None)]),
+                ScheduledAction('lower_radial', 'lower_radial_extend', rad, [('upper_horizontal', None)]),
+                ScheduledAction('lower_horizontal', 'lower_horizontal_retract', hor, [('lower_radial', None)]),
+            ]
+
+        if profile == 'parallel':
+            # 径向杆先动作；水平杆只依赖同侧径向杆已松开抓握，不等其伸到底
+            grip = min(self.final_release_grip_time, rad)
+            return [
+                ScheduledAction('upper_radial', 'upper_radial_extend', rad),
+                ScheduledAction('lower_radial', 'lower_radial_extend', rad),
+                ScheduledAction('upper_horizontal', 'upper_horizontal_retract', hor, [('upper_radial', grip)]),
+                ScheduledAction('lower_horizontal', 'lower_horizontal_retract', hor, [('lower_radial', grip)]),
+            ]
+
+        raise ValueError(f"未知的最终松开方案: {profile}")
+
+    def final_extend(self, profile=None):
         """
         最终松开功能 - 伸长上下两个径向杆来松开对柱子的抓握，并收回水平杆
+        :param profile: 松开方案，默认使用 self.final_release_profile
+        :return: 实际执行时间表 [(节点名称, 开始秒数, 结束秒数)]
         """
-        logger.info("=== 开始最终松开操作 ===")
+        profile = profile or self.final_release_profile
+        logger.info(f"=== 开始最终松开操作 ({profile}) ===")
         
         try:
-            # 第一步：伸长上下径向杆松开柱子
-            logger.info("伸长上下径向杆松开柱子...")
-            self.control_upper_radial_extend(self.final_extend_time_rad)
-            self.control_upper_horizontal_retract(self.final_extend_time_hor)
-            
-            logger.info("径向杆伸长完成，开始收回水平杆...")
-            
-            # 第二步：收回上下水平杆
-            logger.info("收回上下水平杆...")
-            self.control_lower_radial_extend(self.final_extend_time_rad)
-            self.control_lower_horizontal_retract(self.final_extend_time_hor)
-            
-            logger.info("最终松开操作完成 - 机器人已松开柱子并收回水平杆")
-            
+            plan = self.final_release_plan(profile)
+            # 时间表不会长于各动作依次执行
+            self.heartbeat(sum(action.duration for action in plan))
+            schedule = run_schedule(self.start_actuator, plan, self.clock, self.stop_event)
+
+            for name, start, end in schedule:
+                logger.info(f"  {name}: {start:.2f}s -> {end:.2f}s")
+            total = max(end for _, _, end in schedule)
+            logger.info(f"最终松开操作完成 - 机器人已松开柱子并收回水平杆，总用时 {total:.2f}秒")
+            return schedule
+
+        except StopRequested:
+            logger.warning("最终松开操作被停止")
+            raise
         except Exception as e:
             logger.error(f"最终松开操作中出错: {e}")
             raise
@@ -327,10 +978,12 @@ class ClimbingRobot:
         """针对30cm直径柱子的初始收缩"""
         logger.info("开始30cm直径柱子初始收缩...")
 
-        # 使用已有的控制函数，分别控制径向杆和水平杆
-        logger.info("开始收缩径向伸缩杆...")
-        self.control_upper_radial_retract(self.radial_retract_time_30cm)
-        self.control_lower_radial_retract(self.radial_retract_time_30cm)
+        # 上下两侧机械上互不影响，同时收缩径向杆
+        logger.info(f"同时收缩上下径向伸缩杆 {self.radial_retract_time_30cm}秒...")
+        self.run_actuators_parallel([
+            ('upper_radial_retract', self.radial_retract_time_30cm),
+            ('lower_radial_retract', self.radial_retract_time_30cm),
+        ])
 
         # logger.info("径向杆收缩完成，开始收缩水平杆...")
         # self.control_upper_horizontal_retract(self.horizontal_retract_time_30cm)
@@ -342,14 +995,18 @@ class ClimbingRobot:
         """针对60cm直径柱子的初始收缩"""
         logger.info("开始60cm直径柱子初始收缩...")
 
-        # 使用已有的控制函数，分别控制径向杆和水平杆
-        logger.info("开始收缩径向伸缩杆...")
-        self.control_upper_radial_retract(self.radial_retract_time_60cm)
-        self.control_lower_radial_retract(self.radial_retract_time_60cm)
+        # 上下两侧机械上互不影响，同时收缩径向杆
+        logger.info(f"同时收缩上下径向伸缩杆 {self.radial_retract_time_60cm}秒...")
+        self.run_actuators_parallel([
+            ('upper_radial_retract', self.radial_retract_time_60cm),
+            ('lower_radial_retract', self.radial_retract_time_60cm),
+        ])
 
-        logger.info("径向杆收缩完成，开始收缩水平杆...")
-        self.control_upper_horizontal_retract(self.horizontal_retract_time_60cm)
-        self.control_lower_horizontal_retract(self.horizontal_retract_time_60cm)
+        logger.info(f"径向杆收缩完成，同时收缩上下水平杆 {self.horizontal_retract_time_60cm}秒...")
+        self.run_actuators_parallel([
+            ('upper_horizontal_retract', self.horizontal_retract_time_60cm),
+            ('lower_horizontal_retract', self.horizontal_retract_time_60cm),
+        ])
 
         logger.info("60cm直径柱子初始收缩完成")
 
@@ -401,35 +1058,29 @@ class ClimbingRobot:
         logger.warning("紧急停止!")
         self.is_climbing = False
 
-        # 立即停止所有径向伸缩杆输出
-        GPIO.output(self.upper_radial_extend_pin, GPIO.LOW)
-        GPIO.output(self.upper_radial_retract_pin, GPIO.LOW)
-        GPIO.output(self.lower_radial_extend_pin, GPIO.LOW)
-        GPIO.output(self.lower_radial_retract_pin, GPIO.LOW)
-
-        # 立即停止所有水平伸缩杆输出
-        GPIO.output(self.upper_horizontal_extend_pin, GPIO.LOW)
-        GPIO.output(self.upper_horizontal_retract_pin, GPIO.LOW)
-        GPIO.output(self.lower_horizontal_extend_pin, GPIO.LOW)
-        GPIO.output(self.lower_horizontal_retract_pin, GPIO.LOW)
-
-        # 立即停止竖直伸缩杆输出 - 确保两个继电器都断开
-        GPIO.output(self.vertical_extend_pin, GPIO.LOW)
-        GPIO.output(self.vertical_retract_pin, GPIO.LOW)
+        # 一次写入立即断开全部继电器（径向、水平、竖直两个方向），不依赖影子寄存器的记录，并取消所有脉冲
+        self.request_stop("紧急停止")
 
         # 重置舵机
         self.reset_servos()
 
         # 清理GPIO
-        GPIO.cleanup()
+        self.gpio.cleanup()
+        self.pins.invalidate()
+        self.save_actuator_state()
 
         logger.info("紧急停止完成")
+        if self.io_process is None:
+            self.tracer.flush()
 
     def power_off(self):
         """关闭电源并清理资源"""
         logger.info("攀爬完成，关闭电源...")
         self.is_climbing = False
 
+        # 结束所有仍在通电的定时脉冲
+        self.actuator_engine.cancel_all()
+
         # 重置舵机到中性位置
         self.reset_servos()
 
@@ -438,13 +1089,26 @@ class ClimbingRobot:
         self.lower_servo.stop()
 
         # 清理GPIO
-        GPIO.cleanup()
+        self.gpio.cleanup()
+        self.pins.invalidate()
+        self.save_actuator_state()
+        if self.trimmed_time > 0:
+            logger.info(f"按行程推算共少通电 {self.trimmed_time:.2f}秒")
 
         logger.info("系统已安全关闭")
+        self.stop_watchdog()
+        self.close_state_block()
+        self.stop_metrics()
+
+        # 写出剩余事件并关闭追踪文件
+        if self.io_process is None:
+            self.tracer.stop()
+        else:
+            self.io_process.stop_tracer()
 
     def __del__(self):
         """析构函数，确保GPIO被正确清理"""
         try:
-            GPIO.cleanup()
+            self.gpio.cleanup()
         except:
             pass
\ No newline at end of file
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+仿真GPIO后端 - 不需要树莓派即可运行完整的上升/下降任务
+根据继电器通电时间推算每个气缸的行程位置，根据舵机占空比推算角度，
+由径向杆位置判断抓紧/松开状态，并按仿真高度生成带噪声的超声波回声
+"""
+
+import random
+import threading
+import logging
+
+from gpio_backend import GPIOBackend
+from clock import RealClock
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedPWM:
+    """仿真PWM输出 - 只记录占空比"""
+
+    def __init__(self, backend, channel, frequency):
+        self.backend = backend
+        self.channel = channel
+        self.frequency = frequency
+
+    def start(self, duty_cycle):
+        self.backend._set_duty(self.channel, duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.backend._set_duty(self.channel, duty_cycle)
+
+    def stop(self):
+        self.backend._set_duty(self.channel, None)
+
+
+class SimulatedCylinder:
+    """仿真气缸 - 位置 0 为完全收缩，1 为完全伸出"""
+
+    def __init__(self, name, stroke_time, position=0.0):
+        self.name = name
+        self.stroke_time = stroke_time  # 全行程所需通电时间（秒）
+        self.position = position
+        self.extend_pin = None
+        self.retract_pin = None
+
+    def drive(self, levels):
+        """当前驱动方向: 1 伸长, -1 收缩, 0 不动（两个继电器同时通电视为不动）"""
+        extend = bool(self.extend_pin is not None and levels.get(self.extend_pin))
+        retract = bool(self.retract_pin is not None and levels.get(self.retract_pin))
+        if extend == retract:
+            return 0
+        return 1 if extend else -1
+
+
+class SimulatedGPIO(GPIOBackend):
+    def __init__(self, initial_height=50.0, vertical_speed=1.2, radial_stroke_time=20.0,
+                 horizontal_stroke_time=6.0, vertical_stroke_time=12.0, grip_release_position=0.02,
+                 unrotated_efficiency=0.5, slip_speed=5.0, noise_cm=0.3, dropout_rate=0.0,
+                 echo_latency=0.0005, pressure_decay=0.0, seed=None):
+        """
+        初始化仿真后端
+        :param initial_height: 初始高度 (cm)
+        :param vertical_speed: 一侧松开时竖直杆带动机器人移动的速度 (cm/s)
+        :param radial_stroke_time: 径向杆全行程时间（秒）
+        :param horizontal_stroke_time: 水平杆全行程时间（秒）
+        :param vertical_stroke_time: 竖直杆全行程时间（秒），仅用于记录行程位置
+        :param grip_release_position: 径向杆伸出超过该行程比例即松开抓握
+        :param unrotated_efficiency: 松开一侧舵机未转动时的移动效率 (0-1)
+        :param slip_speed: 上下两侧同时松开时的下滑速度 (cm/s)
+        :param noise_cm: 超声波测量噪声标准差 (cm)
+        :param dropout_rate: 超声波丢失回声的概率 (0-1)
+        :param echo_latency: 触发到回声上升沿的延迟（秒）
+        :param pressure_decay: 气源压力下降速率，竖直杆每通电1秒速度下降的比例，最低降到初始速度的30%
+        :param seed: 随机数种子
+        """
+        self.height = initial_height
+        self.vertical_speed = vertical_speed
+        self.grip_release_position = grip_release_position
+        self.unrotated_efficiency = unrotated_efficiency
+        self.slip_speed = slip_speed
+        self.noise_cm = noise_cm
+        self.dropout_rate = dropout_rate
+        self.echo_latency = echo_latency
+        self.pressure_decay = pressure_decay
+        self.sound_speed = 34300  # 声速 cm/s
+
+        self.cylinders = {
+            'upper_radial': SimulatedCylinder('upper_radial', radial_stroke_time),
+            'lower_radial': SimulatedCylinder('lower_radial', radial_stroke_time),
+            'upper_horizontal': SimulatedCylinder('upper_horizontal', horizontal_stroke_time),
+            'lower_horizontal': SimulatedCylinder('lower_horizontal', horizontal_stroke_time),
+            'vertical': SimulatedCylinder('vertical', vertical_stroke_time, 0.5),
+        }
+
+        self.clock = RealClock()  # bind() 时换成机器人的时钟
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._levels = {}  # 引脚 -> 输出电平
+        self._duty = {}  # 舵机引脚 -> 占空比
+        self._callbacks = {}  # 输入引脚 -> 边沿回调
+        self._last_time = self.clock.monotonic()
+        self._trigger_high = False
+        self._echo_window = None  # (上升沿时刻, 下降沿时刻)，触发时锁存，input() 按它判断回声电平
+
+        # 仿真统计
+        self.climbed_up = 0.0  # 累计上升距离 (cm)
+        self.climbed_down = 0.0  # 累计下降距离 (cm)
+        self.slip_time = 0.0  # 两侧同时松开的时间（秒）
+        self.stall_time = 0.0  # 竖直杆通电但没有带动机器人的时间（秒）
+        self.pin_on_time = {}  # 引脚 -> 累计通电时间（秒）
+        self.vertical_on_time = 0.0  # 竖直杆累计通电时间（秒），决定气源压力下降
+        self.pings = 0  # 超声波触发次数
+        self.output_calls = 0  # output 调用次数（一次列表写入算一次）
+
+        # 由 bind() 根据机器人引脚分配填写
+        self.trig_pin = None
+        self.echo_pin = None
+        self.servo_sides = {}  # 舵机引脚 -> 'upper'/'lower'
+        self.servo_neutral_duty = 7.5
+        self.servo_degree_ratio = 18.0
+
+    def bind(self, robot):
+        """读取机器人的引脚分配和舵机参数，并与机器人共用时钟"""
+        self.clock = robot.clock
+        self._last_time = self.clock.monotonic()
+        for name, (cylinder, on_pin, _) in robot.actuators.items():
+            if name.endswith('_extend'):
+                self.cylinders[cylinder].extend_pin = on_pin
+            else:
+                self.cylinders[cylinder].retract_pin = on_pin
+        self.trig_pin = robot.ultrasonic_trig_pin
+        self.echo_pin = robot.ultrasonic_echo_pin
+        self.servo_sides = {robot.upper_servo_pin: 'upper', robot.lower_servo_pin: 'lower'}
+        self.servo_neutral_duty = robot.servo_neutral_duty
+        self.servo_degree_ratio = robot.servo_degree_ratio
+
+    # 物理模型
+    def current_vertical_speed(self):
+        """当前气源压力下的竖直杆速度 (cm/s)"""
+        return self.vertical_speed * max(1.0 - self.pressure_decay * self.vertical_on_time, 0.3)
+
+    def servo_angle(self, side):
+        """舵机相对中性位置的角度（度），PWM停止时为 0"""
+        for pin, servo_side in self.servo_sides.items():
+            if servo_side == side:
+                duty = self._duty.get(pin)
+                if duty is None:
+                    return 0.0
+                return (duty - self.servo_neutral_duty) * self.servo_degree_ratio
+        return 0.0
+
+    def gripping(self, side):
+        """指定一侧是否抓紧柱子（径向杆收缩为抓紧）"""
+        return self.cylinders[f'{side}_radial'].position <= self.grip_release_position
+
+    def _advance(self, now=None):
+        """把仿真状态推进到当前时刻 - 两次GPIO调用之间继电器状态不变，逐段积分是精确的"""
+        with self._lock:
+            now = self.clock.monotonic() if now is None else now
+            dt = now - self._last_time
+            if dt <= 0:
+                return
+            self._last_time = now
+
+            for pin, level in self._levels.items():
+                if level:
+                    self.pin_on_time[pin] = self.pin_on_time.get(pin, 0.0) + dt
+
+            vertical_drive = self.cylinders['vertical'].drive(self._levels)
+            if vertical_drive:
+                self.vertical_on_time += dt
+            upper_grip = self.gripping('upper')
+            lower_grip = self.gripping('lower')
+
+            if not upper_grip and not lower_grip:
+                # 两侧都松开，沿柱子下滑
+                self.slip_time += dt
+                drop = min(self.slip_speed * dt, self.height)
+                self.height -= drop
+                self.climbed_down += drop
+            elif vertical_drive and upper_grip != lower_grip:
+                # 一侧抓紧、一侧松开，竖直杆带动机器人移动；舵机未转动时效率降低
+                released = 'lower' if upper_grip else 'upper'
+                efficiency = 1.0 if abs(self.servo_angle(released)) >= 1.0 else self.unrotated_efficiency
+                move = vertical_drive * self.current_vertical_speed() * efficiency * dt
+                self.height = max(self.height + move, 0.0)
+                if move > 0:
+                    self.climbed_up += move
+                else:
+                    self.climbed_down -= move
+            elif vertical_drive:
+                # 两侧都抓紧，竖直杆憋住不动
+                self.stall_time += dt
+
+            for cylinder in self.cylinders.values():
+                drive = cylinder.drive(self._levels)
+                if drive:
+                    cylinder.position = min(max(cylinder.position + drive * dt / cylinder.stroke_time, 0.0), 1.0)
+
+    # GPIO接口
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, channel, direction):
+        channels = channel if isinstance(channel, (list, tuple)) else [channel]
+        with self._lock:
+            if direction == self.OUT:
+                for pin in channels:
+                    self._levels.setdefault(pin, self.LOW)
+
+    def output(self, channel, value):
+        """与 RPi.GPIO 一样接受引脚列表，列表中的引脚在同一时刻改变电平"""
+        channels = channel if isinstance(channel, (list, tuple)) else [channel]
+        values = value if isinstance(value, (list, tuple)) else [value] * len(channels)
+        with self._lock:
+            now = self.clock.monotonic()
+            self._advance(now)
+            self.output_calls += 1
+            for pin, level in zip(channels, values):
+                self._levels[pin] = level
+                if pin == self.trig_pin:
+                    if level:
+                        self._trigger_high = True
+                    elif self._trigger_high:
+                        self._trigger_high = False
+                        self._ping(now)
+
+    def input(self, channel):
+        if channel == self.echo_pin:
+            window = self._echo_window
+            now = self.clock.monotonic()
+            return self.HIGH if window is not None and window[0] <= now < window[1] else self.LOW
+        return self._levels.get(channel, self.LOW)
+
+    def PWM(self, channel, frequency):
+        return SimulatedPWM(self, channel, frequency)
+
+    def add_event_detect(self, channel, edge, callback=None):
+        self._callbacks[channel] = callback
+
+    def cleanup(self):
+        with self._lock:
+            self._advance()
+            for channel in self._levels:
+                self._levels[channel] = self.LOW
+            self._duty.clear()
+
+    def _set_duty(self, channel, duty_cycle):
+        with self._lock:
+            self._advance()
+            if duty_cycle is None:
+                self._duty.pop(channel, None)
+            else:
+                self._duty[channel] = duty_cycle
+
+    def _ping(self, now):
+        """触发信号下降沿 - 按当前高度生成回声脉冲"""
+        self.pings += 1
+        if self._random.random() < self.dropout_rate:
+            self._echo_window = None
+            return
+
+        distance = max(self.height + self._random.gauss(0.0, self.noise_cm), 0.1)
+        rise = now + self.echo_latency
+        fall = rise + 2 * distance / self.sound_speed
+        self._echo_window = (rise, fall)
+
+        callback = self._callbacks.get(self.echo_pin)
+        if callback is not None:
+            self.clock.call_later(rise - now, self._deliver_echo, callback, rise, fall)
+
+    def _deliver_echo(self, callback, rise, fall):
+        """
+        在同一个线程中依次产生上升沿和下降沿回调，保证顺序
+        下降沿按上升沿的实际回调延迟顺延，两个边沿延迟相同，脉宽不受线程调度影响
+        """
+        lateness = self.clock.monotonic() - rise
+        with self._lock:
+            # 锁存的回声窗口随回调一起顺延: 回调中读到的电平与送达的边沿一致，
+            # 上升沿回调迟到超过脉宽时也不会读到低电平而丢掉这次回声；已被新的触发替换时不改
+            if self._echo_window == (rise, fall):
+                self._echo_window = (rise + lateness, fall + lateness)
+        callback(self.echo_pin)
+        if self.clock.virtual:
+            # 虚拟时钟下定时器准时执行；下降沿另行登记，不在定时器回调中推进时间，轮询测距才能看到高电平
+            self.clock.call_later(fall - self.clock.monotonic(), callback, self.echo_pin)
+            return
+        target = fall + lateness
+        self.clock.sleep(target - self.clock.monotonic() - 0.0005)
+        # 最后不到1ms自旋等待，避免 sleep 的唤醒误差变成测距误差
+        while self.clock.monotonic() < target:
+            self.clock.spin()
+        callback(self.echo_pin)
+
+    def stats(self):
+        """仿真统计"""
+        with self._lock:
+            self._advance()
+            return {
+                'height': self.height,
+                'climbed_up': self.climbed_up,
+                'climbed_down': self.climbed_down,
+                'slip_time': self.slip_time,
+                'stall_time': self.stall_time,
+                'pings': self.pings,
+                'output_calls': self.output_calls,
+                'vertical_speed': self.current_vertical_speed(),
+                'pin_on_time': dict(self.pin_on_time),
+                'cylinders': {name: c.position for name, c in self.cylinders.items()},
+            }
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+共享内存状态块 - 定长布局、带版本号、用顺序锁保护的机器人当前状态（高度、步数、继电器电平、舵机占空比、控制器输出）
+ClimbingRobot 在每个状态变化的事件记录时原地更新对应字段，控制线程没有系统调用也没有序列化；
+任意数量的本机读取者（监视面板、记录程序、测试）直接映射同一段内存，可以按 kHz 频率轮询
+
+顺序锁: 写入前把序号加1（变为奇数），写完字段后再加1（变为偶数）；读取者复制整块后序号为偶数且与复制前相同才算成功，
+否则重试。只有一个写入进程，进程内的多个线程由锁串行
+
+也可以直接运行，在终端中显示正在运行的机器人的状态:
+    python3 state_block.py
+    python3 state_block.py --name climbing_robot --interval 0.05
+"""
+
+import os
+import time
+import struct
+import argparse
+import threading
+import logging
+from multiprocessing import shared_memory, resource_tracker
+
+from tracer import (EV_ACTUATOR_ON, EV_ACTUATOR_OFF, EV_ACTUATOR_CANCEL, EV_SERVO, EV_HEIGHT, EV_NO_ECHO,
+                    EV_POSITION, EV_PID_OUTPUT, EV_STEP_START, EV_STEP_END, EV_PROGRESS, EV_RATE_ESTIMATE,
+                    EV_VERTICAL_STOP, EV_STOP_REQUEST)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAME = 'climbing_robot'  # 共享内存名称，Linux 上为 /dev/shm/climbing_robot
+MAGIC = b'CRSB'
+VERSION = 1  # 布局变化时加1，读取者拒绝不认识的版本
+
+# 块头: 魔数, 布局版本, 总字节数, 顺序锁序号, 写入进程号
+HEADER = struct.Struct('<4sHHQi4x')
+SEQ = struct.Struct('<Q')
+SEQ_OFFSET = 8
+
+MAX_RELAYS = 16  # relay_pins 的槽位数
+
+# 字段按顺序紧跟块头，8字节字段在前保持对齐；时刻都取自机器人的时钟 (clock.monotonic)
+FIELDS = (
+    ('updated', 'd'),  # 最近一次更新的时刻
+    ('height', 'd'),  # 最近一次有效测距 (cm)
+    ('height_time', 'd'),  # 该次测距的时刻
+    ('position', 'd'),  # 控制器使用的当前位置 (cm)
+    ('controller_output', 'd'),  # 控制器最近一次计算出的移动时间（秒），PID输出或规划结果
+    ('movement_time', 'd'),  # 当前步的移动时间（秒）
+    ('step_time', 'd'),  # 上一步的用时（秒）
+    ('rate_estimate', 'd'),  # 竖直杆速度估计 (cm/s)
+    ('remaining', 'd'),  # 距目标的剩余距离 (cm)
+    ('vertical_displacement', 'd'),  # 最近一次闭环竖直移动的估计位移 (cm)
+    ('upper_servo_duty', 'd'),  # 上方舵机占空比
+    ('lower_servo_duty', 'd'),  # 下方舵机占空比
+    ('step', 'I'),  # 当前（最近开始的）步数
+    ('steps_completed', 'I'),  # 最近完成的步数
+    ('no_echo', 'I'),  # 累计测距失败次数
+    ('relay_levels', 'I'),  # 继电器电平位图，第 i 位对应 relay_pins[i]
+    ('flags', 'I'),  # FLAG_*
+    ('relay_count', 'I'),  # relay_pins 中有效的个数
+    ('relay_pins', f'{MAX_RELAYS}B'),  # 继电器引脚编号，创建时写入
+)
+BODY = struct.Struct('<' + ''.join(code for _, code in FIELDS))
+SIZE = HEADER.size + BODY.size
+
+FLAG_ACTIVE = 1  # 写入进程正在运行，正常关闭时清除
+FLAG_STOP_REQUESTED = 2  # 已请求停止（见 ClimbingRobot.request_stop）
+
+
+def _field_offsets():
+    """字段名 -> 块内偏移"""
+    offsets = {}
+    offset = HEADER.size
+    for name, code in FIELDS:
+        offsets[name] = offset
+        offset += struct.calcsize('<' + code)
+    return offsets
+
+
+OFFSETS = _field_offsets()
+
+# Python 没有内存屏障原语，用一次无竞争锁的获取和释放代替（其实现包含屏障指令），
+# 保证序号与字段的写入/读取顺序在弱内存序的 ARM 上也不被打乱
+_fence_lock = threading.Lock()
+
+
+def _fence():
+    _fence_lock.acquire()
+    _fence_lock.release()
+
+
+def _pid_alive(pid):
+    """进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class StateBlock:
+    """写入端 - 创建共享内存段，由 ClimbingRobot 在记录事件时更新"""
+
+    def __init__(self, name=DEFAULT_NAME, relay_pins=(), servo_pins=(None, None), servo_neutral_duty=7.5,
+                 servo_degree_ratio=18.0):
+        """
+        创建状态块；同名的段属于已退出的进程（如被看门狗结束）时替换它，
+        属于仍在运行的进程或不是状态块时抛出 FileExistsError
+        :param name: 共享内存名称
+        :param relay_pins: 继电器引脚，电平位图按该顺序
+        :param servo_pins: (上方舵机引脚, 下方舵机引脚)
+        :param servo_neutral_duty: 舵机中性位置占空比
+        :param servo_degree_ratio: 角度转换比例，占空比 = 中性占空比 + 角度 / 比例
+        """
+        relay_pins = list(relay_pins)
+        if len(relay_pins) > MAX_RELAYS:
+            raise ValueError(f"继电器引脚数 {len(relay_pins)} 超过上限 {MAX_RELAYS}")
+        self.name = name
+        self._shm = self._create(name)
+        self._buf = self._shm.buf
+        self._lock = threading.Lock()  # 执行器定时线程、采样线程和控制线程都会更新
+        self._seq = 0
+
+        self._relay_bits = {pin: 1 << i for i, pin in enumerate(relay_pins)}
+        self._relays = 0
+        self._flags = FLAG_ACTIVE
+        self._no_echo = 0
+        upper_pin, lower_pin = servo_pins
+        self._servo_fields = {upper_pin: 'upper_servo_duty', lower_pin: 'lower_servo_duty'}
+        self.servo_neutral_duty = servo_neutral_duty
+        self.servo_degree_ratio = servo_degree_ratio
+
+        # 每个字段预先编译 pack_into，更新时只写变化的字段
+        self._packers = {name: (struct.Struct('<' + code).pack_into, OFFSETS[name])
+                         for name, code in FIELDS if name != 'relay_pins'}
+
+        self._buf[:SIZE] = bytes(SIZE)
+        HEADER.pack_into(self._buf, 0, MAGIC, VERSION, SIZE, 0, os.getpid())
+        pins = relay_pins + [0] * (MAX_RELAYS - len(relay_pins))
+        struct.pack_into(f'<{MAX_RELAYS}B', self._buf, OFFSETS['relay_pins'], *pins)
+        self._set('relay_count', len(relay_pins))
+        self._set('upper_servo_duty', servo_neutral_duty)
+        self._set('lower_servo_duty', servo_neutral_duty)
+        self._set('flags', self._flags)
+
+        # 事件类型 -> 更新函数 (时刻, 引脚, 数值)
+        self._handlers = {
+            EV_ACTUATOR_ON: self._on_relay_on,
+            EV_ACTUATOR_OFF: self._on_relay_off,
+            EV_ACTUATOR_CANCEL: self._on_relay_off,
+            EV_SERVO: self._on_servo,
+            EV_HEIGHT: self._on_height,
+            EV_NO_ECHO: self._on_no_echo,
+            EV_POSITION: lambda t, pin, value: self._set('position', value),
+            EV_PID_OUTPUT: lambda t, pin, value: self._set('controller_output', value),
+            EV_STEP_START: self._on_step_start,
+            EV_STEP_END: self._on_step_end,
+            EV_PROGRESS: lambda t, pin, value: self._set('remaining', value),
+            EV_RATE_ESTIMATE: lambda t, pin, value: self._set('rate_estimate', value),
+            EV_VERTICAL_STOP: lambda t, pin, value: self._set('vertical_displacement', value),
+            EV_STOP_REQUEST: self._on_stop_request,
+        }
+
+    @staticmethod
+    def _create(name):
+        try:
+            return shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+        except FileExistsError:
+            pass
+        existing = shared_memory.SharedMemory(name=name)
+        try:
+            # 不是状态块的段（其他程序使用同一名称）不能删除
+            if existing.size < HEADER.size:
+                raise FileExistsError(f"共享内存 {name} 不是状态块（只有 {existing.size} 字节）")
+            magic, _, _, _, pid = HEADER.unpack_from(existing.buf, 0)
+            if magic != MAGIC:
+                raise FileExistsError(f"共享内存 {name} 不是状态块（标识 {bytes(magic)!r}）")
+            if _pid_alive(pid):
+                # 本进程中的另一个 ClimbingRobot（如基准测试或第二个实例）也不能被接管
+                owner = "本进程中的另一个实例" if pid == os.getpid() else f"进程 {pid}"
+                raise FileExistsError(f"状态块 {name} 正被{owner}使用")
+        finally:
+            existing.close()
+        # 上次运行没有正常关闭留下的段，已经映射它的读取者看到写入进程不在后会重新打开；
+        # 删除后用 create=True 重新创建，期间被其他进程抢先创建时抛出 FileExistsError，不会删除别人的段
+        existing.unlink()
+        return shared_memory.SharedMemory(name=name, create=True, size=SIZE)
+
+    def apply(self, timestamp, event, pin, value):
+        """
+        按一条事件更新状态 - 作为 EventTracer.listener 在记录事件的线程中调用
+        :param timestamp: 事件时刻
+        :param event: 事件类型 EV_*
+        :param pin: 引脚（或步数等小整数）
+        :param value: 数值
+        """
+        handler = self._handlers.get(event)
+        if handler is None:
+            return
+        with self._lock:
+            if self._buf is None:
+                return
+            self._begin()
+            handler(timestamp, pin, value)
+            self._set('updated', timestamp)
+            self._end()
+
+    def update(self, timestamp, **fields):
+        """
+        一次更新多个字段，读取者看到的要么全部是旧值，要么全部是新值
+        :param timestamp: 更新时刻
+        :param fields: 字段名 -> 数值，见 FIELDS
+        """
+        with self._lock:
+            self._begin()
+            for name, value in fields.items():
+                self._set(name, value)
+            self._set('updated', timestamp)
+            self._end()
+
+    def set_flag(self, timestamp, flag, on):
+        """
+        设置或清除一个标志
+        :param flag: FLAG_*
+        :param on: 是否设置
+        """
+        with self._lock:
+            self._flags = self._flags | flag if on else self._flags & ~flag
+            self._begin()
+            self._set('flags', self._flags)
+            self._set('updated', timestamp)
+            self._end()
+
+    def close(self, timestamp=None):
+        """正常关闭 - 清除 FLAG_ACTIVE 后删除共享内存段，已映射的读取者仍能读到最终状态"""
+        if self._shm is None:
+            return
+        self.set_flag(time.monotonic() if timestamp is None else timestamp, FLAG_ACTIVE, False)
+        with self._lock:
+            self._buf = None
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
+        self._shm = None
+
+    def _begin(self):
+        self._seq += 1
+        SEQ.pack_into(self._buf, SEQ_OFFSET, self._seq)
+        _fence()
+
+    def _end(self):
+        _fence()
+        self._seq += 1
+        SEQ.pack_into(self._buf, SEQ_OFFSET, self._seq)
+
+    def _set(self, name, value):
+        pack, offset = self._packers[name]
+        pack(self._buf, offset, value)
+
+    def _on_relay_on(self, timestamp, pin, value):
+        self._relays |= self._relay_bits.get(pin, 0)
+        self._set('relay_levels', self._relays)
+
+    def _on_relay_off(self, timestamp, pin, value):
+        self._relays &= ~self._relay_bits.get(pin, 0)
+        self._set('relay_levels', self._relays)
+
+    def _on_servo(self, timestamp, pin, value):
+        field = self._servo_fields.get(pin)
+        if field is not None:
+            self._set(field, self.servo_neutral_duty + value / self.servo_degree_ratio)
+
+    def _on_height(self, timestamp, pin, value):
+        self._set('height', value)
+        self._set('height_time', timestamp)
+
+    def _on_no_echo(self, timestamp, pin, value):
+        self._no_echo += 1
+        self._set('no_echo', self._no_echo)
+
+    def _on_step_start(self, timestamp, pin, value):
+        self._set('step', pin)
+        self._set('movement_time', value)
+
+    def _on_step_end(self, timestamp, pin, value):
+        self._set('steps_completed', pin)
+        self._set('step_time', value)
+
+    def _on_stop_request(self, timestamp, pin, value):
+        # 停止请求一次写入断开全部继电器
+        self._relays = 0
+        self._set('relay_levels', 0)
+        self._flags |= FLAG_STOP_REQUESTED
+        self._set('flags', self._flags)
+
+
+class StateReader:
+    """读取端 - 映射状态块，复制一致的快照"""
+
+    def __init__(self, name=DEFAULT_NAME):
+        """
+        打开状态块，不存在时抛出 FileNotFoundError，布局不认识时抛出 ValueError
+        :param name: 共享内存名称
+        """
+        self.name = name
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._buf = self._shm.buf
+        magic, version, size, _, self.pid = HEADER.unpack_from(self._buf, 0)
+        if self.pid != os.getpid():
+            # 只读取不拥有: 不让本进程的资源跟踪器在退出时删除写入进程的段
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        if magic != MAGIC or version != VERSION or size > self._shm.size:
+            self.close()
+            raise ValueError(f"状态块 {name} 的布局不认识 (魔数 {magic!r}, 版本 {version})")
+        self.retries = 0  # 因读到写了一半的状态而重试的累计次数
+
+    def seq(self):
+        """当前序号，与上次相同说明状态没有变化，轮询时可以先比较它"""
+        return SEQ.unpack_from(self._buf, SEQ_OFFSET)[0]
+
+    def read_raw(self, timeout=0.5):
+        """
+        复制一份一致的状态
+        :param timeout: 最长等待时间（秒），写入进程在写入中途被结束时序号停在奇数，超过后抛出 TimeoutError
+        :return: (序号, BODY 解包的元组)
+        """
+        buf = self._buf
+        deadline = None
+        while True:
+            begin = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+            if not begin & 1:
+                _fence()
+                data = bytes(buf[HEADER.size:SIZE])
+                _fence()
+                if SEQ.unpack_from(buf, SEQ_OFFSET)[0] == begin:
+                    return begin, BODY.unpack(data)
+            self.retries += 1
+            # 写入线程可能在写入中途被抢占，让出CPU让它写完（单核上不让出就等不到）
+            os.sched_yield()
+            if deadline is None:
+                deadline = time.monotonic() + timeout
+            elif time.monotonic() > deadline:
+                raise TimeoutError(f"状态块 {self.name} 一直在写入中（写入进程可能已被结束）")
+
+    def read(self, timeout=0.5):
+        """
+        复制一份一致的状态
+        :param timeout: 见 read_raw
+        :return: 字段名 -> 数值，另有 'seq' 序号、'relays' 继电器引脚 -> 电平、'active' 写入进程是否在运行
+        """
+        seq, values = self.read_raw(timeout)
+        state = dict(zip((name for name, _ in FIELDS[:-1]), values))
+        pins = values[len(FIELDS) - 1:][:state['relay_count']]
+        state['relay_pins'] = list(pins)
+        state['relays'] = {pin: (state['relay_levels'] >> i) & 1 for i, pin in enumerate(pins)}
+        state['seq'] = seq
+        state['active'] = bool(state['flags'] & FLAG_ACTIVE) and _pid_alive(self.pid)
+        return state
+
+    def close(self):
+        if self._shm is not None:
+            self._buf = None
+            self._shm.close()
+            self._shm = None
+
+
+def format_state(state, pin_names=None):
+    """把一份状态渲染为一行文本"""
+    pin_names = pin_names or {}
+    relays = ','.join(pin_names.get(pin, str(pin)) for pin, level in state['relays'].items() if level) or '-'
+    flags = ('运行' if state['active'] else '已停止') + (' 停止请求' if state['flags'] & FLAG_STOP_REQUESTED else '')
+    return (f"[{state['updated']:.3f}] {flags} | 高度 {state['height']:.2f}cm 位置 {state['position']:.2f}cm "
+            f"剩余 {state['remaining']:.2f}cm | 第 {state['step']} 步 (完成 {state['steps_completed']}) "
+            f"移动 {state['movement_time']:.2f}秒 输出 {state['controller_output']:.2f}秒 "
+            f"速度 {state['rate_estimate']:.3f}cm/s | 舵机 {state['upper_servo_duty']:.2f}/"
+            f"{state['lower_servo_duty']:.2f} | 通电 {relays} | 无回声 {state['no_echo']}")
+
+
+def main():
+    """在终端中显示正在运行的机器人的状态，每次变化输出一行"""
+    parser = argparse.ArgumentParser(description='显示共享内存状态块')
+    parser.add_argument('--name', default=os.environ.get('ROBOT_STATE_BLOCK') or DEFAULT_NAME,
+                        help='共享内存名称，默认读取环境变量 ROBOT_STATE_BLOCK，未设置时为 climbing_robot')
+    parser.add_argument('--interval', type=float, default=0.1, help='轮询间隔（秒）')
+    args = parser.parse_args()
+
+    try:
+        reader = StateReader(args.name)
+    except FileNotFoundError:
+        parser.error(f"状态块 {args.name} 不存在（机器人程序没有运行？）")
+
+    last = None
+    try:
+        while True:
+            if reader.seq() != last:
+                state = reader.read()
+                last = state['seq']
+                print(format_state(state), flush=True)
+                if not state['active']:
+                    break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    main()
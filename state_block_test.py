@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+测试共享内存状态块 - 另一个进程不停地一次更新多个字段（写入相同的值），本进程按最快速度轮询，
+检查每份快照的字段都来自同一次更新（顺序锁没有漏掉写了一半的状态），并测量读取频率
+
+    python3 state_block_test.py
+    python3 state_block_test.py -d 5 --min-rate 5000
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import subprocess
+
+from state_block import StateBlock, StateReader
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TEST_NAME = f'climbing_robot_test_{os.getpid()}'
+
+
+def run_writer(name, duration):
+    """写入进程（由测试以 --writer 启动）: 创建状态块，在 duration 秒内不停更新，就绪和结束时各输出一行"""
+    block = StateBlock(name, relay_pins=range(16))
+    print("ready", flush=True)
+    n = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        n += 1
+        value = float(n)
+        block.update(value, height=value, position=value, remaining=value, controller_output=value,
+                     step=n, steps_completed=n, relay_levels=n & 0xffff)
+    print(f"done {n}", flush=True)
+    sys.stdin.read()  # 等测试读完最终状态再关闭
+    block.close()
+
+
+def check(state):
+    """一份快照中的字段是否来自同一次更新"""
+    value = state['updated']
+    n = int(value)
+    return (state['height'] == value and state['position'] == value and state['remaining'] == value
+            and state['controller_output'] == value and state['step'] == n and state['steps_completed'] == n
+            and state['relay_levels'] == n & 0xffff)
+
+
+def test_state_block(duration):
+    """
+    启动写入进程并在它运行期间轮询
+    :return: (读取次数, 看到的不同状态数, 不一致的快照数, 重试次数, 写入次数, 用时秒)
+    """
+    writer = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--writer', TEST_NAME,
+                               '--duration', str(duration)],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    try:
+        assert writer.stdout.readline().strip() == 'ready', "写入进程没有启动"
+        reader = StateReader(TEST_NAME)
+        reads = distinct = inconsistent = 0
+        last = None
+        start = time.monotonic()
+        end = start + duration
+        while time.monotonic() < end:
+            state = reader.read()
+            reads += 1
+            if state['seq'] != last:
+                last = state['seq']
+                distinct += 1
+            if state['updated'] and not check(state):
+                inconsistent += 1
+        elapsed = time.monotonic() - start
+
+        writes = int(writer.stdout.readline().split()[1])
+        final = reader.read()
+        if not check(final) or final['step'] != writes:
+            inconsistent += 1
+        retries = reader.retries
+        reader.close()
+    finally:
+        writer.stdin.close()
+        writer.wait(timeout=5.0)
+    return reads, distinct, inconsistent, retries, writes, elapsed
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='共享内存状态块测试程序')
+    parser.add_argument('-d', '--duration', type=float, default=2.0, help='测试时长（秒）')
+    parser.add_argument('--min-rate', type=float, default=1000.0, help='读取频率下限 (次/秒)')
+    parser.add_argument('--writer', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.writer:
+        run_writer(args.writer, args.duration)
+        return
+
+    print("共享内存状态块测试程序")
+    print("另一个进程不停更新状态，检查每份快照的一致性并测量读取频率")
+    print("")
+
+    reads, distinct, inconsistent, retries, writes, elapsed = test_state_block(args.duration)
+    rate = reads / elapsed
+    print(f"写入 {writes} 次，读取 {reads} 次 ({rate / 1000:.1f}kHz)，看到 {distinct} 个不同状态，"
+          f"重试 {retries} 次，不一致 {inconsistent} 次")
+
+    failures = []
+    if inconsistent:
+        failures.append(f"{inconsistent} 份快照的字段不一致")
+    if rate < args.min_rate:
+        failures.append(f"读取频率 {rate:.0f}次/秒 低于 {args.min_rate:.0f}次/秒")
+
+    print("")
+    if failures:
+        for failure in failures:
+            print(f"失败 {failure}")
+        sys.exit(1)
+    print("通过: 所有快照一致，读取频率在下限以上")
+
+
+if __name__ == "__main__":
+    main()
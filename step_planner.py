@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+步骤规划 - 按竖直杆速度模型一次算出到达目标所需的最少步数和每步通电时间
+上升和下降、逐步和连续模式共用；控制器只在实测高度偏离计划时重新规划
+"""
+
+import math
+
+
+def plan_step_times(distance, completed_steps, rate, dead_time, max_stroke, min_time, max_time, tolerance=2.0):
+    """
+    规划剩余步骤
+    行程不超过 max_stroke 的最少步数，再补足奇偶（结束时总步数为奇数，上下两侧都移动到位），
+    剩余距离平均分配到每一步，不再用固定时间的额外一步凑奇偶
+    :param distance: 沿攀爬方向到目标的剩余距离 (cm)，已越过目标时为负
+    :param completed_steps: 已完成的步数
+    :param rate: 竖直杆速度估计 (cm/s)
+    :param dead_time: 竖直杆延迟估计（秒）
+    :param max_stroke: 每步最大行程 (cm)
+    :param min_time: 每步最短通电时间（秒）
+    :param max_time: 每步最长通电时间（秒）
+    :param tolerance: 到达容忍度 (cm)，剩余距离不超过该值时只补奇偶
+    :return: 每步的通电时间列表，已到达且奇偶正确时为空
+    """
+    steps = 0
+    if distance > tolerance:
+        steps = math.ceil(distance / max_stroke)
+    if (completed_steps + steps) % 2 == 0:
+        steps += 1
+    if distance <= tolerance:
+        return [min_time] * steps
+
+    movement_time = distance / (steps * rate) + dead_time
+    return [min(max(movement_time, min_time), max_time)] * steps
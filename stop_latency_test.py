@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+测试停止延迟 - 在长时间的执行器动作（最终松开的 20 秒脉冲、60cm 初始收缩的 10 秒脉冲）进行中触发停止，
+测量从触发到全部继电器断电、以及控制线程从动作中退出的用时，超过上限时以非零状态退出
+
+默认使用仿真后端，不驱动真实的执行器；--hardware 在树莓派上测量（会真实通电，机器人不能在柱子上）
+    python3 stop_latency_test.py
+    python3 stop_latency_test.py --trigger signal -n 5 --max-latency 2
+"""
+
+import os
+import sys
+import time
+import signal
+import logging
+import argparse
+import threading
+
+from robot import ClimbingRobot
+from actuators import StopRequested
+from clock import RealClock
+from sim_backend import SimulatedGPIO
+
+# 配置日志
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# 测试的动作 -> 执行函数
+SCENARIOS = {
+    'final_extend': lambda robot: robot.final_extend(),
+    'initial_retraction_60cm': lambda robot: robot.initial_retraction_60cm(),
+}
+
+
+def relays_off(robot):
+    """全部继电器引脚是否都已断电（读取输出引脚的实际电平）"""
+    return all(robot.gpio.input(pin) == robot.gpio.LOW for pin in robot.relay_pins)
+
+
+def measure_stop(robot, action, trigger, delay):
+    """
+    在主线程执行动作，另一个线程在 delay 秒后触发停止
+    :param trigger: 'thread' 直接调用 request_stop / 'signal' 向本进程发送 SIGUSR1
+    :return: (断电延迟秒, 控制线程退出延迟秒)，动作未被中止时抛出 AssertionError
+    """
+    result = {}
+
+    def fire():
+        time.sleep(delay)
+        result['energized'] = not relays_off(robot)
+        result['triggered'] = time.monotonic()
+        if trigger == 'thread':
+            robot.request_stop("停止延迟测试")
+        else:
+            os.kill(os.getpid(), signal.SIGUSR1)
+        # 轮询间隔中让出GIL，不拖慢执行停止的线程
+        while not relays_off(robot):
+            time.sleep(0.00005)
+        result['off'] = time.monotonic()
+
+    trigger_thread = threading.Thread(target=fire, name="stop-trigger")
+    trigger_thread.start()
+    try:
+        action(robot)
+        stopped = False
+    except StopRequested:
+        stopped = True
+    returned = time.monotonic()
+    trigger_thread.join()
+
+    assert result['energized'], "触发停止时没有继电器通电，延迟无意义"
+    assert stopped, "动作没有被停止请求中止"
+    return result['off'] - result['triggered'], returned - result['triggered']
+
+
+def test_stop_latency(scenarios, triggers, repeats, delay, hardware=False):
+    """
+    逐个场景测量停止延迟
+    :return: [(场景, 触发方式, 断电延迟秒列表, 退出延迟秒列表)]
+    """
+    robot = ClimbingRobot(gpio=None if hardware else SimulatedGPIO(seed=0), clock=RealClock(),
+                          calibration_file='', state_file='', state_block='')
+    robot.install_stop_signals()
+    results = []
+
+    try:
+        for name in scenarios:
+            for trigger in triggers:
+                latencies = []
+                unwinds = []
+                for _ in range(repeats):
+                    # 每次从位置未知开始，命令不被行程推算裁剪
+                    robot.stroke_tracker.positions.clear()
+                    latency, unwind = measure_stop(robot, SCENARIOS[name], trigger, delay)
+                    latencies.append(latency)
+                    unwinds.append(unwind)
+                    robot.clear_stop()
+                results.append((name, trigger, latencies, unwinds))
+                print(f"{name:<26}{trigger:<8}断电 最大 {max(latencies) * 1000:7.3f}ms  "
+                      f"退出 最大 {max(unwinds) * 1000:7.3f}ms  ({repeats}次)")
+    finally:
+        robot.power_off()
+
+    return results
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='停止延迟测试程序')
+    parser.add_argument('-s', '--scenario', choices=sorted(SCENARIOS), action='append',
+                        help='测试的动作，可重复，默认全部')
+    parser.add_argument('-t', '--trigger', choices=['thread', 'signal'], action='append',
+                        help='停止触发方式，可重复，默认全部')
+    parser.add_argument('-n', '--repeats', type=int, default=3, help='每种组合重复次数')
+    parser.add_argument('-d', '--delay', type=float, default=1.0, help='动作开始后多久触发停止（秒）')
+    parser.add_argument('--max-latency', type=float, default=5.0, help='触发到全部继电器断电的上限（毫秒）')
+    parser.add_argument('--max-unwind', type=float, default=50.0, help='触发到控制线程退出动作的上限（毫秒）')
+    parser.add_argument('--hardware', action='store_true', help='使用树莓派GPIO（会真实通电）')
+
+    args = parser.parse_args()
+
+    print("停止延迟测试程序")
+    print("在长时间脉冲进行中触发停止，测量继电器断电和控制线程退出的用时")
+    print("")
+
+    results = test_stop_latency(args.scenario or sorted(SCENARIOS), args.trigger or ['thread', 'signal'],
+                                args.repeats, args.delay, args.hardware)
+
+    failures = []
+    for name, trigger, latencies, unwinds in results:
+        if max(latencies) * 1000 > args.max_latency:
+            failures.append(f"{name}/{trigger}: 断电延迟 {max(latencies) * 1000:.3f}ms 超过 {args.max_latency}ms")
+        if max(unwinds) * 1000 > args.max_unwind:
+            failures.append(f"{name}/{trigger}: 退出延迟 {max(unwinds) * 1000:.3f}ms 超过 {args.max_unwind}ms")
+
+    print("")
+    if failures:
+        for failure in failures:
+            print(f"失败 {failure}")
+        sys.exit(1)
+    print("通过: 所有停止延迟都在上限以内")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+伸缩杆行程航位推算 - 按继电器实际通电时间和每个方向的全行程时间积分出每根伸缩杆的行程位置
+（0 为完全收缩，1 为完全伸出），到端点后饱和；执行器命令据此裁剪到实际需要的时间，已在端点的伸缩杆不再通电
+"""
+
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class StrokeTracker:
+    def __init__(self, stroke_times, end_margin=0.05):
+        """
+        初始化行程推算
+        :param stroke_times: 伸缩杆 -> (全行程伸出时间, 全行程收缩时间)（秒），None 表示不推算；
+                             直接引用该字典，之后修改（如加载标定）立即生效
+        :param end_margin: 裁剪后的通电时间再加上全行程时间的该比例，抵消速度误差；推算已在端点时不加
+        """
+        self.stroke_times = stroke_times
+        self.end_margin = end_margin
+        self.positions = {}  # 伸缩杆 -> 行程位置 (0-1)，没有记录表示位置未知
+        self._lock = threading.Lock()
+
+    def position(self, cylinder):
+        """行程位置 (0-1)，位置未知或不推算时返回 None"""
+        if self.stroke_times.get(cylinder) is None:
+            return None
+        return self.positions.get(cylinder)
+
+    def set_position(self, cylinder, position):
+        """直接设定行程位置，None 表示未知"""
+        with self._lock:
+            if position is None:
+                self.positions.pop(cylinder, None)
+            else:
+                self.positions[cylinder] = min(max(position, 0.0), 1.0)
+
+    def time_to_end(self, cylinder, direction):
+        """
+        从当前位置运动到端点所需的通电时间（秒）
+        :param direction: 1 伸出 / -1 收缩
+        :return: 秒数，位置未知或不推算时返回 None
+        """
+        position = self.position(cylinder)
+        if position is None:
+            return None
+        extend_time, retract_time = self.stroke_times[cylinder]
+        if direction > 0:
+            return (1.0 - position) * extend_time
+        return position * retract_time
+
+    def trim(self, cylinder, direction, duration):
+        """
+        把一次命令裁剪到实际需要的通电时间
+        :param direction: 1 伸出 / -1 收缩
+        :param duration: 命令的通电时间（秒）
+        :return: 裁剪后的通电时间，已在端点时为 0，位置未知时原样返回
+        """
+        needed = self.time_to_end(cylinder, direction)
+        if needed is None:
+            return duration
+        if needed <= 1e-6:
+            return 0.0
+        stroke_time = self.stroke_times[cylinder][0 if direction > 0 else 1]
+        return min(duration, needed + self.end_margin * stroke_time)
+
+    def update(self, cylinder, direction, on_time):
+        """
+        记录一次实际通电
+        :param direction: 1 伸出 / -1 收缩
+        :param on_time: 实际通电时间（秒）
+        """
+        times = self.stroke_times.get(cylinder)
+        if times is None or on_time <= 0:
+            return
+        stroke_time = times[0] if direction > 0 else times[1]
+        with self._lock:
+            position = self.positions.get(cylinder)
+            if position is not None:
+                position = min(max(position + direction * on_time / stroke_time, 0.0), 1.0)
+            elif on_time >= stroke_time:
+                # 位置未知时，不短于全行程的通电必然到达端点
+                position = 1.0 if direction > 0 else 0.0
+            if position is not None:
+                self.positions[cylinder] = position
+
+    def save(self, path, timestamp):
+        """
+        保存当前行程位置
+        :param timestamp: 保存时刻（墙上时间，秒），读取时用来判断状态是否过期
+        """
+        with self._lock:
+            state = {'time': timestamp, 'positions': dict(self.positions)}
+        with open(path, 'w') as f:
+            json.dump(state, f, indent=2)
+
+    def load(self, path, timestamp, max_age):
+        """
+        读取保存的行程位置
+        :param timestamp: 当前时刻（墙上时间，秒）
+        :param max_age: 超过该时间（秒）的状态视为过期不读取，期间伸缩杆可能被手动移动过
+        :return: 是否读取了状态
+        """
+        if not os.path.exists(path):
+            return False
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"行程状态文件 {path} 无法读取: {e}")
+            return False
+
+        age = timestamp - state.get('time', 0.0)
+        if not 0 <= age <= max_age:
+            logger.info(f"行程状态已过期 ({age:.0f}秒)，所有伸缩杆位置视为未知")
+            return False
+        for cylinder, position in state.get('positions', {}).items():
+            self.set_position(cylinder, position)
+        return True
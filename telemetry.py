@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+遥测服务器 - 把事件追踪器的事件（测距、继电器边沿、步的开始和结束、控制器输出）实时推送给网络客户端
+作为 EventTracer 的输出端运行，服务器在自己线程中的 asyncio 事件循环里收发，控制线程只写环形缓冲区；
+实时模式下输出端在日志进程中创建，服务器也随之在日志进程中运行
+
+每个客户端有一个有界队列: 积压超过一半时高频的测距样本按积压程度抽取，队列满时丢弃最旧的事件，
+客户端读得慢或完全不读都只影响它自己，不会阻塞刷新线程，更不会阻塞控制线程；丢弃的条数在下一批数据前通知客户端
+
+帧格式: 连接后服务器先发送一行JSON的 hello（帧格式、事件类型表、引脚名称），之后
+    json    每个事件一行JSON {"t", "type", "pin", "value"}，执行器和舵机事件另有 "name"
+    binary  每个事件一条定长记录，格式同二进制追踪文件 (tracer.RECORD)，事件类型 0 表示丢弃通知，数值为条数
+
+设置环境变量 ROBOT_TELEMETRY 启用，地址为 host:port、port（只监听本机）或 unix:/path/to.sock:
+    ROBOT_TELEMETRY=0.0.0.0:7070 python3 up.py
+也可以直接运行，作为客户端连接并显示事件:
+    python3 telemetry.py raspberrypi.local:7070
+"""
+
+import os
+import json
+import struct
+import asyncio
+import argparse
+import threading
+import logging
+from collections import deque
+
+from tracer import (EVENT_FORMATS, RECORD, EV_ACTUATOR_ON, EV_ACTUATOR_OFF, EV_ACTUATOR_CANCEL, EV_SERVO, EV_HEIGHT,
+                    EV_ACTUATOR_TRIM, format_event)
+
+logger = logging.getLogger(__name__)
+
+PROTOCOL_VERSION = 1
+EV_DROPPED = 0  # 二进制帧中的丢弃通知，数值为丢弃的条数
+NAMED_EVENTS = {EV_ACTUATOR_ON, EV_ACTUATOR_OFF, EV_ACTUATOR_CANCEL, EV_SERVO, EV_ACTUATOR_TRIM}  # 引脚有名称的事件
+
+
+def parse_address(address):
+    """
+    解析地址
+    :param address: 'host:port'、'port'（只监听本机）或 'unix:/path/to.sock'
+    :return: ('unix', 路径) 或 ('tcp', (主机, 端口))
+    """
+    if address.startswith('unix:'):
+        return 'unix', address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return 'tcp', (host or '127.0.0.1', int(port))
+
+
+class ClientQueue:
+    """单个客户端的有界发送队列，只在事件循环线程中使用"""
+
+    def __init__(self, limit, decimate_events=(EV_HEIGHT,)):
+        """
+        :param limit: 最多积压的事件数
+        :param decimate_events: 积压时先抽取的高频事件
+        """
+        self.limit = limit
+        self.decimate_events = set(decimate_events)
+        self.items = deque()
+        self.ready = asyncio.Event()
+        self.dropped = 0  # 尚未通知客户端的丢弃条数
+        self.dropped_total = 0
+        self._decimate_count = 0
+
+    def put(self, record):
+        """放入一条事件，积压时抽取或丢弃，从不等待"""
+        if record[1] in self.decimate_events:
+            backlog = len(self.items) / self.limit
+            if backlog >= 0.5:
+                # 积压一半时保留 1/4，四分之三时保留 1/16
+                self._decimate_count += 1
+                if self._decimate_count % (4 if backlog < 0.75 else 16):
+                    self._drop(1)
+                    return
+        if len(self.items) >= self.limit:
+            self.items.popleft()
+            self._drop(1)
+        self.items.append(record)
+        self.ready.set()
+
+    def take(self):
+        """取出全部积压的事件和待通知的丢弃条数"""
+        items = list(self.items)
+        self.items.clear()
+        self.ready.clear()
+        dropped, self.dropped = self.dropped, 0
+        return items, dropped
+
+    def _drop(self, count):
+        self.dropped += count
+        self.dropped_total += count
+
+
+class TelemetryServer:
+    """asyncio 遥测服务器，在自己的线程中运行事件循环"""
+
+    def __init__(self, address, framing='json', queue_size=1024, pin_names=None):
+        """
+        :param address: 监听地址，见 parse_address
+        :param framing: 'json' 每行一个JSON / 'binary' 定长记录
+        :param queue_size: 每个客户端最多积压的事件数
+        :param pin_names: 引脚 -> 名称
+        """
+        if framing not in ('json', 'binary'):
+            raise ValueError(f"未知的帧格式: {framing}")
+        self.address = address
+        self.framing = framing
+        self.queue_size = queue_size
+        self.pin_names = dict(pin_names or {})
+        self.clients = {}  # StreamWriter -> ClientQueue，只在事件循环线程中修改
+        self.dropped = 0  # 已断开客户端累计丢弃的条数
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._hello = (json.dumps({
+            'type': 'hello', 'version': PROTOCOL_VERSION, 'framing': framing, 'record': RECORD.format,
+            'events': {code: name for code, (name, _) in EVENT_FORMATS.items()},
+            'pin_names': {str(pin): name for pin, name in self.pin_names.items()},
+        }, ensure_ascii=False) + '\n').encode()
+
+    def start(self, timeout=5.0):
+        """启动事件循环线程并开始监听，监听失败时抛出异常"""
+        started = threading.Event()
+        error = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._server = self._loop.run_until_complete(self._listen())
+            except Exception as e:
+                error.append(e)
+                started.set()
+                self._loop.close()
+                return
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._shutdown())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="telemetry", daemon=True)
+        self._thread.start()
+        if not started.wait(timeout):
+            raise TimeoutError("遥测服务器没有按时启动")
+        if error:
+            self._thread = None
+            raise error[0]
+        logger.info(f"遥测服务器已启动: {self.address} ({self.framing})")
+
+    async def _listen(self):
+        kind, target = parse_address(self.address)
+        if kind == 'unix':
+            if os.path.exists(target):
+                os.unlink(target)
+            return await asyncio.start_unix_server(self._serve, path=target)
+        host, port = target
+        return await asyncio.start_server(self._serve, host, port)
+
+    def publish(self, records):
+        """
+        发送一批事件 - 可以在任意线程中调用，只把这批事件交给事件循环，不等待发送
+        :param records: [(时间戳, 事件类型, 引脚, 数值)]
+        """
+        if records and self.clients and self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, records)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    def _dispatch(self, records):
+        for queue in self.clients.values():
+            for record in records:
+                queue.put(record)
+
+    async def _serve(self, reader, writer):
+        queue = ClientQueue(self.queue_size)
+        self.clients[writer] = queue
+        peer = writer.get_extra_info('peername') or 'unix'
+        logger.info(f"遥测客户端已连接: {peer}")
+        encode = self._encode_json if self.framing == 'json' else self._encode_binary
+        # 没有事件可发时也要发现客户端已断开
+        watcher = asyncio.ensure_future(self._watch_disconnect(reader, asyncio.current_task()))
+        try:
+            writer.write(self._hello)
+            while True:
+                await queue.ready.wait()
+                records, dropped = queue.take()
+                writer.write(encode(records, dropped))
+                # 客户端读得慢时在这里等待，期间新的事件进入它自己的有界队列
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            watcher.cancel()
+            del self.clients[writer]
+            self.dropped += queue.dropped_total
+            writer.close()
+            if queue.dropped_total:
+                logger.info(f"遥测客户端已断开: {peer}，积压时丢弃 {queue.dropped_total} 条事件")
+            else:
+                logger.info(f"遥测客户端已断开: {peer}")
+
+    @staticmethod
+    async def _watch_disconnect(reader, serving):
+        """客户端发来的数据都丢弃，读到连接关闭时结束发送任务"""
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        serving.cancel()
+
+    def _encode_json(self, records, dropped):
+        lines = []
+        if dropped:
+            lines.append(json.dumps({'type': 'dropped', 'count': dropped}))
+        for timestamp, event, pin, value in records:
+            message = {'t': timestamp, 'type': EVENT_FORMATS.get(event, (f'event_{event}',))[0],
+                       'pin': pin, 'value': value}
+            if event in NAMED_EVENTS and pin in self.pin_names:
+                message['name'] = self.pin_names[pin]
+            lines.append(json.dumps(message, ensure_ascii=False))
+        return ('\n'.join(lines) + '\n').encode()
+
+    @staticmethod
+    def _encode_binary(records, dropped):
+        pack = RECORD.pack
+        data = b''.join(pack(*record) for record in records)
+        if dropped:
+            data = pack(0.0, EV_DROPPED, 0, float(dropped)) + data
+        return data
+
+    def close(self, timeout=2.0):
+        """停止监听并断开所有客户端"""
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout)
+        self._thread = None
+
+    async def _shutdown(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for writer in list(self.clients):
+            writer.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        kind, target = parse_address(self.address)
+        if kind == 'unix' and os.path.exists(target):
+            os.unlink(target)
+
+
+class TelemetrySink:
+    """事件追踪器的输出端，把每次刷新取出的事件交给遥测服务器"""
+
+    def __init__(self, address, framing='json', queue_size=1024, pin_names=None):
+        """
+        创建并启动遥测服务器，参数见 TelemetryServer；监听失败时只记录错误，遥测不影响攀爬
+        """
+        self.server = TelemetryServer(address, framing, queue_size, pin_names)
+        try:
+            self.server.start()
+        except (OSError, TimeoutError) as e:
+            logger.error(f"无法启动遥测服务器 {address}: {e}")
+            self.server = None
+
+    def write(self, records):
+        if self.server is not None:
+            self.server.publish(records)
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+async def read_telemetry(address, timeout=10.0):
+    """
+    回环客户端 - 连接遥测服务器，逐条返回事件
+    :param address: 服务器地址，见 parse_address
+    :param timeout: 连接超时（秒）
+    :return: 异步生成器，第一项为 hello 字典，之后为 (时间戳, 事件类型, 引脚, 数值)；丢弃通知的事件类型为 EV_DROPPED
+    """
+    kind, target = parse_address(address)
+    if kind == 'unix':
+        connect = asyncio.open_unix_connection(target)
+    else:
+        connect = asyncio.open_connection(*target)
+    reader, writer = await asyncio.wait_for(connect, timeout)
+    try:
+        hello = json.loads(await reader.readline())
+        yield hello
+        codes = {name: code for code, name in hello['events'].items()}
+        if hello['framing'] == 'binary':
+            record = struct.Struct(hello['record'])
+            while True:
+                try:
+                    data = await reader.readexactly(record.size)
+                except asyncio.IncompleteReadError:
+                    return
+                yield record.unpack(data)
+        else:
+            async for line in reader:
+                message = json.loads(line)
+                if message['type'] == 'dropped':
+                    yield 0.0, EV_DROPPED, 0, float(message['count'])
+                else:
+                    yield message['t'], int(codes.get(message['type'], -1)), message['pin'], message['value']
+    finally:
+        writer.close()
+
+
+async def _print_telemetry(address):
+    pin_names = {}
+    async for item in read_telemetry(address):
+        if isinstance(item, dict):
+            pin_names = {int(pin): name for pin, name in item['pin_names'].items()}
+            print(f"已连接 {address} ({item['framing']})", flush=True)
+        elif item[1] == EV_DROPPED:
+            print(f"服务器积压，丢弃 {item[3]:.0f} 条事件", flush=True)
+        else:
+            print(format_event(*item, pin_names=pin_names), flush=True)
+    print("服务器已断开", flush=True)
+
+
+def main():
+    """连接遥测服务器并显示事件"""
+    parser = argparse.ArgumentParser(description='遥测客户端')
+    parser.add_argument('address', nargs='?', default=os.environ.get('ROBOT_TELEMETRY') or '127.0.0.1:7070',
+                        help='服务器地址 host:port 或 unix:/path/to.sock，默认读取环境变量 ROBOT_TELEMETRY')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_print_telemetry(args.address))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        parser.error(f"无法连接 {args.address}: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+测试遥测服务器 - 模拟刷新线程高速发送测距样本和步事件，同时连接一个正常读取的回环客户端和一个完全不读的客户端，
+检查发送调用从不被卡住的客户端阻塞、卡住的客户端积压有上限、正常客户端按顺序收到全部步事件
+
+    python3 telemetry_test.py
+    python3 telemetry_test.py --framing binary -n 500 --max-publish 2
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+
+from telemetry import TelemetryServer, read_telemetry, EV_DROPPED
+from tracer import EV_HEIGHT, EV_STEP_START, EV_STEP_END, EV_ACTUATOR_ON, EV_ACTUATOR_OFF
+
+# 配置日志
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+END_PIN = 65535  # 最后一条事件的引脚，客户端收到后结束
+
+
+def publish_steps(server, steps, samples, interval, durations):
+    """
+    模拟刷新线程: 每步一批事件（继电器边沿、步开始和结束、大量测距样本），记录每次 publish 的用时
+    """
+    t = 0.0
+    for step in range(1, steps + 1):
+        batch = [(t, EV_STEP_START, step, 2.0), (t, EV_ACTUATOR_ON, 26, 2.0)]
+        for i in range(samples):
+            batch.append((t + i * 0.001, EV_HEIGHT, 17, 50.0 + step + i * 0.001))
+        batch += [(t + 2.0, EV_ACTUATOR_OFF, 26, 2.0), (t + 2.0, EV_STEP_END, step, 2.0)]
+        t += 2.0
+        start = time.perf_counter()
+        server.publish(batch)
+        durations.append(time.perf_counter() - start)
+        time.sleep(interval)
+    server.publish([(t, EV_STEP_END, END_PIN, 0.0)])
+
+
+async def run_test(framing, steps, samples, interval, queue_size):
+    """
+    :return: (publish 用时列表, 正常客户端收到的步结束序号, 正常客户端收到的测距数, 正常客户端被通知丢弃的条数,
+              卡住的客户端丢弃的条数, 卡住的客户端最大积压)
+    """
+    directory = tempfile.TemporaryDirectory()
+    path = os.path.join(directory.name, 'telemetry.sock')
+    address = f'unix:{path}'
+    server = TelemetryServer(address, framing=framing, queue_size=queue_size)
+    server.start()
+
+    # 卡住的客户端: 连接后从不读取
+    _, stalled = await asyncio.open_unix_connection(path)
+    client = read_telemetry(address)
+    hello = await client.__anext__()
+    assert hello['framing'] == framing, f"hello 帧格式不对: {hello}"
+    while len(server.clients) < 2:
+        await asyncio.sleep(0.01)
+
+    durations = []
+    publisher = threading.Thread(target=publish_steps, args=(server, steps, samples, interval, durations))
+    publisher.start()
+
+    ends = []
+    heights = 0
+    notified = 0
+    async for timestamp, event, pin, value in client:
+        if event == EV_STEP_END:
+            if pin == END_PIN:
+                break
+            ends.append(pin)
+        elif event == EV_HEIGHT:
+            heights += 1
+        elif event == EV_DROPPED:
+            notified += int(value)
+    await client.aclose()
+    publisher.join()
+
+    # 正常客户端断开后只剩卡住的客户端
+    while len(server.clients) > 1:
+        await asyncio.sleep(0.01)
+    stalled_queue = next(iter(server.clients.values()))
+    backlog, stalled_dropped = len(stalled_queue.items), stalled_queue.dropped_total
+    stalled.close()
+    server.close()
+    directory.cleanup()
+    return durations, ends, heights, notified, stalled_dropped, backlog
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='遥测服务器测试程序')
+    parser.add_argument('--framing', choices=['json', 'binary'], action='append', help='帧格式，可重复，默认全部')
+    parser.add_argument('-n', '--steps', type=int, default=200, help='模拟的步数')
+    parser.add_argument('--samples', type=int, default=500, help='每步的测距样本数')
+    parser.add_argument('--interval', type=float, default=0.002, help='两批事件之间的间隔（秒）')
+    parser.add_argument('--queue-size', type=int, default=1024, help='每个客户端最多积压的事件数')
+    parser.add_argument('--max-publish', type=float, default=20.0,
+                        help='单次 publish 用时上限（毫秒），包括等待服务器线程释放GIL的时间')
+
+    args = parser.parse_args()
+
+    print("遥测服务器测试程序")
+    print("一个正常客户端和一个卡住的客户端同时连接，检查发送不被阻塞、积压有上限、步事件不丢失")
+    print("")
+
+    failures = []
+    for framing in args.framing or ['json', 'binary']:
+        durations, ends, heights, notified, stalled_dropped, backlog = asyncio.run(
+            run_test(framing, args.steps, args.samples, args.interval, args.queue_size))
+        print(f"{framing:<8}publish 最大 {max(durations) * 1000:6.3f}ms | 正常客户端: 步 {len(ends)}/{args.steps}，"
+              f"测距 {heights}/{args.steps * args.samples}，丢弃通知 {notified} | "
+              f"卡住的客户端: 积压 {backlog}，丢弃 {stalled_dropped}")
+
+        if max(durations) * 1000 > args.max_publish:
+            failures.append(f"{framing}: publish 用时 {max(durations) * 1000:.3f}ms 超过 {args.max_publish}ms")
+        if ends != list(range(1, args.steps + 1)):
+            failures.append(f"{framing}: 正常客户端收到的步结束事件不完整或乱序")
+        if heights + notified != args.steps * args.samples:
+            failures.append(f"{framing}: 正常客户端收到的测距样本数与丢弃通知不符")
+        if backlog > args.queue_size:
+            failures.append(f"{framing}: 卡住的客户端积压 {backlog} 超过队列上限 {args.queue_size}")
+        if not stalled_dropped:
+            failures.append(f"{framing}: 卡住的客户端没有丢弃任何事件（测试数据量不足以填满套接字缓冲区）")
+
+    print("")
+    if failures:
+        for failure in failures:
+            print(f"失败 {failure}")
+        sys.exit(1)
+    print("通过: 卡住的客户端不影响发送和其他客户端，积压有上限")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+事件追踪器 - 控制线程只把 (时间戳, 事件类型, 引脚, 数值) 写入预分配的环形缓冲区，
+后台线程定期取出并交给输出端（可读日志、二进制追踪文件），字符串格式化不在控制线程上进行
+
+也可以直接运行，把二进制追踪文件渲染为可读日志:
+    python3 tracer.py trace.bin
+"""
+
+import os
+import struct
+import itertools
+import argparse
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 事件类型
+EV_ACTUATOR_ON = 1  # 继电器通电，引脚为通电引脚，数值为计划通电时间（秒）
+EV_ACTUATOR_OFF = 2  # 继电器断电，数值为实际通电时间（秒）
+EV_ACTUATOR_CANCEL = 3  # 脉冲被提前取消，数值为实际通电时间（秒）
+EV_SERVO = 4  # 舵机角度，引脚为舵机引脚，数值为相对中性位置的角度（度）
+EV_HEIGHT = 5  # 超声波测距，引脚为回声引脚，数值为距离 (cm)
+EV_NO_ECHO = 6  # 超声波测距失败，数值为尝试次数
+EV_POSITION = 7  # 控制器使用的当前位置 (cm)
+EV_PID_OUTPUT = 8  # 控制器计算出的移动时间（秒），引脚为步数
+EV_STEP_START = 9  # 一步开始，引脚为步数，数值为移动时间（秒）
+EV_STEP_END = 10  # 一步结束，引脚为步数，数值为本步用时（秒）
+EV_HEIGHT_CHANGE = 11  # 相邻两次测量的高度变化 (cm)
+EV_PROGRESS = 12  # 距目标的剩余距离 (cm)
+EV_RATE_ESTIMATE = 13  # 在线估计的竖直杆速度 (cm/s)，引脚为步数
+EV_VERTICAL_STOP = 14  # 闭环竖直移动断电，引脚为原因（0 达到目标 / 1 停滞 / 2 超时），数值为估计位移 (cm)
+EV_ACTUATOR_TRIM = 15  # 按行程推算裁剪命令，引脚为通电引脚，数值为少通电的时间（秒）
+EV_STOP_REQUEST = 16  # 停止请求，数值为从请求到全部继电器断开的用时（毫秒）
+
+# 事件类型 -> (名称, 渲染模板)；模板可使用 {pin} {value} {name}（引脚对应的名称）
+EVENT_FORMATS = {
+    EV_ACTUATOR_ON: ('actuator_on', "{name} 通电 {value:.2f}秒 (引脚{pin})"),
+    EV_ACTUATOR_OFF: ('actuator_off', "{name} 断电，实际通电 {value:.3f}秒 (引脚{pin})"),
+    EV_ACTUATOR_CANCEL: ('actuator_cancel', "{name} 被取消，已通电 {value:.3f}秒 (引脚{pin})"),
+    EV_SERVO: ('servo', "{name} 转到 {value:+.1f}度 (引脚{pin})"),
+    EV_HEIGHT: ('height', "超声波距离 {value:.2f}cm"),
+    EV_NO_ECHO: ('no_echo', "超声波无回声 ({value:.0f}次尝试)"),
+    EV_POSITION: ('position', "当前位置: {value:.2f}cm"),
+    EV_PID_OUTPUT: ('pid_output', "第 {pin} 步 PID输出时间: {value:.2f}秒"),
+    EV_STEP_START: ('step_start', "=== 开始第 {pin} 步，移动时间 {value:.2f}秒 ==="),
+    EV_STEP_END: ('step_end', "第 {pin} 步完成，用时 {value:.2f}秒"),
+    EV_HEIGHT_CHANGE: ('height_change', "高度变化: {value:.2f}cm"),
+    EV_PROGRESS: ('progress', "剩余: {value:.2f}cm"),
+    EV_RATE_ESTIMATE: ('rate_estimate', "第 {pin} 步后竖直杆速度估计: {value:.3f}cm/s"),
+    EV_VERTICAL_STOP: ('vertical_stop', "竖直杆闭环断电 (原因{pin})，位移 {value:.2f}cm"),
+    EV_ACTUATOR_TRIM: ('actuator_trim', "{name} 按行程推算少通电 {value:.2f}秒 (引脚{pin})"),
+    EV_STOP_REQUEST: ('stop_request', "收到停止请求，{value:.3f}毫秒内断开全部继电器"),
+}
+
+# 二进制追踪文件的记录格式: 时间戳(秒), 事件类型, 引脚, 数值
+RECORD = struct.Struct('<dHHd')
+
+
+def format_event(timestamp, event, pin, value, pin_names=None):
+    """
+    把一条事件渲染为可读文本
+    :param pin_names: 引脚 -> 名称，用于执行器和舵机事件
+    """
+    name, template = EVENT_FORMATS.get(event, (f'event_{event}', "引脚{pin} 数值{value}"))
+    label = (pin_names or {}).get(pin, f'引脚{pin}')
+    return f"[{timestamp:.3f}] " + template.format(pin=pin, value=value, name=label)
+
+
+class LogSink:
+    """把事件渲染为可读日志 - 在刷新线程中格式化"""
+
+    def __init__(self, log=None, pin_names=None, level=logging.INFO, debug_events=(EV_HEIGHT,)):
+        """
+        :param log: 输出的 logger
+        :param pin_names: 引脚 -> 名称
+        :param level: 日志级别
+        :param debug_events: 只在 DEBUG 级别输出的高频事件（默认后台采样的每次测距）
+        """
+        self.log = log or logger
+        self.pin_names = pin_names or {}
+        self.level = level
+        self.debug_events = set(debug_events)
+
+    def write(self, records):
+        show_debug = self.log.isEnabledFor(logging.DEBUG)
+        if not show_debug and not self.log.isEnabledFor(self.level):
+            return
+        for record in records:
+            if record[1] in self.debug_events:
+                if show_debug:
+                    self.log.debug(format_event(*record, pin_names=self.pin_names))
+            else:
+                self.log.log(self.level, format_event(*record, pin_names=self.pin_names))
+
+    def close(self):
+        pass
+
+
+class BinaryTraceSink:
+    """把事件按定长记录追加写入二进制文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'ab')
+
+    def write(self, records):
+        pack = RECORD.pack
+        self._file.write(b''.join(pack(*record) for record in records))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read_trace(path):
+    """
+    读取二进制追踪文件
+    :return: 逐条返回 (时间戳, 事件类型, 引脚, 数值)
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    usable = len(data) - len(data) % RECORD.size
+    return RECORD.iter_unpack(data[:usable])
+
+
+# 环形缓冲区中的槽位格式: 时间戳, 序号+1（0 表示空槽）, 数值, 事件类型, 引脚, 序号+1
+# 序号在槽位首尾各写一次，另一个进程读取时两者不一致说明读到了写了一半的槽位
+SLOT = struct.Struct('<dqdHH4xq')
+
+
+class EventTracer:
+    def __init__(self, clock, capacity=4096, flush_interval=0.5, buffer=None):
+        """
+        初始化事件追踪器
+        :param clock: 时钟，事件时间戳取自 clock.monotonic()；只在另一个进程中取出事件时可以为 None
+        :param capacity: 环形缓冲区容量（条），取整为2的幂；刷新前写满时最旧的事件被覆盖
+        :param flush_interval: 后台刷新周期（秒）
+        :param buffer: 外部提供的可写缓冲区（如共享内存，见 realtime.IOProcess），大小为 buffer_size(capacity)，
+                       全部为0；默认在本进程中分配
+        """
+        size = self._round_capacity(capacity)
+        self.capacity = size
+        self._mask = size - 1
+        self.flush_interval = flush_interval
+
+        # 预分配的定长槽位环形缓冲区
+        # 每条记录由一次 pack_into 整体写入，持有GIL期间完成，同一进程中的其他线程不会看到写了一半的记录
+        self._buffer = bytearray(SLOT.size * size) if buffer is None else buffer
+        self._pack = SLOT.pack_into
+        self._seq = itertools.count()  # next() 在GIL下是原子的，多个线程记录事件不需要加锁
+        self._flushed = 0  # 已交给输出端的事件序号
+        self.dropped = 0  # 刷新不及时被覆盖的事件数
+
+        self._now = clock.monotonic if clock is not None else None
+        # 在记录事件的线程中同步调用的 listener(时间戳, 事件类型, 引脚, 数值)，如共享内存状态块（见 state_block.py）
+        self.listener = None
+        self._flush_lock = threading.Lock()
+        self.sinks = []
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _round_capacity(capacity):
+        size = 1
+        while size < capacity:
+            size *= 2
+        return size
+
+    @classmethod
+    def buffer_size(cls, capacity):
+        """容量为 capacity 条的环形缓冲区的字节数"""
+        return SLOT.size * cls._round_capacity(capacity)
+
+    def record(self, event, pin=0, value=0.0):
+        """
+        记录一个事件 - 控制线程的热路径，只写入缓冲区
+        :param event: 事件类型 EV_*
+        :param pin: 引脚编号（或步数等小整数）
+        :param value: 数值
+        """
+        n = next(self._seq)
+        timestamp = self._now()
+        self._pack(self._buffer, (n & self._mask) * SLOT.size, timestamp, n + 1, value, event, pin, n + 1)
+        listener = self.listener
+        if listener is not None:
+            listener(timestamp, event, pin, value)
+
+    def add_sink(self, sink):
+        """添加输出端，需实现 write(records) 和 close()，records 为 [(时间戳, 事件类型, 引脚, 数值)]"""
+        self.sinks.append(sink)
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="event-tracer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """停止刷新线程，写出剩余事件并关闭输出端"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.flush()
+        for sink in self.sinks:
+            sink.close()
+        self.sinks = []
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """把自上次刷新以来的事件按序号顺序交给所有输出端"""
+        with self._flush_lock:
+            records = self._collect()
+            if not records:
+                return
+            for sink in self.sinks:
+                try:
+                    sink.write(records)
+                except Exception as e:
+                    logger.error(f"事件输出失败 ({type(sink).__name__}): {e}")
+
+    def _collect(self):
+        """从缓冲区快照中按序号取出已写完的事件，遇到尚未写入的槽位即停止"""
+        data = bytes(self._buffer)
+        unpack = SLOT.unpack_from
+        n = self._flushed
+        records = []
+        while True:
+            timestamp, seq, value, event, pin, tail = unpack(data, (n & self._mask) * SLOT.size)
+            if seq != tail:
+                # 另一个进程正在写入该槽位，下次刷新再取
+                break
+            if seq == n + 1:
+                records.append((timestamp, event, pin, value))
+            elif seq > n + 1:
+                # 该槽位已被后面一圈的事件覆盖
+                self.dropped += 1
+            else:
+                break
+            n += 1
+        self._flushed = n
+        return records
+
+
+def main():
+    """把二进制追踪文件渲染为可读日志"""
+    parser = argparse.ArgumentParser(description='渲染二进制事件追踪文件')
+    parser.add_argument('path', help='追踪文件路径')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"文件不存在: {args.path}")
+    for record in read_trace(args.path):
+        print(format_event(*record))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 测试robot.py中的超声波测距功能
 """
 
-from robot import ClimbingRobot
+from robot import ClimbingRobot, NoEcho
 import time
 
 def test_ultrasonic():
@@ -21,10 +21,10 @@ def test_ultrasonic():
             # 调用robot类中的超声波测量函数
             distance = robot.get_current_height()
             
-            if distance > 0:
+            if not isinstance(distance, NoEcho):
                 print(f"检测距离: {distance} cm")
             else:
-                print("测量失败或超出范围")
+                print(f"测量失败或超出范围: {distance.reason}")
             
             time.sleep(0.5)  # 每0.5秒测量一次
             
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+安全看门狗 - 独立的轻量进程，通过管道接收控制进程的心跳
+控制线程卡住（测距循环、阻塞的日志写入、异常处理路径）时心跳超时，控制进程崩溃时管道断开；
+两种情况都立即一次写入断开全部继电器，结束卡住的控制进程以免它恢复后再次通电，再让舵机回到中性位置并保持，
+直到看门狗被 Ctrl+C 或 kill 结束
+
+心跳协议: 每个心跳是一行 ASCII 文本，内容为到下一个心跳的最长间隔（毫秒）；
+控制进程进入已知时长的等待（如 20 秒的脉冲）前发送更长的间隔；"stop" 表示正常结束，看门狗退出且不动引脚
+
+控制进程用 ClimbingRobot.start_watchdog() 启动看门狗，up.py / down.py 默认启用（--watchdog-ms 0 关闭）
+"""
+
+import os
+import sys
+import time
+import select
+import signal
+import logging
+import argparse
+import subprocess
+
+from gpio_backend import create_backend
+from realtime import leave_control_cpu
+
+logger = logging.getLogger(__name__)
+
+
+class Heartbeat:
+    """控制进程一侧 - 启动看门狗进程，通过它的标准输入发送心跳"""
+
+    def __init__(self, timeout_ms, relay_pins, servo_pins=(), servo_frequency=50, servo_duty=7.5,
+                 controller_pid=None, backend=None, report=False):
+        """
+        启动看门狗进程
+        :param timeout_ms: 心跳超时（毫秒），每个心跳在声明的等待时间之外再允许这么久
+        :param relay_pins: 跳闸时写为低电平的继电器引脚
+        :param servo_pins: 跳闸时回到中性位置的舵机引脚
+        :param servo_frequency: 舵机PWM频率 (Hz)
+        :param servo_duty: 舵机中性位置占空比
+        :param controller_pid: 跳闸时结束的控制进程，默认为当前进程，0 表示不结束
+        :param backend: GPIO后端名称，默认读取环境变量 ROBOT_GPIO_BACKEND
+        :param report: 跳闸时在标准输出写一行记录（见 Watchdog.trip），用于测量反应延迟
+        """
+        self.timeout = timeout_ms / 1000.0
+        if controller_pid is None:
+            controller_pid = os.getpid()
+
+        args = [sys.executable, os.path.abspath(__file__), '--timeout-ms', str(timeout_ms),
+                '--pins', *map(str, relay_pins), '--pid', str(controller_pid),
+                '--servo-frequency', str(servo_frequency), '--servo-duty', str(servo_duty)]
+        if servo_pins:
+            args += ['--servo-pins', *map(str, servo_pins)]
+        if backend:
+            args += ['--backend', backend]
+        if report:
+            args.append('--report')
+
+        # 独立会话: 终端的 Ctrl+C 只中断控制进程，看门狗在控制进程关机期间继续监视
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, start_new_session=True)
+        self._fd = self.process.stdin.fileno()
+        # 看门狗读得慢时心跳直接丢弃，不能阻塞控制线程
+        os.set_blocking(self._fd, False)
+        logger.info(f"看门狗进程已启动 (pid {self.process.pid})，心跳超时 {timeout_ms}ms")
+
+    def beat(self, expect=0.0):
+        """
+        发送心跳
+        :param expect: 接下来要等待的时间（秒），下一个心跳最迟在 expect 加上心跳超时之后到达
+        """
+        self._send(f"{round((max(expect, 0.0) + self.timeout) * 1000)}\n")
+
+    def close(self):
+        """正常结束 - 看门狗退出且不动引脚"""
+        if self.process is None:
+            return
+        self._send("stop\n")
+        if self.process is not None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=1.0)
+            except subprocess.TimeoutExpired:
+                logger.warning("看门狗进程没有按时退出")
+        self.process = None
+
+    def _send(self, line):
+        if self.process is None:
+            return
+        try:
+            os.write(self._fd, line.encode())
+        except BlockingIOError:
+            pass
+        except BrokenPipeError:
+            logger.error(f"看门狗进程已退出 (返回码 {self.process.poll()})，不再发送心跳")
+            self.process = None
+
+
+class Watchdog:
+    """看门狗进程一侧 - 监视心跳，超时或管道断开时跳闸"""
+
+    def __init__(self, gpio, relay_pins, servo_pins=(), servo_frequency=50, servo_duty=7.5, controller_pid=0):
+        """
+        :param gpio: GPIO后端
+        :param relay_pins: 继电器引脚
+        :param servo_pins: 舵机引脚
+        :param servo_frequency: 舵机PWM频率 (Hz)
+        :param servo_duty: 舵机中性位置占空比
+        :param controller_pid: 跳闸时结束的控制进程，0 表示不结束
+        """
+        self.gpio = gpio
+        self.relay_pins = list(relay_pins)
+        self.servo_pins = list(servo_pins)
+        self.servo_frequency = servo_frequency
+        self.servo_duty = servo_duty
+        self.controller_pid = controller_pid
+        self.servos = []  # 跳闸后保持中性位置的PWM
+
+    def watch(self, fd, timeout):
+        """
+        监视心跳直到跳闸或收到 stop
+        :param fd: 心跳管道的读端
+        :param timeout: 第一个心跳之前的超时（秒）
+        :return: 跳闸原因，正常结束时为 None
+        """
+        deadline = time.monotonic() + timeout
+        buffer = b''
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "心跳超时"
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                continue
+            data = os.read(fd, 4096)
+            if not data:
+                return "控制进程断开"
+
+            *lines, buffer = (buffer + data).split(b'\n')
+            for line in lines:
+                if line == b'stop':
+                    return None
+                try:
+                    deadline = time.monotonic() + int(line) / 1000.0
+                except ValueError:
+                    logger.warning(f"忽略无法解析的心跳: {line!r}")
+
+    def trip(self, reason):
+        """
+        跳闸 - 先断开继电器，再结束控制进程并重复一次断开（防止它在被结束前又写了引脚），最后舵机回中
+        :param reason: 跳闸原因
+        :return: 继电器写为低电平的时刻 (time.monotonic_ns)
+        """
+        self.gpio.setup(self.relay_pins, self.gpio.OUT)
+        self.gpio.output(self.relay_pins, self.gpio.LOW)
+        relays_off = time.monotonic_ns()
+        logger.error(f"看门狗跳闸: {reason}，已断开全部继电器")
+
+        if self.controller_pid:
+            try:
+                os.kill(self.controller_pid, signal.SIGKILL)
+                logger.error(f"已结束控制进程 {self.controller_pid}")
+            except ProcessLookupError:
+                pass
+            self.gpio.output(self.relay_pins, self.gpio.LOW)
+
+        for pin in self.servo_pins:
+            self.gpio.setup(pin, self.gpio.OUT)
+            servo = self.gpio.PWM(pin, self.servo_frequency)
+            servo.start(self.servo_duty)
+            self.servos.append(servo)
+        return relays_off
+
+    def relays_off(self):
+        """全部继电器引脚是否都为低电平"""
+        return all(self.gpio.input(pin) == self.gpio.LOW for pin in self.relay_pins)
+
+    def shutdown(self):
+        """停止舵机PWM并清理GPIO"""
+        for servo in self.servos:
+            servo.stop()
+        self.gpio.cleanup()
+
+
+def main():
+    """看门狗进程入口，由 Heartbeat 启动"""
+    parser = argparse.ArgumentParser(description='安全看门狗')
+    parser.add_argument('--timeout-ms', type=int, required=True, help='心跳超时（毫秒）')
+    parser.add_argument('--pins', type=int, nargs='+', required=True, help='继电器引脚')
+    parser.add_argument('--servo-pins', type=int, nargs='*', default=[], help='舵机引脚')
+    parser.add_argument('--servo-frequency', type=float, default=50, help='舵机PWM频率 (Hz)')
+    parser.add_argument('--servo-duty', type=float, default=7.5, help='舵机中性位置占空比')
+    parser.add_argument('--pid', type=int, default=0, help='跳闸时结束的控制进程，0 表示不结束')
+    parser.add_argument('--backend', help='GPIO后端 (rpi/sim)，默认读取环境变量 ROBOT_GPIO_BACKEND')
+    parser.add_argument('--report', action='store_true',
+                        help='跳闸时在标准输出写一行 "trip <pid> <继电器断开时刻ns> <继电器全部为低 0/1>"')
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - watchdog - %(levelname)s - %(message)s')
+    # 实时模式下从控制进程继承了它独占的CPU，留在那里就无法在控制线程忙等卡住时抢到CPU
+    leave_control_cpu()
+    # 跳闸后保持引脚状态直到被结束，SIGTERM 也走正常清理
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    gpio = create_backend(args.backend)
+    gpio.setmode(gpio.BCM)
+    gpio.setwarnings(False)
+    watchdog = Watchdog(gpio, args.pins, args.servo_pins, args.servo_frequency, args.servo_duty, args.pid)
+
+    reason = watchdog.watch(sys.stdin.fileno(), args.timeout_ms / 1000.0)
+    if reason is None:
+        return
+
+    try:
+        relays_off = watchdog.trip(reason)
+        if args.report:
+            print(f"trip {os.getpid()} {relays_off} {int(watchdog.relays_off())}", flush=True)
+        while True:
+            signal.pause()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watchdog.shutdown()
+
+
+if __name__ == "__main__":
+    main()
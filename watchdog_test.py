@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+测试看门狗 - 启动一个带看门狗的控制进程，让它发送一段时间心跳后卡住或崩溃，
+测量从心跳截止（或进程退出）到看门狗断开全部继电器的用时，并检查卡住的控制进程被结束、正常关闭时不误跳闸
+
+默认使用仿真后端；--hardware 在树莓派上测量（会真实写引脚，机器人不能在柱子上）
+    python3 watchdog_test.py
+    python3 watchdog_test.py -n 20 --timeout-ms 200 --max-latency 10
+"""
+
+import os
+import sys
+import time
+import random
+import select
+import signal
+import logging
+import argparse
+import subprocess
+
+# 配置日志
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+SCENARIOS = ['hang', 'long_wait', 'crash', 'close']
+
+
+def run_controller(scenario, timeout_ms, beats, interval, expect):
+    """
+    控制进程（由测试以 --controller 启动）: 启动看门狗，按随机间隔发送心跳，然后按场景卡住、崩溃或正常关闭
+    每个心跳和退出时刻写到标准输出，看门狗跳闸记录也写到同一个管道
+    """
+    from robot import ClimbingRobot
+
+    logging.getLogger().setLevel(logging.WARNING)
+    robot = ClimbingRobot(calibration_file='', state_file='', state_block='')
+    robot.start_watchdog(timeout_ms, report=True)
+
+    for i in range(beats):
+        robot.heartbeat(expect if scenario == 'long_wait' and i == beats - 1 else 0.0)
+        print(f"beat {time.monotonic_ns()}", flush=True)
+        if i < beats - 1:
+            time.sleep(interval * random.uniform(0.5, 1.5))
+
+    if scenario == 'crash':
+        print(f"exit {time.monotonic_ns()}", flush=True)
+        os._exit(1)
+    if scenario == 'close':
+        robot.power_off()
+        return
+    # 卡住: 不再发送心跳，也不会自己退出
+    while True:
+        time.sleep(3600)
+
+
+def read_lines(stream, deadline):
+    """读取输出行，直到管道关闭或超过 deadline（time.monotonic）"""
+    buffer = b''
+    fd = stream.fileno()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if not readable:
+            return
+        data = os.read(fd, 4096)
+        if not data:
+            return
+        *lines, buffer = (buffer + data).split(b'\n')
+        for line in lines:
+            yield line.decode().split()
+
+
+def run_once(scenario, timeout_ms, beats, interval, expect, env):
+    """
+    运行一次场景
+    :return: (跳闸延迟毫秒或 None, 问题列表)
+    """
+    args = [sys.executable, os.path.abspath(__file__), '--controller', scenario, '--timeout-ms', str(timeout_ms),
+            '--beats', str(beats), '--interval', str(interval), '--expect', str(expect)]
+    child = subprocess.Popen(args, stdout=subprocess.PIPE, env=env)
+    problems = []
+    last_beat = exited = trip = None
+
+    # 启动、心跳和跳闸都应该在这个时间内完成
+    deadline = time.monotonic() + 10.0 + beats * interval * 1.5 + expect + timeout_ms / 1000.0
+    for fields in read_lines(child.stdout, deadline):
+        if fields[0] == 'beat':
+            last_beat = int(fields[1])
+        elif fields[0] == 'exit':
+            exited = int(fields[1])
+        elif fields[0] == 'trip':
+            trip = fields
+            break
+
+    latency = None
+    if scenario == 'close':
+        if trip is not None:
+            problems.append("正常关闭时看门狗跳闸")
+    elif trip is None:
+        problems.append("看门狗没有跳闸")
+    else:
+        watchdog_pid, relays_off, all_low = int(trip[1]), int(trip[2]), trip[3] == '1'
+        if scenario == 'crash':
+            reference = exited
+        else:
+            reference = last_beat + int(((expect if scenario == 'long_wait' else 0.0) * 1000 + timeout_ms) * 1e6)
+        latency = (relays_off - reference) / 1e6
+        if latency < 0:
+            problems.append(f"看门狗提前 {-latency:.3f}ms 跳闸")
+        if not all_low:
+            problems.append("跳闸后仍有继电器引脚为高电平")
+        # 跳闸后看门狗保持引脚状态，测试结束它
+        try:
+            os.kill(watchdog_pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+    try:
+        returncode = child.wait(timeout=5.0)
+    except subprocess.TimeoutExpired:
+        child.kill()
+        returncode = child.wait()
+        problems.append("控制进程没有结束")
+    if scenario in ('hang', 'long_wait') and returncode != -signal.SIGKILL:
+        problems.append(f"卡住的控制进程没有被看门狗结束 (返回码 {returncode})")
+    child.stdout.close()
+    return latency, problems
+
+
+def test_watchdog(scenarios, repeats, timeout_ms, beats, interval, expect, hardware=False):
+    """
+    逐个场景测量看门狗反应延迟
+    :return: [(场景, 延迟毫秒列表, 问题列表)]
+    """
+    env = dict(os.environ, ROBOT_CLOCK='real', ROBOT_ACTUATOR_STATE='none')
+    env.pop('ROBOT_ARCHIVE_DIR', None)
+    if not hardware:
+        env['ROBOT_GPIO_BACKEND'] = 'sim'
+
+    results = []
+    for scenario in scenarios:
+        latencies = []
+        problems = []
+        for i in range(repeats):
+            latency, run_problems = run_once(scenario, timeout_ms, beats, interval, expect, env)
+            if latency is not None:
+                latencies.append(latency)
+            problems += [f"第{i + 1}次: {problem}" for problem in run_problems]
+        results.append((scenario, latencies, problems))
+        if latencies:
+            print(f"{scenario:<10}反应延迟 最大 {max(latencies):7.3f}ms  平均 {sum(latencies) / len(latencies):7.3f}ms"
+                  f"  ({repeats}次)")
+        else:
+            print(f"{scenario:<10}{'未跳闸' if not problems else '失败'}  ({repeats}次)")
+    return results
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='看门狗测试程序')
+    parser.add_argument('-s', '--scenario', choices=SCENARIOS, action='append',
+                        help='hang 卡住 / long_wait 声明长等待后卡住 / crash 崩溃 / close 正常关闭，可重复，默认全部')
+    parser.add_argument('-n', '--repeats', type=int, default=5, help='每个场景重复次数')
+    parser.add_argument('--timeout-ms', type=int, default=200, help='看门狗心跳超时（毫秒）')
+    parser.add_argument('--beats', type=int, default=20, help='卡住前发送的心跳数')
+    parser.add_argument('--interval', type=float, default=0.05, help='平均心跳间隔（秒）')
+    parser.add_argument('--expect', type=float, default=0.3, help='long_wait 场景最后一个心跳声明的等待时间（秒）')
+    parser.add_argument('--max-latency', type=float, default=20.0, help='反应延迟上限（毫秒）')
+    parser.add_argument('--hardware', action='store_true', help='使用树莓派GPIO（会真实写引脚）')
+    parser.add_argument('--controller', choices=SCENARIOS, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.controller:
+        run_controller(args.controller, args.timeout_ms, args.beats, args.interval, args.expect)
+        return
+
+    print("看门狗测试程序")
+    print("控制进程发送心跳后卡住或崩溃，测量看门狗断开全部继电器的反应延迟")
+    print("")
+
+    results = test_watchdog(args.scenario or SCENARIOS, args.repeats, args.timeout_ms, args.beats, args.interval,
+                            args.expect, args.hardware)
+
+    failures = []
+    for scenario, latencies, problems in results:
+        failures += [f"{scenario}: {problem}" for problem in problems]
+        if latencies and max(latencies) > args.max_latency:
+            failures.append(f"{scenario}: 反应延迟 {max(latencies):.3f}ms 超过 {args.max_latency}ms")
+
+    print("")
+    if failures:
+        for failure in failures:
+            print(f"失败 {failure}")
+        sys.exit(1)
+    print("通过: 看门狗在上限以内跳闸，正常关闭时不跳闸")
+
+
+if __name__ == "__main__":
+    main()